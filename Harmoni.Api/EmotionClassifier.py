@@ -1,4 +1,7 @@
+import numpy as np
+import torch
 from torch import nn
+from torch.nn import functional as F
 
 
 class EmotionClassifier(nn.Module):
@@ -17,10 +20,65 @@ class EmotionClassifier(nn.Module):
         self.fc3 = nn.Linear(128, num_classes)
         # ReLU activation function
         self.relu = nn.ReLU()
+        # Contiguous copy of the fc1 weight columns used by forward_sparse, rebuilt when fc1 changes
+        self._fc1_columns = None
+        self._fc1_columns_key = None
 
     def forward(self, x):
         # Apply ReLU activation to the output of the first fully connected layer
         x = self.relu(self.fc1(x))
+        return self._forward_hidden(x)
+
+    def forward_sparse(self, features):
+        """
+        Runs the forward pass on a scipy sparse matrix (e.g. TF-IDF features) without densifying it.
+
+        The first layer is computed as a gather-sum of the fc1 weight columns of the non-zero
+        features, weighted by their values (an embedding bag). Its cost scales with the number of
+        non-zeros instead of input_size, and it produces the same logits as forward. Gradients flow
+        into fc1 like with forward, so it can be trained on sparse batches too.
+
+        Args:
+            features (scipy.sparse matrix): The input features, one row per sample.
+
+        Returns:
+            torch.Tensor: The output logits, one row per sample.
+        """
+        features = features.tocsr()
+        indices = torch.from_numpy(features.indices.astype(np.int64))
+        offsets = torch.from_numpy(features.indptr[:-1].astype(np.int64))
+        values = torch.from_numpy(features.data.astype(np.float32))
+        # Each row sums the fc1 columns of its non-zero features; empty rows get zeros, just like a zero vector
+        x = F.embedding_bag(indices, self._get_fc1_columns(), offsets, mode='sum',
+                            per_sample_weights=values) + self.fc1.bias
+        # Apply ReLU activation to the output of the first fully connected layer
+        x = self.relu(x)
+        return self._forward_hidden(x)
+
+    def set_fc1_columns(self, fc1_columns):
+        """
+        Provides the contiguous transpose of the fc1 weight used by forward_sparse, e.g. memory-mapped
+        from a model artifact, so that worker processes share it instead of each building a copy.
+
+        Args:
+            fc1_columns (torch.Tensor): The (input_size, 256) transpose of fc1.weight.
+        """
+        self._fc1_columns = fc1_columns
+        self._fc1_columns_key = (self.fc1.weight.data_ptr(), self.fc1.weight._version)
+
+    def _get_fc1_columns(self):
+        # fc1.weight is (256, input_size); the embedding bag needs one row per input feature
+        weight = self.fc1.weight
+        if torch.is_grad_enabled() and weight.requires_grad:
+            # The transposed view keeps the autograd graph to fc1.weight; the cached copy is for inference only
+            return weight.t()
+        key = (weight.data_ptr(), weight._version)
+        if self._fc1_columns_key != key:
+            self._fc1_columns = weight.t().contiguous()
+            self._fc1_columns_key = key
+        return self._fc1_columns
+
+    def _forward_hidden(self, x):
         # Apply dropout
         x = self.dropout1(x)
         # Apply ReLU activation to the output of the second fully connected layer
@@ -0,0 +1,52 @@
+import numpy as np  # For building the test inputs
+import torch  # PyTorch library for tensor computations and neural networks
+from scipy import sparse  # For building sparse TF-IDF-like inputs
+
+from EmotionClassifier import EmotionClassifier  # Import the emotion classifier model
+
+
+def test_forward_sparse_matches_forward():
+    """
+    Tests that forward_sparse returns the same logits as forward on the densified input,
+    including for rows without any non-zero feature.
+    """
+    torch.manual_seed(0)
+    model = EmotionClassifier(50, 6).eval()  # Evaluation mode so dropout is disabled
+    # Build a sparse float64 input like the TF-IDF vectorizer output, with an empty middle row
+    features = sparse.random(3, 50, density=0.1, format='csr', random_state=0, dtype=np.float64)
+    features = sparse.vstack([features[0], sparse.csr_matrix((1, 50)), features[2]]).tocsr()
+
+    with torch.no_grad():
+        dense_logits = model(torch.FloatTensor(features.toarray()))
+        sparse_logits = model.forward_sparse(features)
+
+    assert torch.allclose(dense_logits, sparse_logits, atol=1e-6)
+
+
+def test_forward_sparse_follows_weight_updates():
+    """
+    Tests that forward_sparse uses the current fc1 weights after they are modified.
+    """
+    model = EmotionClassifier(10, 6).eval()
+    features = sparse.csr_matrix(np.eye(2, 10))
+    with torch.no_grad():
+        model.forward_sparse(features)  # Build the cached weight columns
+        model.fc1.weight.add_(1.0)  # Modify the weights in place
+        assert torch.allclose(model(torch.FloatTensor(features.toarray())), model.forward_sparse(features), atol=1e-6)
+
+
+def test_forward_sparse_propagates_gradients_to_fc1():
+    """
+    Tests that training through forward_sparse gives fc1 the same gradients as forward on the densified input.
+    """
+    torch.manual_seed(0)
+    model = EmotionClassifier(20, 6).eval()  # Evaluation mode so dropout doesn't differ between the passes
+    features = sparse.random(4, 20, density=0.2, format='csr', random_state=0, dtype=np.float64)
+    labels = torch.tensor([0, 1, 2, 3])
+
+    torch.nn.functional.cross_entropy(model.forward_sparse(features), labels).backward()
+    sparse_gradient = model.fc1.weight.grad.clone()
+    model.zero_grad()
+    torch.nn.functional.cross_entropy(model(torch.FloatTensor(features.toarray())), labels).backward()
+
+    assert torch.allclose(sparse_gradient, model.fc1.weight.grad, atol=1e-6)  # Assert that fc1 is trained the same
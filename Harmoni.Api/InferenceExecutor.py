@@ -0,0 +1,84 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class InferenceExecutor:
+    """
+    Runs CPU-bound inference calls without blocking the event loop.
+
+    Three backends are supported:
+        - "inline": the call runs directly on the event loop (the original behaviour).
+        - "thread": the call runs in a thread pool. Torch and sklearn release the GIL in
+          parts of their work, so several batches can make progress at once.
+        - "process": the call runs in a process pool. Functions and arguments must be
+          picklable; the functions are imported by reference, so a module that loads the
+          model at import time loads it exactly once per worker process.
+    """
+
+    backends = ("inline", "thread", "process")
+
+    def __init__(self, backend="thread", max_workers=None, initializer=None, initargs=()):
+        """
+        Args:
+            backend (str): One of "inline", "thread" or "process".
+            max_workers (int): The number of pool workers. Defaults to the number of CPUs.
+            initializer (callable): Function run once in every process pool worker.
+            initargs (tuple): Arguments passed to the initializer.
+        """
+        if backend not in self.backends:
+            raise ValueError(f"Unknown inference backend '{backend}', expected one of {', '.join(self.backends)}")
+        self.backend = backend
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.initializer = initializer
+        self.initargs = initargs
+        self._pool = None
+
+    @property
+    def concurrency(self):
+        """
+        Returns how many calls can usefully run at the same time.
+        """
+        return 1 if self.backend == "inline" else self.max_workers
+
+    async def run(self, fn, *args):
+        """
+        Runs `fn(*args)` on the configured backend and waits for its result.
+        """
+        if self.backend == "inline":
+            return fn(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_pool(), functools.partial(fn, *args))
+
+    def shutdown(self):
+        """
+        Shuts the worker pool down. It will be recreated on the next call.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def restart(self):
+        """
+        Replaces the worker pool without waiting: calls already submitted finish in the old pool,
+        whose workers then exit, and the next calls start a new pool. With the process backend,
+        the new workers load the model on disk at that time.
+        """
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def _get_pool(self):
+        # Create the pool lazily so importing the API doesn't spawn workers
+        if self._pool is None:
+            if self.backend == "thread":
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix="inference")
+            else:
+                # Use spawn rather than fork, forking a process that already runs torch threads can deadlock
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=self.initializer, initargs=self.initargs)
+        return self._pool
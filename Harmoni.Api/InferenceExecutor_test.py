@@ -0,0 +1,45 @@
+import asyncio  # For running the executor's coroutines in the tests
+import threading  # For checking which thread a call ran on
+
+import pytest  # Python testing framework
+
+from InferenceExecutor import InferenceExecutor  # Import the inference execution backends
+
+
+def test_thread_backend_runs_off_the_event_loop_thread():
+    """
+    Tests that the thread backend runs calls outside the thread running the event loop.
+    """
+    executor = InferenceExecutor("thread", max_workers=2)
+
+    async def run_call():
+        return await executor.run(threading.get_ident)
+
+    try:
+        assert asyncio.run(run_call()) != threading.get_ident()
+    finally:
+        executor.shutdown()
+
+
+@pytest.mark.parametrize("backend", ["inline", "thread", "process"])
+def test_backends_return_the_call_result(backend):
+    """
+    Tests that every backend returns the result of the call.
+    """
+    executor = InferenceExecutor(backend, max_workers=1)
+
+    async def run_call():
+        return await executor.run(sum, [1, 2, 3])
+
+    try:
+        assert asyncio.run(run_call()) == 6
+    finally:
+        executor.shutdown()
+
+
+def test_unknown_backend_is_rejected():
+    """
+    Tests that an unknown backend name raises a ValueError.
+    """
+    with pytest.raises(ValueError):
+        InferenceExecutor("gpu")
@@ -0,0 +1,279 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Default latency buckets, in seconds, from 100 µs to 10 s
+default_latency_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                           2.5, 5.0, 10.0)
+
+
+def format_labels(label_names, label_values, extra=()):
+    """
+    Formats the labels of a sample in the Prometheus text format, e.g. `{stage="preprocess"}`.
+    """
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    """
+    Formats a sample value in the Prometheus text format.
+    """
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base class of the metrics, holding one value per combination of label values.
+    """
+
+    type_name = None
+
+    def __init__(self, name, documentation, label_names=()):
+        """
+        Args:
+            name (str): The metric name, e.g. 'harmoni_requests_total'.
+            documentation (str): The help text of the metric.
+            label_names (tuple[str]): The names of the labels every sample is given.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Metric {self.name} expects the labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        """
+        Returns the metric in the Prometheus text exposition format.
+        """
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        with self._lock:
+            samples = list(self._samples())
+        lines.extend(f'{name}{labels} {format_value(value)}' for name, labels, value in samples)
+        return '\n'.join(lines)
+
+    def _samples(self):
+        for label_values, value in sorted(self._values.items()):
+            yield self.name, format_labels(self.label_names, label_values), value
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count, such as the number of requests.
+    """
+
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """
+        Increases the count of the given label values.
+        """
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """
+        Returns the count of the given label values.
+        """
+        return self._values.get(self._label_values(labels), 0)
+
+
+class Gauge(Metric):
+    """
+    Value that can go up and down, either set explicitly or read from a function when rendered.
+    """
+
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, label_names=(), function=None):
+        """
+        Args:
+            function (callable): Function returning the current value, for gauges without labels.
+        """
+        super().__init__(name, documentation, label_names)
+        self.function = function
+
+    def set(self, value, **labels):
+        """
+        Sets the value of the given label values.
+        """
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self.function is not None:
+            yield self.name, '', self.function()
+        else:
+            yield from super()._samples()
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, such as latencies, counted in cumulative buckets.
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=default_latency_buckets):
+        """
+        Args:
+            buckets (tuple[float]): The upper bounds of the buckets, in increasing order. +Inf is added.
+        """
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """
+        Records an observed value for the given label values.
+        """
+        key = self._label_values(labels)
+        # Index of the first bucket whose bound is at least the value, len(buckets) being +Inf
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            counts['buckets'][bucket_index] += 1
+            counts['sum'] += value
+            counts['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observes the duration of the block in seconds.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self, **labels):
+        """
+        Returns the count and sum of the values observed for the given label values.
+        """
+        counts = self._values.get(self._label_values(labels))
+        return {'count': counts['count'], 'sum': counts['sum']} if counts else {'count': 0, 'sum': 0.0}
+
+    def _samples(self):
+        for label_values, counts in sorted(self._values.items()):
+            cumulative_count = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts['buckets']):
+                cumulative_count += bucket_count
+                yield (f'{self.name}_bucket',
+                       format_labels(self.label_names, label_values, [('le', format_value(float(bound)))]),
+                       cumulative_count)
+            yield f'{self.name}_sum', format_labels(self.label_names, label_values), counts['sum']
+            yield f'{self.name}_count', format_labels(self.label_names, label_values), counts['count']
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics exposed together in the Prometheus text format, e.g. on a /metrics endpoint.
+
+    Metrics live in the process that records them: with a process pool, the metrics recorded in
+    the workers aren't part of the registry of the main process.
+    """
+
+    # Content type of the Prometheus text exposition format
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name, documentation, label_names=()):
+        """
+        Creates and registers a counter.
+        """
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=(), function=None):
+        """
+        Creates and registers a gauge.
+        """
+        return self._register(Gauge(name, documentation, label_names, function))
+
+    def histogram(self, name, documentation, label_names=(), buckets=default_latency_buckets):
+        """
+        Creates and registers a histogram.
+        """
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware counting the HTTP requests, their errors and their latency per route.
+
+    Paths that aren't routes of the app are counted as "other", so that random paths don't
+    create a new label value each.
+    """
+
+    def __init__(self, app, requests_counter, errors_counter, latency_histogram, paths):
+        """
+        Args:
+            app: The ASGI application.
+            requests_counter (Counter): Counter with 'path' and 'status' labels.
+            errors_counter (Counter): Counter with a 'path' label, for server errors and exceptions.
+            latency_histogram (Histogram): Histogram with a 'path' label.
+            paths (callable): Function returning the set of paths of the app's routes, called on the first request.
+        """
+        self.app = app
+        self.requests_counter = requests_counter
+        self.errors_counter = errors_counter
+        self.latency_histogram = latency_histogram
+        self.paths = paths
+        self._known_paths = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        if self._known_paths is None:
+            # Every route is registered by the time the first request comes in
+            self._known_paths = frozenset(self.paths())
+        path = scope['path'] if scope['path'] in self._known_paths else 'other'
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            self.latency_histogram.observe(time.perf_counter() - started, path=path)
+            self.requests_counter.inc(path=path, status=status)
+            if status >= 500:
+                self.errors_counter.inc(path=path)
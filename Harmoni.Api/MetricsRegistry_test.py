@@ -0,0 +1,77 @@
+import asyncio  # To run the ASGI middleware without a server
+
+import pytest  # Testing framework
+
+from MetricsRegistry import MetricsRegistry, RequestMetricsMiddleware  # Classes under test
+
+
+def test_render_prometheus_text_format():
+    """
+    Tests that counters, gauges and histograms are rendered in the Prometheus text format,
+    with cumulative histogram buckets.
+    """
+    registry = MetricsRegistry()
+    counter = registry.counter('test_predictions_total', 'Predictions.', ('emotion',))
+    registry.gauge('test_queue_depth', 'Queue depth.', function=lambda: 3)
+    histogram = registry.histogram('test_duration_seconds', 'Durations.', ('stage',), buckets=(0.1, 1.0))
+    counter.inc(emotion='joy')
+    counter.inc(2, emotion='joy')
+    histogram.observe(0.05, stage='infer')
+    histogram.observe(0.5, stage='infer')
+    histogram.observe(5.0, stage='infer')
+
+    lines = registry.render().splitlines()
+
+    assert '# TYPE test_predictions_total counter' in lines
+    assert 'test_predictions_total{emotion="joy"} 3' in lines  # Increments add up
+    assert 'test_queue_depth 3' in lines  # Gauge read from its function
+    # Buckets count every value up to their bound, +Inf counts them all
+    assert 'test_duration_seconds_bucket{stage="infer",le="0.1"} 1' in lines
+    assert 'test_duration_seconds_bucket{stage="infer",le="1.0"} 2' in lines
+    assert 'test_duration_seconds_bucket{stage="infer",le="+Inf"} 3' in lines
+    assert 'test_duration_seconds_count{stage="infer"} 3' in lines
+    assert histogram.snapshot(stage='infer')['sum'] == pytest.approx(5.55)
+
+
+def test_wrong_labels_and_duplicate_names_raise():
+    """
+    Tests that recording a sample with the wrong labels, or registering a name twice, is rejected.
+    """
+    registry = MetricsRegistry()
+    counter = registry.counter('test_requests_total', 'Requests.', ('path',))
+    with pytest.raises(ValueError):
+        counter.inc(status=200)
+    with pytest.raises(ValueError):
+        registry.counter('test_requests_total', 'Requests again.')
+
+
+def test_middleware_counts_requests_and_errors():
+    """
+    Tests that the middleware counts requests by path and status code, server errors included,
+    and groups unknown paths under "other".
+    """
+    registry = MetricsRegistry()
+    requests_counter = registry.counter('test_requests_total', 'Requests.', ('path', 'status'))
+    errors_counter = registry.counter('test_errors_total', 'Errors.', ('path',))
+    latency_histogram = registry.histogram('test_latency_seconds', 'Latency.', ('path',))
+
+    async def app(scope, receive, send):
+        if scope['path'] == '/fail':
+            raise RuntimeError("boom")
+        await send({'type': 'http.response.start', 'status': 200 if scope['path'] == '/ok' else 404})
+
+    async def send(message):
+        pass
+
+    middleware = RequestMetricsMiddleware(app, requests_counter, errors_counter, latency_histogram,
+                                          paths=lambda: {'/ok', '/fail'})
+    asyncio.run(middleware({'type': 'http', 'path': '/ok'}, None, send))
+    asyncio.run(middleware({'type': 'http', 'path': '/unknown/123'}, None, send))
+    with pytest.raises(RuntimeError):
+        asyncio.run(middleware({'type': 'http', 'path': '/fail'}, None, send))
+
+    assert requests_counter.value(path='/ok', status=200) == 1
+    assert requests_counter.value(path='other', status=404) == 1  # Unknown paths share one label value
+    assert requests_counter.value(path='/fail', status=500) == 1  # Exceptions count as server errors
+    assert errors_counter.value(path='/fail') == 1
+    assert latency_histogram.snapshot(path='/ok')['count'] == 1
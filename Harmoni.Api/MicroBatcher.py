@@ -0,0 +1,143 @@
+import asyncio
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-text predictions into batches.
+
+    Callers submit one text at a time and await the result. A background task collects the
+    queued texts until either `max_batch_size` items are waiting or `max_wait_ms` milliseconds
+    have passed since the first one arrived, then runs `predict_fn` once for the whole batch
+    and resolves every caller's future with its own result.
+
+    When an executor is given, batches are dispatched to it so the event loop stays free, and up
+    to `executor.concurrency` batches run at the same time. Texts keep queuing while every worker
+    is busy, so batches naturally grow under load.
+    """
+
+    def __init__(self, predict_fn, max_wait_ms=2.0, max_batch_size=64, executor=None):
+        """
+        Args:
+            predict_fn (callable): Function mapping a list of texts to a list of results, in order.
+            max_wait_ms (float): How long to wait for more texts after the first one of a batch arrives.
+            max_batch_size (int): The maximum number of texts predicted together.
+            executor (InferenceExecutor): Where to run `predict_fn`. Defaults to running it inline.
+        """
+        self.predict_fn = predict_fn
+        self.max_wait_ms = max_wait_ms
+        self.max_batch_size = max_batch_size
+        self.executor = executor
+        self._queue = None
+        self._worker = None
+        self._loop = None
+        self._batch_slots = None
+        self._running_batches = set()
+        # Metrics about the batches run so far
+        self.batch_count = 0
+        self.item_count = 0
+        self.last_batch_size = 0
+        self.batch_size_counts = {}
+
+    @property
+    def queue_depth(self):
+        """
+        Returns the number of texts currently waiting to be batched.
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, text):
+        """
+        Queues a text for prediction and waits for its result.
+
+        Args:
+            text (str): The text to predict.
+
+        Returns:
+            The result `predict_fn` returned for this text.
+        """
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    def stats(self):
+        """
+        Returns a snapshot of the queue depth and batch size metrics.
+        """
+        return {
+            "queue_depth": self.queue_depth,
+            "batch_count": self.batch_count,
+            "item_count": self.item_count,
+            "last_batch_size": self.last_batch_size,
+            "average_batch_size": self.item_count / self.batch_count if self.batch_count else 0.0,
+            "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+            "max_wait_ms": self.max_wait_ms,
+            "max_batch_size": self.max_batch_size,
+        }
+
+    def _ensure_worker(self):
+        # The queue and worker are bound to the running event loop, so start them lazily and
+        # restart them if the loop changed (e.g. a new loop per test client request)
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._batch_slots = asyncio.Semaphore(self.executor.concurrency if self.executor else 1)
+            self._running_batches = set()
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            # Wait until a worker is free to run another batch
+            await self._batch_slots.acquire()
+            # Wait for the first text of the next batch
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait_ms / 1000
+            # Collect more texts until the batch is full or the deadline has passed
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            task = self._loop.create_task(self._process(batch))
+            # Keep a reference to the task so it isn't garbage collected while running
+            self._running_batches.add(task)
+            task.add_done_callback(self._running_batches.discard)
+
+    async def _process(self, batch):
+        try:
+            await self._predict_batch(batch)
+        finally:
+            self._batch_slots.release()
+
+    async def _predict_batch(self, batch):
+        self.batch_count += 1
+        self.item_count += len(batch)
+        self.last_batch_size = len(batch)
+        self.batch_size_counts[len(batch)] = self.batch_size_counts.get(len(batch), 0) + 1
+
+        texts = [text for text, _ in batch]
+        try:
+            if self.executor is not None:
+                results = await self.executor.run(self.predict_fn, texts)
+            else:
+                results = self.predict_fn(texts)
+        except Exception as error:
+            # Fail every caller of the batch with the same error
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        for (_, future), result in zip(batch, results):
+            # The caller may have gone away (e.g. a cancelled request) while the batch was running
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,59 @@
+import asyncio  # For running the batcher's event loop in the tests
+
+import pytest  # Python testing framework
+
+from MicroBatcher import MicroBatcher  # Import the micro-batching scheduler
+
+
+def test_concurrent_submissions_are_coalesced():
+    """
+    Tests that texts submitted concurrently are predicted in a single batch
+    and that every caller receives its own result.
+    """
+    received_batches = []
+
+    def predict_lengths(texts):
+        received_batches.append(list(texts))
+        return [len(text) for text in texts]
+
+    batcher = MicroBatcher(predict_lengths, max_wait_ms=50, max_batch_size=8)
+
+    async def submit_all():
+        return await asyncio.gather(*(batcher.submit(text) for text in ["a", "bb", "ccc"]))
+
+    results = asyncio.run(submit_all())
+    assert results == [1, 2, 3]  # Assert that every caller got the result of its own text
+    assert received_batches == [["a", "bb", "ccc"]]  # Assert that a single batch was run
+    assert batcher.stats()["batch_size_counts"] == {3: 1}
+
+
+def test_batches_are_split_at_max_batch_size():
+    """
+    Tests that no batch exceeds the configured maximum size.
+    """
+    received_batches = []
+
+    def predict_lengths(texts):
+        received_batches.append(list(texts))
+        return [len(text) for text in texts]
+
+    batcher = MicroBatcher(predict_lengths, max_wait_ms=50, max_batch_size=2)
+
+    async def submit_all():
+        return await asyncio.gather(*(batcher.submit(text) for text in ["a", "bb", "ccc", "dddd", "eeeee"]))
+
+    assert asyncio.run(submit_all()) == [1, 2, 3, 4, 5]
+    assert [len(batch) for batch in received_batches] == [2, 2, 1]
+
+
+def test_prediction_errors_are_propagated_to_callers():
+    """
+    Tests that an error raised while predicting a batch is raised in every caller of that batch.
+    """
+    def failing_predict(texts):
+        raise RuntimeError("model failure")
+
+    batcher = MicroBatcher(failing_predict, max_wait_ms=1)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(batcher.submit("text"))
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger('harmoni.model_registry')
+
+
+class ModelRegistry:
+    """
+    Holds the model being served and swaps in new versions without downtime.
+
+    The served model is an immutable snapshot (a dict with at least a 'version') that callers read
+    once per batch from `current`. A reload loads the new version off the event loop, warms it up,
+    then replaces `current` with a single assignment: batches that already read the old snapshot
+    finish on it, the next ones use the new one, and no request waits for the load.
+
+    Reloads are triggered explicitly with `reload`, or by `watch`, which polls the version on disk
+    and reloads once a new version has been seen on two consecutive polls, so that a model still
+    being written isn't loaded. A failed reload keeps serving the previous version.
+    """
+
+    def __init__(self, load_fn, version_fn, warmup_fn=None, on_swap=None):
+        """
+        Args:
+            load_fn (callable): Function loading the model on disk and returning its snapshot.
+            version_fn (callable): Function returning the version of the model on disk without loading it,
+                or None when there is none.
+            warmup_fn (callable): Function called with a new snapshot before it is served, e.g. to run sample
+                predictions through it.
+            on_swap (callable): Function called with the new and the previous snapshots after a swap.
+        """
+        self.load_fn = load_fn
+        self.version_fn = version_fn
+        self.warmup_fn = warmup_fn
+        self.on_swap = on_swap
+        self.current = None
+        self.loaded_at = None
+        # Seconds taken by `load_fn` to load the snapshot being served, without its warmup
+        self.load_seconds = None
+        self.reload_count = 0
+        self.last_error = None
+        self._reloading = threading.Lock()
+        self._failed_version = None
+
+    def load(self, *args):
+        """
+        Loads the model on disk and serves it right away, without warming it up. Used at startup.
+
+        Args:
+            *args: Arguments of `load_fn`.
+
+        Returns:
+            dict: The snapshot of the model.
+        """
+        started = time.perf_counter()
+        self.current = self.load_fn(*args)
+        self.load_seconds = time.perf_counter() - started
+        self.loaded_at = time.time()
+        return self.current
+
+    def reload(self, force=False):
+        """
+        Loads the model on disk, warms it up and swaps it in, unless it is the version already served.
+        Blocks until done; concurrent reloads wait for each other.
+
+        Args:
+            force (bool): Whether to reload even if the version on disk is the one served.
+
+        Returns:
+            bool: Whether a new snapshot was swapped in.
+
+        Raises:
+            Exception: Whatever the load or the warmup raised, the previous version is still served.
+        """
+        with self._reloading:
+            previous = self.current
+            if not force and previous is not None and self.version_fn() == previous['version']:
+                return False
+            started = time.perf_counter()
+            try:
+                snapshot = self.load_fn()
+                load_seconds = time.perf_counter() - started
+                if self.warmup_fn is not None:
+                    self.warmup_fn(snapshot)
+            except Exception as error:
+                self.last_error = f"{type(error).__name__}: {error}"
+                raise
+            # A single assignment: readers see either the previous snapshot or the new one
+            self.current = snapshot
+            self.loaded_at = time.time()
+            self.load_seconds = load_seconds
+            self.reload_count += 1
+            self.last_error = None
+            self._failed_version = None
+            logger.info('model reloaded', extra={'model_version': snapshot['version'],
+                                                 'previous_model_version': previous and previous['version'],
+                                                 'reload_seconds': time.perf_counter() - started})
+            if self.on_swap is not None:
+                self.on_swap(snapshot, previous)
+            return True
+
+    async def reload_async(self, force=False):
+        """
+        Runs `reload` in a thread, so that the event loop keeps serving requests meanwhile.
+        """
+        return await asyncio.to_thread(self.reload, force)
+
+    async def watch(self, interval_seconds):
+        """
+        Polls the version on disk every `interval_seconds` and reloads the model when it changes.
+        Runs until cancelled.
+        """
+        seen_version = None
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                version = await asyncio.to_thread(self.version_fn)
+            except OSError:
+                # The model is being replaced
+                version = None
+            stable = version is not None and version == seen_version
+            seen_version = version
+            if not stable or version == self.current['version'] or version == self._failed_version:
+                continue
+            try:
+                await self.reload_async()
+            except Exception:
+                # Don't retry the same version on every poll, only the next one written
+                self._failed_version = version
+                logger.exception('model reload failed', extra={'model_version': version})
+
+    def status(self):
+        """
+        Returns the version served, when and how fast it was loaded, the number of reloads and the last reload error.
+        """
+        return {
+            'model_version': self.current['version'] if self.current is not None else None,
+            'model_path': self.current.get('path') if self.current is not None else None,
+            'loaded_at': self.loaded_at,
+            'load_seconds': self.load_seconds,
+            'reloads': self.reload_count,
+            'last_error': self.last_error,
+        }
@@ -0,0 +1,86 @@
+import asyncio  # For running the watcher's event loop in the tests
+
+import pytest  # Python testing framework
+
+from ModelRegistry import ModelRegistry  # Import the model registry
+
+
+class FakeModelDirectory:
+    """
+    Model directory whose version changes when a new model is "saved", and whose loads can fail.
+    """
+
+    def __init__(self):
+        self.version = 'v1'
+        self.loads = 0
+        self.fail = False
+
+    def load(self):
+        self.loads += 1
+        if self.fail:
+            raise OSError("corrupted model")
+        return {'version': self.version, 'load': self.loads}
+
+
+def test_reload_swaps_the_new_version_after_warming_it_up():
+    """
+    Tests that a reload warms the new version up before serving it, while a snapshot taken before
+    the reload (an in-flight batch) keeps the previous version.
+    """
+    directory = FakeModelDirectory()
+    warmed_up = []
+    swaps = []
+    registry = ModelRegistry(directory.load, lambda: directory.version, warmup_fn=lambda model: warmed_up.append(
+        model['version']), on_swap=lambda model, previous: swaps.append((previous['version'], model['version'])))
+    in_flight = registry.load()
+
+    assert registry.reload() is False  # Same version on disk: nothing to do
+    directory.version = 'v2'
+    assert registry.reload() is True
+
+    assert in_flight['version'] == 'v1'  # The in-flight batch finishes on the previous version
+    assert registry.current['version'] == 'v2'
+    assert warmed_up == ['v2']  # Only the reloaded model is warmed up, before being served
+    assert swaps == [('v1', 'v2')]
+    assert registry.status()['reloads'] == 1
+    assert registry.status()['load_seconds'] is not None  # Assert that the load time of the swap is recorded
+
+
+def test_failed_reload_keeps_serving_the_previous_version():
+    """
+    Tests that a reload failing to load the new model keeps the previous one and reports the error.
+    """
+    directory = FakeModelDirectory()
+    registry = ModelRegistry(directory.load, lambda: directory.version)
+    registry.load()
+    directory.version, directory.fail = 'v2', True
+
+    with pytest.raises(OSError):
+        registry.reload()
+
+    assert registry.current['version'] == 'v1'
+    assert registry.status()['last_error'] == "OSError: corrupted model"
+
+
+def test_watch_reloads_once_the_new_version_is_stable():
+    """
+    Tests that the watcher reloads a new version once it has been seen on two polls in a row,
+    and doesn't retry a version that failed to load.
+    """
+    directory = FakeModelDirectory()
+    registry = ModelRegistry(directory.load, lambda: directory.version)
+    registry.load()
+
+    async def run():
+        watcher = asyncio.create_task(registry.watch(0.01))
+        directory.version = 'v2'
+        while registry.current['version'] != 'v2':
+            await asyncio.sleep(0.01)
+        directory.version, directory.fail = 'v3', True
+        await asyncio.sleep(0.1)
+        watcher.cancel()
+
+    asyncio.run(run())
+
+    assert registry.current['version'] == 'v2'  # The failed version isn't served
+    assert directory.loads == 3  # The initial load, v2, and a single attempt at v3
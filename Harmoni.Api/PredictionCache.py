@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheBackend:
+    """
+    Interface of the stores a PredictionCache can keep its entries in.
+
+    Keys are strings and values are JSON-serializable, so a backend can be pointed at a store
+    shared between processes. Backends must be safe to use from several threads.
+    """
+
+    def get(self, key):
+        """
+        Returns the value stored for `key`, or None if there is none (or it expired).
+        """
+        raise NotImplementedError
+
+    def set(self, key, value):
+        """
+        Stores `value` for `key`.
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        """
+        Returns backend-specific statistics, such as its size and eviction count.
+        """
+        return {}
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """
+    In-process cache backend with a bounded size, least-recently-used eviction and an optional TTL.
+    """
+
+    def __init__(self, max_size=10000, ttl_seconds=None, clock=time.monotonic):
+        """
+        Args:
+            max_size (int): The maximum number of entries kept. The least recently used entry is evicted beyond it.
+            ttl_seconds (float): How long an entry stays valid. None keeps entries until they are evicted.
+            clock (callable): Function returning the current time in seconds.
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and self.clock() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            # Mark the entry as the most recently used
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = self.clock() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            # Evict the least recently used entries beyond the maximum size
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class PredictionCache:
+    """
+    Caches predictions keyed on the preprocessed text and the version of the model that made them,
+    so a new model never serves the predictions of the previous one.
+    """
+
+    def __init__(self, backend):
+        """
+        Args:
+            backend (CacheBackend): The store holding the cached predictions.
+        """
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        # The lookups run in the request threads, so the counters are updated under a lock
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model_version, processed_text):
+        """
+        Builds the cache key of a preprocessed text predicted by a given model version.
+        """
+        return f"{model_version}\x00{processed_text}"
+
+    def get(self, model_version, processed_text):
+        """
+        Returns the cached prediction of a preprocessed text, or None on a miss.
+        """
+        value = self.backend.get(self.make_key(model_version, processed_text))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, model_version, processed_text, prediction):
+        """
+        Caches the prediction of a preprocessed text.
+        """
+        self.backend.set(self.make_key(model_version, processed_text), prediction)
+
+    def stats(self):
+        """
+        Returns the hit and miss counters along with the backend statistics.
+        """
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            **self.backend.stats(),
+        }
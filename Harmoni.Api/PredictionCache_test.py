@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor  # For concurrent lookups
+
+from PredictionCache import InMemoryCacheBackend, PredictionCache  # Import the prediction cache
+
+
+def test_least_recently_used_entry_is_evicted():
+    """
+    Tests that the least recently used entry is evicted once the cache is full.
+    """
+    cache = PredictionCache(InMemoryCacheBackend(max_size=2))
+    cache.set("v1", "happy", 1)
+    cache.set("v1", "sad", 0)
+    assert cache.get("v1", "happy") == 1  # Use "happy" so "sad" becomes the least recently used entry
+    cache.set("v1", "angry", 3)
+
+    assert cache.get("v1", "sad") is None  # Assert that "sad" was evicted
+    assert cache.get("v1", "happy") == 1
+    assert cache.get("v1", "angry") == 3
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (3, 1, 1)
+
+
+def test_entries_expire_after_ttl():
+    """
+    Tests that entries are no longer returned once their TTL has passed.
+    """
+    now = [100.0]  # Fake clock that the test moves forward
+    cache = PredictionCache(InMemoryCacheBackend(ttl_seconds=10, clock=lambda: now[0]))
+    cache.set("v1", "happy", 1)
+    now[0] += 5
+    assert cache.get("v1", "happy") == 1  # Assert that the entry is still valid before its TTL
+    now[0] += 10
+    assert cache.get("v1", "happy") is None  # Assert that the entry expired after its TTL
+    assert cache.stats()["expirations"] == 1
+
+
+def test_entries_are_scoped_to_the_model_version():
+    """
+    Tests that a prediction cached for one model version isn't returned for another.
+    """
+    cache = PredictionCache(InMemoryCacheBackend())
+    cache.set("v1", "happy", 1)
+    assert cache.get("v2", "happy") is None
+
+
+def test_counters_add_up_under_concurrent_lookups():
+    """
+    Tests that no hit or miss is lost when request threads look up the cache at the same time.
+    """
+    cache = PredictionCache(InMemoryCacheBackend())
+    cache.set("v1", "happy", 1)
+
+    def look_up(index):
+        for _ in range(1000):
+            cache.get("v1", "happy" if index % 2 else "sad")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(look_up, range(8)))
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (4000, 4000)  # Assert that every lookup was counted once
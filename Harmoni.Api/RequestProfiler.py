@@ -0,0 +1,110 @@
+import os
+import random
+import threading
+import time
+
+
+class RequestProfiler:
+    """
+    Profiles a sample of the prediction calls, switched on and off at runtime.
+
+    While enabled, every call run through `run` is profiled with probability `sample_rate`, with
+    either cProfile (a `.prof` file, to open with pstats or snakeviz) or the torch profiler (a
+    Chrome trace `.json` file). The profiler switches itself off after `max_profiles` captures.
+    A single call is profiled at a time; concurrent calls run unprofiled meanwhile.
+
+    The profiler lives in the process that enables it: with a process pool backend, the worker
+    processes never see it enabled.
+    """
+
+    modes = ("cprofile", "torch")
+
+    def __init__(self, output_directory, random_fn=random.random):
+        """
+        Args:
+            output_directory (str): The directory the profiles are written to.
+            random_fn (callable): Function returning a random number in [0, 1), used for sampling.
+        """
+        self.output_directory = output_directory
+        self.random_fn = random_fn
+        self.mode = None
+        self.sample_rate = 0.0
+        self.max_profiles = 0
+        self.profiles = []
+        self._remaining_profiles = 0
+        self._profiling = threading.Lock()
+
+    def enable(self, mode, sample_rate=0.01, max_profiles=10):
+        """
+        Starts profiling sampled calls.
+
+        Args:
+            mode (str): "cprofile" or "torch".
+            sample_rate (float): The share of calls profiled.
+            max_profiles (int): The number of profiles captured before profiling stops.
+        """
+        if mode not in self.modes:
+            raise ValueError(f"Unknown profiling mode '{mode}', expected one of {', '.join(self.modes)}")
+        self.sample_rate = sample_rate
+        self.max_profiles = max_profiles
+        self._remaining_profiles = max_profiles
+        self.mode = mode
+
+    def disable(self):
+        """
+        Stops profiling.
+        """
+        self.mode = None
+
+    def status(self):
+        """
+        Returns the profiling settings and the paths of the profiles captured so far.
+        """
+        return {
+            "mode": self.mode,
+            "sample_rate": self.sample_rate,
+            "max_profiles": self.max_profiles,
+            "output_directory": self.output_directory,
+            "profiles": list(self.profiles),
+        }
+
+    def run(self, fn, *args):
+        """
+        Runs `fn(*args)`, profiling it if profiling is enabled and the call is sampled.
+        """
+        mode = self.mode
+        # Only an attribute read on the hot path while profiling is off
+        if mode is None or self.random_fn() >= self.sample_rate or not self._profiling.acquire(blocking=False):
+            return fn(*args)
+        try:
+            os.makedirs(self.output_directory, exist_ok=True)
+            path = os.path.join(self.output_directory, f"{mode}-{time.strftime('%Y%m%d-%H%M%S')}-{len(self.profiles)}")
+            if mode == "torch":
+                result, path = self._run_torch_profiler(fn, args, path)
+            else:
+                result, path = self._run_cprofile(fn, args, path)
+            self.profiles.append(path)
+            self._remaining_profiles -= 1
+            if self._remaining_profiles <= 0:
+                self.disable()
+            return result
+        finally:
+            self._profiling.release()
+
+    @staticmethod
+    def _run_cprofile(fn, args, path):
+        import cProfile
+
+        profile = cProfile.Profile()
+        result = profile.runcall(fn, *args)
+        profile.dump_stats(f"{path}.prof")
+        return result, f"{path}.prof"
+
+    @staticmethod
+    def _run_torch_profiler(fn, args, path):
+        from torch.profiler import ProfilerActivity, profile
+
+        with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as torch_profile:
+            result = fn(*args)
+        torch_profile.export_chrome_trace(f"{path}.json")
+        return result, f"{path}.json"
@@ -0,0 +1,36 @@
+import os  # To check the written profiles
+import pstats  # To read the cProfile output
+
+import pytest  # Testing framework
+
+from RequestProfiler import RequestProfiler  # Class under test
+
+
+def test_sampled_calls_are_profiled_until_max_profiles(tmp_path):
+    """
+    Tests that sampled calls are profiled with cProfile, and that profiling stops after max_profiles captures.
+    """
+    profiler = RequestProfiler(str(tmp_path), random_fn=lambda: 0.0)  # Every call is sampled
+    assert profiler.run(sum, [1, 2]) == 3  # Disabled: the call runs unprofiled
+    assert profiler.profiles == []
+
+    profiler.enable("cprofile", sample_rate=0.5, max_profiles=2)
+    results = [profiler.run(sorted, [3, 1, 2]) for _ in range(3)]
+
+    assert results == [[1, 2, 3]] * 3  # Profiling doesn't change the results
+    assert len(profiler.profiles) == 2  # The third call ran after profiling stopped
+    assert profiler.status()["mode"] is None
+    assert all(os.path.exists(path) for path in profiler.profiles)
+    assert pstats.Stats(profiler.profiles[0]).total_calls > 0  # The profile can be read by pstats
+
+
+def test_unsampled_calls_are_not_profiled(tmp_path):
+    """
+    Tests that calls outside of the sample run unprofiled, and that unknown modes are rejected.
+    """
+    profiler = RequestProfiler(str(tmp_path), random_fn=lambda: 0.9)
+    profiler.enable("cprofile", sample_rate=0.5)
+    assert profiler.run(len, "abc") == 3
+    assert profiler.profiles == []
+    with pytest.raises(ValueError):
+        profiler.enable("perf")
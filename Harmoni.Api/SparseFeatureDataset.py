@@ -0,0 +1,52 @@
+import numpy as np
+import torch
+from scipy import sparse
+from torch.utils.data import Dataset
+
+
+class SparseFeatureDataset(Dataset):
+    """
+    Dataset of sparse feature rows (e.g. TF-IDF features) and their labels, densified one batch at a time.
+
+    Building a TensorDataset from `features.toarray()` holds the whole dense matrix twice (the float64
+    array and its float32 copy), which doesn't fit in memory for large corpora. This dataset keeps the
+    CSR matrix and yields row indices; its `collate` method slices the rows of a batch and densifies
+    only them, so peak memory scales with the batch size instead of the dataset size.
+
+    Used with a DataLoader and `collate_fn=dataset.collate`, it produces the same batches, in the same
+    order for a given random seed, as a TensorDataset of the dense features.
+    """
+
+    def __init__(self, features, labels, dtype=torch.float32):
+        """
+        Args:
+            features (scipy.sparse matrix): The features, one row per sample.
+            labels (array-like): The class number of every sample.
+            dtype (torch.dtype): The type of the feature tensors of a batch.
+        """
+        self.features = sparse.csr_matrix(features)
+        self.labels = torch.as_tensor(np.asarray(labels), dtype=torch.long)
+        self.dtype = dtype
+        if self.features.shape[0] != len(self.labels):
+            raise ValueError(f"Got {self.features.shape[0]} feature rows for {len(self.labels)} labels")
+
+    def __len__(self):
+        return self.features.shape[0]
+
+    def __getitem__(self, index):
+        # The row is only sliced in collate, with the other rows of its batch
+        return index
+
+    def collate(self, indices):
+        """
+        Builds a batch from the indices of its samples.
+
+        Args:
+            indices (list[int]): The indices of the samples of the batch.
+
+        Returns:
+            tuple: The (batch_size, num_features) dense feature tensor and the labels tensor.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        batch_features = torch.from_numpy(self.features[indices].toarray()).to(self.dtype)
+        return batch_features, self.labels[indices]
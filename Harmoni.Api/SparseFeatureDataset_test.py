@@ -0,0 +1,71 @@
+import numpy as np  # For building the test inputs
+import pytest  # Python testing framework
+import torch  # PyTorch library for tensor computations and neural networks
+from scipy import sparse  # For building sparse TF-IDF-like inputs
+from torch.utils.data import DataLoader, TensorDataset  # The dense training path the dataset replaces
+
+from EmotionClassifier import EmotionClassifier  # Model trained in the tests
+from SparseFeatureDataset import SparseFeatureDataset  # Import the sparse dataset
+
+# Sparse float64 features like the TF-IDF vectorizer output, and their labels
+features = sparse.random(50, 40, density=0.1, format='csr', random_state=0, dtype=np.float64)
+labels = np.random.default_rng(0).integers(0, 6, 50)
+
+
+def train(dataloader):
+    """
+    Trains a model for two epochs on the batches of a DataLoader and returns its weights.
+    """
+    torch.manual_seed(0)
+    model = EmotionClassifier(40, 6)
+    optimizer = torch.optim.Adam(model.parameters())
+    for _ in range(2):
+        for batch_inputs, batch_labels in dataloader:
+            optimizer.zero_grad()
+            torch.nn.functional.cross_entropy(model(batch_inputs), batch_labels).backward()
+            optimizer.step()
+    return model.state_dict()
+
+
+def test_batches_match_the_dense_dataset():
+    """
+    Tests that the sparse dataset yields the same batches, in the same shuffled order, as a
+    TensorDataset of the densified features, and that only the batch rows are densified.
+    """
+    dataset = SparseFeatureDataset(features, labels)
+    dense_dataset = TensorDataset(torch.FloatTensor(features.toarray()), torch.LongTensor(labels))
+
+    torch.manual_seed(1)
+    sparse_batches = list(DataLoader(dataset, batch_size=16, shuffle=True, collate_fn=dataset.collate))
+    torch.manual_seed(1)
+    dense_batches = list(DataLoader(dense_dataset, batch_size=16, shuffle=True))
+
+    assert len(sparse_batches) == len(dense_batches) == 4
+    for (sparse_inputs, sparse_labels), (dense_inputs, dense_labels) in zip(sparse_batches, dense_batches):
+        assert sparse_inputs.dtype == torch.float32
+        assert torch.equal(sparse_inputs, dense_inputs)
+        assert torch.equal(sparse_labels, dense_labels)
+    # The last batch only holds the remaining rows
+    assert sparse_batches[-1][0].shape == (2, 40)
+
+
+def test_training_matches_the_dense_path():
+    """
+    Tests that training on the sparse dataset gives the same model as training on the dense features.
+    """
+    dataset = SparseFeatureDataset(features, labels)
+    dense_dataset = TensorDataset(torch.FloatTensor(features.toarray()), torch.LongTensor(labels))
+
+    sparse_weights = train(DataLoader(dataset, batch_size=8, shuffle=True, collate_fn=dataset.collate))
+    dense_weights = train(DataLoader(dense_dataset, batch_size=8, shuffle=True))
+
+    for name, weight in dense_weights.items():
+        assert torch.equal(sparse_weights[name], weight)
+
+
+def test_mismatched_labels_are_rejected():
+    """
+    Tests that the dataset refuses features and labels of different lengths.
+    """
+    with pytest.raises(ValueError):
+        SparseFeatureDataset(features, labels[:-1])
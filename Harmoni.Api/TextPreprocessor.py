@@ -0,0 +1,228 @@
+import re
+import threading
+from functools import lru_cache
+
+
+class TextPreprocessor:
+    """
+    Text preprocessing pipeline shared by the training script and the API.
+
+    Converts the text to lowercase, removes non-alphabetic characters, splits it into tokens,
+    removes stop words and lemmatizes the remaining tokens. Lemmas are looked up in an optional
+    precomputed table first, then in a bounded memo in front of the lemmatizer, so the (slow)
+    WordNet lookup runs at most once per distinct word.
+    """
+
+    # Characters removed from the lowercased text
+    non_letter_pattern = re.compile(r'[^a-zA-Z\s]')
+
+    def __init__(self, stop_words, lemmatize, lemma_table=None, lemma_cache_size=100000):
+        """
+        Args:
+            stop_words (iterable[str]): The words removed from the text.
+            lemmatize (callable): Function returning the lemma of a word.
+            lemma_table (dict[str, str]): Optional precomputed lemmas, e.g. built from the training vocabulary.
+            lemma_cache_size (int): The maximum number of lemmas memoized besides the precomputed ones.
+        """
+        self.stop_words = frozenset(stop_words)
+        self.lemmatize = lemmatize
+        self.lemma_table = dict(lemma_table or {})
+        self.lemma_cache_size = lemma_cache_size
+        self._cached_lemmatize = lru_cache(maxsize=lemma_cache_size)(lemmatize)
+
+    # NLTK resources used by from_nltk, with their path in the NLTK data directories
+    nltk_resources = {'stopwords': 'corpora/stopwords', 'wordnet': 'corpora/wordnet'}
+
+    @classmethod
+    def ensure_nltk_resources(cls, download=True):
+        """
+        Makes sure the NLTK resources used by from_nltk are installed. The downloader, which needs
+        the network, only runs for missing resources.
+
+        Args:
+            download (bool): Whether missing resources may be downloaded.
+
+        Raises:
+            LookupError: If a resource is missing and can't be downloaded.
+        """
+        import nltk
+
+        for resource, resource_path in cls.nltk_resources.items():
+            try:
+                nltk.data.find(resource_path)
+            except LookupError:
+                if not download:
+                    raise LookupError(f"NLTK resource '{resource}' isn't installed and downloads are disabled, "
+                                      f"install it with: python -m nltk.downloader {resource}") from None
+                nltk.download(resource, quiet=True)
+
+    @classmethod
+    def from_nltk(cls, excluded_stop_words=(), stop_words=None, background_load=False, **kwargs):
+        """
+        Creates a preprocessor using the NLTK English stop words and WordNet lemmatizer.
+        The NLTK stopwords and wordnet resources must already be available.
+
+        Args:
+            excluded_stop_words (iterable[str]): Stop words to keep in the text (e.g. 'not').
+            stop_words (iterable[str]): Stop words to use instead of the NLTK ones, e.g. those saved with the model.
+            background_load (bool): Whether to load WordNet in a background thread instead of on the first lemma.
+            **kwargs: Other arguments of the TextPreprocessor constructor.
+
+        Returns:
+            TextPreprocessor: The preprocessor.
+        """
+        if stop_words is None:
+            from nltk.corpus import stopwords
+
+            stop_words = stopwords.words('english')
+        lemmatizer = BackgroundLemmatizer() if background_load else BackgroundLemmatizer.create_lemmatizer()
+        stop_words = set(stop_words) - set(excluded_stop_words)
+        return cls(stop_words, lemmatizer.lemmatize, **kwargs)
+
+    def tokenize(self, text):
+        """
+        Preprocesses a text and returns its tokens.
+
+        Args:
+            text (str): The text to preprocess.
+
+        Returns:
+            list[str]: The lemmatized tokens that aren't stop words.
+        """
+        stop_words = self.stop_words
+        lemma_table = self.lemma_table
+        cached_lemmatize = self._cached_lemmatize
+        tokens = self.non_letter_pattern.sub('', text.lower()).split()
+        return [lemma_table.get(word) or cached_lemmatize(word) for word in tokens if word not in stop_words]
+
+    def preprocess(self, text):
+        """
+        Preprocesses a text.
+
+        Args:
+            text (str): The text to preprocess.
+
+        Returns:
+            str: The preprocessed text.
+        """
+        return ' '.join(self.tokenize(text))
+
+    def preprocess_batch(self, texts):
+        """
+        Preprocesses a list of texts in one pass.
+
+        Args:
+            texts (iterable[str]): The texts to preprocess.
+
+        Returns:
+            list[str]: The preprocessed texts, in the same order.
+        """
+        return [' '.join(tokens) for tokens in self.tokenize_batch(texts)]
+
+    def tokenize_batch(self, texts):
+        """
+        Preprocesses a list of texts in one pass and returns their tokens.
+
+        Args:
+            texts (iterable[str]): The texts to preprocess.
+
+        Returns:
+            list[list[str]]: The tokens of every text, in the same order.
+        """
+        # Bind everything used in the loop to locals once for the whole batch
+        sub = self.non_letter_pattern.sub
+        stop_words = self.stop_words
+        lemma_table_get = self.lemma_table.get
+        cached_lemmatize = self._cached_lemmatize
+        return [
+            [lemma_table_get(word) or cached_lemmatize(word)
+             for word in sub('', text.lower()).split() if word not in stop_words]
+            for text in texts
+        ]
+
+    def build_lemma_table(self, texts):
+        """
+        Builds the table of the lemmas of every word of the given texts, e.g. the training texts,
+        to pass as `lemma_table` to a preprocessor serving the model trained on them.
+
+        Args:
+            texts (iterable[str]): The texts whose words are lemmatized.
+
+        Returns:
+            dict[str, str]: The lemma of every distinct word that isn't a stop word.
+        """
+        words = set()
+        for text in texts:
+            words.update(self.non_letter_pattern.sub('', text.lower()).split())
+        return {word: self._cached_lemmatize(word) for word in sorted(words - self.stop_words)}
+
+    def cache_info(self):
+        """
+        Returns statistics about the lemma memo and the precomputed lemma table.
+        """
+        info = self._cached_lemmatize.cache_info()
+        return {
+            "lemma_table_size": len(self.lemma_table),
+            "lemma_cache_hits": info.hits,
+            "lemma_cache_misses": info.misses,
+            "lemma_cache_size": info.currsize,
+            "lemma_cache_max_size": info.maxsize,
+        }
+
+
+class BackgroundLemmatizer:
+    """
+    WordNet lemmatizer whose corpus is loaded in a background thread.
+
+    Importing NLTK and loading WordNet takes seconds. Loading them in the background lets a
+    preprocessor with a precomputed lemma table serve the words of that table right away;
+    lemmatizing any other word waits until WordNet is loaded. Loading in a single thread also
+    avoids NLTK's lazy corpus loading, which isn't thread-safe, running in several request threads.
+    """
+
+    def __init__(self):
+        self._lemmatizer = None
+        self._error = None
+        self._loaded = threading.Event()
+        threading.Thread(target=self._load, name='wordnet-loader', daemon=True).start()
+
+    @staticmethod
+    def create_lemmatizer():
+        """
+        Creates a WordNet lemmatizer with its corpus already loaded.
+        """
+        from nltk.stem import WordNetLemmatizer
+
+        lemmatizer = WordNetLemmatizer()
+        # The corpus is only loaded on the first lemma
+        lemmatizer.lemmatize('warmup')
+        return lemmatizer
+
+    def wait(self, timeout=None):
+        """
+        Waits until WordNet is loaded.
+
+        Returns:
+            bool: Whether WordNet was loaded (or failed to load) before the timeout.
+        """
+        return self._loaded.wait(timeout)
+
+    def lemmatize(self, word):
+        """
+        Returns the lemma of a word, once WordNet is loaded.
+
+        Raises:
+            LookupError: If the WordNet corpus couldn't be loaded.
+        """
+        self._loaded.wait()
+        if self._error is not None:
+            raise self._error
+        return self._lemmatizer.lemmatize(word)
+
+    def _load(self):
+        try:
+            self._lemmatizer = self.create_lemmatizer()
+        except Exception as error:
+            self._error = error
+        finally:
+            self._loaded.set()
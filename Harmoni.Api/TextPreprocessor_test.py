@@ -0,0 +1,61 @@
+import re  # For the reference implementation of the preprocessing
+
+from TextPreprocessor import TextPreprocessor  # Import the shared preprocessing pipeline
+
+stop_words = {'i', 'am', 'so', 'the', 'a', 'not'}  # Small stop word list for the tests
+lemmas = {'feelings': 'feeling', 'dogs': 'dog', 'was': 'wa'}  # Fake lemmatizer lookup table
+
+
+def lemmatize(word):
+    """
+    Fake lemmatizer returning the lemma from the lookup table, or the word itself.
+    """
+    return lemmas.get(word, word)
+
+
+def reference_preprocess(text):
+    """
+    The original per-token preprocessing function the pipeline must stay identical to.
+    """
+    text = text.lower()
+    text = re.sub(r'[^a-zA-Z\s]', '', text)
+    tokens = text.split()
+    tokens = [lemmatize(word) for word in tokens if word not in stop_words]
+    return ' '.join(tokens)
+
+
+texts = ["I am SO happy!!", "The dogs' feelings... were hurt :(", "", "   ", "Naïve café, 100% not bad\tat ALL",
+         "it was 2 dogs"]
+
+
+def test_preprocess_matches_reference():
+    """
+    Tests that single and batch preprocessing produce exactly the same output as the original function.
+    """
+    preprocessor = TextPreprocessor(stop_words, lemmatize)
+    expected = [reference_preprocess(text) for text in texts]
+    assert [preprocessor.preprocess(text) for text in texts] == expected
+    assert preprocessor.preprocess_batch(texts) == expected
+
+
+def test_lemma_table_is_used_before_the_lemmatizer():
+    """
+    Tests that a precomputed lemma table built from the training texts gives identical output
+    without calling the lemmatizer again.
+    """
+    lemma_table = TextPreprocessor(stop_words, lemmatize).build_lemma_table(texts)
+    calls = []
+    preprocessor = TextPreprocessor(stop_words, lambda word: calls.append(word) or word, lemma_table=lemma_table)
+    assert preprocessor.preprocess_batch(texts) == [reference_preprocess(text) for text in texts]
+    assert calls == []  # Assert that every word was found in the lemma table
+
+
+def test_lemma_memo_is_bounded():
+    """
+    Tests that the lemma memo calls the lemmatizer once per word and never grows past its maximum size.
+    """
+    calls = []
+    preprocessor = TextPreprocessor(stop_words, lambda word: calls.append(word) or word, lemma_cache_size=2)
+    preprocessor.preprocess_batch(["dogs dogs dogs", "cats birds fish"])
+    assert calls == ["dogs", "cats", "birds", "fish"]  # Assert that repeated words were memoized
+    assert preprocessor.cache_info()["lemma_cache_size"] == 2
@@ -0,0 +1,341 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+from scipy import sparse
+
+
+class TfidfFeaturizer:
+    """
+    Computes the TF-IDF features of preprocessed token lists in a single pass.
+
+    A fitted TfidfVectorizer expects the preprocessed tokens joined back into a string, which it
+    then re-tokenizes, filters against its own stop words and turns into n-grams before looking
+    them up in its vocabulary. This featurizer works on the token lists directly: the analysis of
+    each distinct token (token pattern and stop words) is memoized, and n-grams are looked up by
+    the tuple of their word ids, so no intermediate string is built. It produces the same features
+    as the vectorizer it was created from.
+
+    The vocabulary can also be a SortedVocabulary, e.g. memory-mapped from a model artifact, in
+    which case no per-process dictionary is built and the terms of a whole batch are looked up
+    with a single binary search, or a HashedVocabulary, which hashes the terms into a fixed number
+    of columns like a HashingVectorizer and stores no terms at all.
+    """
+
+    def __init__(self, vocabulary, idf=None, stop_words=None, ngram_range=(1, 1),
+                 token_pattern=r"(?u)\b\w\w+\b", lowercase=True, binary=False, sublinear_tf=False,
+                 norm='l2', dtype=np.float64, analysis_cache_size=100000):
+        """
+        Args:
+            vocabulary (dict[str, int] | SortedVocabulary | HashedVocabulary): The column of every term (n-grams
+                joined by single spaces).
+            idf (np.ndarray): The inverse document frequency of every column, or None to skip the idf weighting.
+            stop_words (iterable[str]): The words removed before building n-grams.
+            ngram_range (tuple[int, int]): The lower and upper n-gram sizes.
+            token_pattern (str): The regular expression selecting the tokens.
+            lowercase (bool): Whether to lowercase the tokens.
+            binary (bool): Whether to replace the term counts by 1.
+            sublinear_tf (bool): Whether to replace the term counts by 1 + log(count).
+            norm (str): The row normalization, 'l2', 'l1' or None.
+            dtype (np.dtype): The type of the feature values.
+            analysis_cache_size (int): The maximum number of distinct tokens whose analysis is memoized.
+        """
+        if norm not in ('l2', 'l1', None):
+            raise ValueError(f"Unsupported norm '{norm}'")
+        self.vocabulary = vocabulary
+        self.idf = np.asarray(idf) if idf is not None else None
+        self.stop_words = frozenset(stop_words or ())
+        self.ngram_range = tuple(ngram_range)
+        self.token_pattern = re.compile(token_pattern)
+        self.lowercase = lowercase
+        self.binary = binary
+        self.sublinear_tf = sublinear_tf
+        self.norm = norm
+        self.dtype = dtype
+        self.num_features = len(vocabulary)
+
+        # Unigrams are looked up by their word, longer n-grams by the tuple of their word ids
+        self._unigram_columns = {}
+        self._word_ids = {}
+        self._ngram_columns = {}
+        # Vocabularies looking up the terms of a whole batch at once, instead of dictionaries
+        self._batch_vocabulary = vocabulary if isinstance(vocabulary, (SortedVocabulary, HashedVocabulary)) else None
+        for term, column in (vocabulary.items() if self._batch_vocabulary is None else ()):
+            words = term.split(' ')
+            if len(words) == 1:
+                self._unigram_columns[term] = column
+            else:
+                key = tuple(self._word_ids.setdefault(word, len(self._word_ids)) for word in words)
+                self._ngram_columns[key] = column
+        self._analyze_token = lru_cache(maxsize=analysis_cache_size)(self._analyze_token)
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer, **kwargs):
+        """
+        Creates a featurizer producing the same features as a fitted TfidfVectorizer, or as a fitted
+        hashing pipeline returned by `make_hashing_vectorizer`.
+
+        Args:
+            vectorizer (TfidfVectorizer | Pipeline): The fitted vectorizer.
+            **kwargs: Other arguments of the TfidfFeaturizer constructor.
+
+        Returns:
+            TfidfFeaturizer: The featurizer.
+
+        Raises:
+            ValueError: If the vectorizer uses options the featurizer doesn't reproduce
+                (character analyzers, custom callables, accent stripping, non-content input, or
+                signed or normalized hashing).
+        """
+        hashing_vectorizer = None
+        if hasattr(vectorizer, 'steps'):
+            # The hashing pipeline: the counts of a HashingVectorizer weighted by a TfidfTransformer
+            if [type(step).__name__ for _, step in vectorizer.steps] != ['HashingVectorizer', 'TfidfTransformer']:
+                raise ValueError("Only pipelines of a HashingVectorizer and a TfidfTransformer are supported")
+            hashing_vectorizer, tfidf_transformer = [step for _, step in vectorizer.steps]
+            if hashing_vectorizer.alternate_sign or hashing_vectorizer.norm is not None:
+                raise ValueError("Only hashing vectorizers counting terms without sign or norm are supported")
+            analyzing_vectorizer = hashing_vectorizer
+        else:
+            analyzing_vectorizer = vectorizer
+        if (analyzing_vectorizer.analyzer != 'word' or analyzing_vectorizer.tokenizer is not None
+                or analyzing_vectorizer.preprocessor is not None or analyzing_vectorizer.strip_accents is not None
+                or analyzing_vectorizer.input != 'content'):
+            raise ValueError("Only word analyzers without custom callables or accent stripping are supported")
+        if hashing_vectorizer is not None:
+            return cls(
+                HashedVocabulary(hashing_vectorizer.n_features),
+                idf=tfidf_transformer.idf_ if tfidf_transformer.use_idf else None,
+                stop_words=hashing_vectorizer.get_stop_words(),
+                ngram_range=hashing_vectorizer.ngram_range,
+                token_pattern=hashing_vectorizer.token_pattern,
+                lowercase=hashing_vectorizer.lowercase,
+                binary=hashing_vectorizer.binary,
+                sublinear_tf=tfidf_transformer.sublinear_tf,
+                norm=tfidf_transformer.norm,
+                dtype=hashing_vectorizer.dtype,
+                **kwargs,
+            )
+        return cls(
+            vectorizer.vocabulary_,
+            idf=vectorizer.idf_ if vectorizer.use_idf else None,
+            stop_words=vectorizer.get_stop_words(),
+            ngram_range=vectorizer.ngram_range,
+            token_pattern=vectorizer.token_pattern,
+            lowercase=vectorizer.lowercase,
+            binary=vectorizer.binary,
+            sublinear_tf=vectorizer.sublinear_tf,
+            norm=vectorizer.norm,
+            dtype=vectorizer.dtype,
+            **kwargs,
+        )
+
+    def transform(self, token_lists):
+        """
+        Computes the TF-IDF features of preprocessed texts.
+
+        Args:
+            token_lists (list[list[str]]): The tokens of every preprocessed text.
+
+        Returns:
+            scipy.sparse.csr_matrix: The features, one row per text.
+        """
+        if self._batch_vocabulary is not None:
+            return self._transform_batch(token_lists)
+
+        min_n, max_n = self.ngram_range
+        analyze_token = self._analyze_token
+        unigram_columns_get = self._unigram_columns.get
+        word_ids_get = self._word_ids.get
+        ngram_columns_get = self._ngram_columns.get
+
+        indices = []
+        counts = []
+        indptr = [0]
+        for tokens in token_lists:
+            # Tokens are separated by spaces, so analyzing them one by one is the same as analyzing their join
+            words = [word for token in tokens for word in analyze_token(token)]
+            row_counts = {}
+            if min_n == 1:
+                for word in words:
+                    column = unigram_columns_get(word)
+                    if column is not None:
+                        row_counts[column] = row_counts.get(column, 0) + 1
+            if max_n > 1:
+                # Words that appear in no n-gram of the vocabulary get no id and break every n-gram containing them
+                word_ids = [word_ids_get(word) for word in words]
+                for n in range(max(min_n, 2), min(max_n, len(words)) + 1):
+                    # zip over shifted copies builds the n-gram keys without slicing
+                    for key in zip(*(word_ids[offset:] for offset in range(n))):
+                        column = ngram_columns_get(key)
+                        if column is not None:
+                            row_counts[column] = row_counts.get(column, 0) + 1
+            # Sorted columns, like the vectorizer output
+            for column in sorted(row_counts):
+                indices.append(column)
+                counts.append(row_counts[column])
+            indptr.append(len(indices))
+
+        return self._weight(np.asarray(counts, dtype=self.dtype), np.asarray(indices, dtype=np.int32),
+                            np.asarray(indptr, dtype=np.int32))
+
+    def _transform_batch(self, token_lists):
+        # Build every n-gram of the batch, then look them all up in the vocabulary at once
+        min_n, max_n = self.ngram_range
+        analyze_token = self._analyze_token
+        space_join = ' '.join
+        terms = []
+        rows = []
+        for row, tokens in enumerate(token_lists):
+            words = [word for token in tokens for word in analyze_token(token)]
+            row_start = len(terms)
+            for n in range(min_n, min(max_n, len(words)) + 1):
+                terms.extend(words if n == 1 else [space_join(words[start:start + n])
+                                                   for start in range(len(words) - n + 1)])
+            rows.extend([row] * (len(terms) - row_start))
+
+        columns = self._batch_vocabulary.lookup(terms)
+        found = columns >= 0
+        # Duplicate (row, column) pairs are summed into term counts
+        counts = sparse.csr_matrix((np.ones(found.sum(), dtype=self.dtype),
+                                    (np.asarray(rows, dtype=np.int32)[found], columns[found])),
+                                   shape=(len(token_lists), self.num_features))
+        counts.sum_duplicates()
+        return self._weight(counts.data, counts.indices, counts.indptr)
+
+    def _weight(self, data, indices, indptr):
+        # Turn the term counts into TF-IDF values the same way the vectorizer does
+        if self.binary:
+            data.fill(1)
+        if self.sublinear_tf:
+            np.log(data, data)
+            data += 1.0
+        if self.idf is not None:
+            data *= self.idf[indices]
+        if self.norm is not None:
+            rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+            if self.norm == 'l2':
+                row_norms = np.sqrt(np.bincount(rows, weights=data * data, minlength=len(indptr) - 1))
+            else:
+                row_norms = np.bincount(rows, weights=np.abs(data), minlength=len(indptr) - 1)
+            data /= row_norms[rows]
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, self.num_features))
+
+    def _analyze_token(self, token):
+        # Apply the vectorizer's lowercasing, token pattern and stop words to a single preprocessed token
+        if self.lowercase:
+            token = token.lower()
+        return tuple(word for word in self.token_pattern.findall(token) if word not in self.stop_words)
+
+
+class SortedVocabulary:
+    """
+    Vocabulary stored as two flat arrays: the UTF-8 encoded terms in sorted order and the column
+    of each. Unlike a dictionary, the arrays can be memory-mapped and shared by every process.
+    """
+
+    def __init__(self, sorted_terms, columns):
+        """
+        Args:
+            sorted_terms (np.ndarray): The UTF-8 encoded terms, sorted, as a fixed-width bytes array.
+            columns (np.ndarray): The column of every term.
+        """
+        self.sorted_terms = sorted_terms
+        self.columns = columns
+
+    @classmethod
+    def from_terms(cls, terms):
+        """
+        Creates the sorted vocabulary of a list of terms, each term's column being its position in the list.
+
+        Args:
+            terms (list[str]): The term of every column.
+
+        Returns:
+            SortedVocabulary: The vocabulary.
+        """
+        encoded_terms = np.array([term.encode('utf-8') for term in terms])
+        order = np.argsort(encoded_terms, kind='stable')
+        return cls(encoded_terms[order], order.astype(np.int32))
+
+    def __len__(self):
+        return len(self.sorted_terms)
+
+    def lookup(self, terms):
+        """
+        Looks up the columns of a list of terms.
+
+        Args:
+            terms (list[str]): The terms to look up.
+
+        Returns:
+            np.ndarray: The column of every term, or -1 for terms that aren't in the vocabulary.
+        """
+        if not terms or not len(self.sorted_terms):
+            return np.full(len(terms), -1, dtype=np.int32)
+        encoded_terms = [term.encode('utf-8') for term in terms]
+        # Terms longer than the widest vocabulary term can't match, and would be truncated by the cast
+        width = self.sorted_terms.dtype.itemsize
+        fits = np.fromiter((len(term) <= width for term in encoded_terms), dtype=bool, count=len(encoded_terms))
+        keys = np.array(encoded_terms, dtype=self.sorted_terms.dtype)
+        positions = np.minimum(np.searchsorted(self.sorted_terms, keys), len(self.sorted_terms) - 1)
+        found = fits & (self.sorted_terms[positions] == keys)
+        return np.where(found, self.columns[positions], -1).astype(np.int32)
+
+
+class HashedVocabulary:
+    """
+    Vocabulary of a HashingVectorizer: every term goes to the column of its MurmurHash3 modulo the
+    number of columns, so nothing but that number is stored, at the cost of the collisions of the
+    terms sharing a column. Hashing uses scikit-learn's MurmurHash3, so that it matches the training.
+    """
+
+    def __init__(self, num_features):
+        """
+        Args:
+            num_features (int): The number of columns the terms are hashed into.
+        """
+        from sklearn.utils import murmurhash3_32
+
+        self.num_features = num_features
+        self._hash = murmurhash3_32
+
+    def __len__(self):
+        return self.num_features
+
+    def lookup(self, terms):
+        """
+        Computes the columns of a list of terms.
+
+        Args:
+            terms (list[str]): The terms to hash.
+
+        Returns:
+            np.ndarray: The column of every term.
+        """
+        hash_values = np.fromiter(map(self._hash, terms), dtype=np.int64, count=len(terms))
+        # The same columns as the HashingVectorizer, abs(-2**31) included
+        return (np.abs(hash_values) % self.num_features).astype(np.int32)
+
+
+def make_hashing_vectorizer(num_features=2 ** 14, **kwargs):
+    """
+    Creates a stateless alternative to the TfidfVectorizer: a HashingVectorizer counting the terms into
+    a fixed number of columns, weighted by the idf vector of a TfidfTransformer. It has no vocabulary
+    (nor the stop_words_ set of the terms pruned by max_features) to pickle and load.
+
+    Args:
+        num_features (int): The number of feature columns.
+        **kwargs: Other arguments of the HashingVectorizer, e.g. ngram_range and stop_words.
+
+    Returns:
+        sklearn.pipeline.Pipeline: The unfitted pipeline, used like a TfidfVectorizer.
+    """
+    from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+    from sklearn.pipeline import Pipeline
+
+    return Pipeline([
+        # Unsigned counts, so that the features stay non-negative for the Naive Bayes models
+        ('hashing', HashingVectorizer(n_features=num_features, alternate_sign=False, norm=None, **kwargs)),
+        ('tfidf', TfidfTransformer()),
+    ])
@@ -0,0 +1,82 @@
+import numpy as np  # For comparing the feature values
+import pytest  # Python testing framework
+from sklearn.feature_extraction.text import TfidfVectorizer  # The vectorizer the featurizer must match
+
+from TfidfFeaturizer import HashedVocabulary, SortedVocabulary, TfidfFeaturizer, make_hashing_vectorizer  # Under test
+
+training_texts = ["feel happy today", "not happy feel sad", "love family love friend", "angry angry day",
+                  "feel afraid dark night", "surprise party today", "x feel happy", "never feel sad"]
+token_lists = [["feel", "happy"], ["not", "happy", "today", "x"], [], ["love", "love", "family", "unknown"],
+               ["feel", "sad", "feel", "sad"], ["a", "surprise", "party", "today"]]
+
+
+@pytest.mark.parametrize("vectorizer_options", [
+    {},
+    {"ngram_range": (1, 2), "max_features": 20, "stop_words": ["not", "today"]},
+    {"ngram_range": (2, 3)},
+    {"sublinear_tf": True, "norm": "l1"},
+    {"binary": True, "use_idf": False, "norm": None},
+])
+def test_features_match_the_vectorizer(vectorizer_options):
+    """
+    Tests that the featurizer computes the same features as the vectorizer on the joined tokens.
+    """
+    vectorizer = TfidfVectorizer(**vectorizer_options).fit(training_texts)
+    expected = vectorizer.transform([' '.join(tokens) for tokens in token_lists])
+    featurizer = TfidfFeaturizer.from_vectorizer(vectorizer)
+    # Same featurizer with the vocabulary looked up in a sorted terms table instead of dictionaries
+    terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    sorted_featurizer = TfidfFeaturizer(SortedVocabulary.from_terms(terms), idf=featurizer.idf,
+                                        stop_words=featurizer.stop_words, ngram_range=featurizer.ngram_range,
+                                        binary=featurizer.binary, sublinear_tf=featurizer.sublinear_tf,
+                                        norm=featurizer.norm)
+
+    for features in (featurizer.transform(token_lists), sorted_featurizer.transform(token_lists)):
+        assert features.shape == expected.shape
+        assert np.array_equal(features.indptr, expected.indptr)  # Assert that every row has the same non-zeros
+        assert np.array_equal(features.indices, expected.indices)
+        assert np.allclose(features.data, expected.data)
+
+
+@pytest.mark.parametrize("hashing_options", [
+    {},
+    {"ngram_range": (1, 2), "stop_words": ["not", "today"]},
+    {"binary": True},
+])
+def test_hashed_features_match_the_hashing_pipeline(hashing_options):
+    """
+    Tests that the featurizer of a hashing pipeline computes the same features as the pipeline on the joined tokens.
+    """
+    vectorizer = make_hashing_vectorizer(64, **hashing_options).fit(training_texts)
+    expected = vectorizer.transform([' '.join(tokens) for tokens in token_lists])
+    featurizer = TfidfFeaturizer.from_vectorizer(vectorizer)
+    assert isinstance(featurizer.vocabulary, HashedVocabulary)  # Assert that no vocabulary is stored
+
+    features = featurizer.transform(token_lists)
+    assert features.shape == expected.shape == (len(token_lists), 64)
+    # Colliding terms are summed in both, so compare the dense rows
+    assert np.allclose(features.toarray(), expected.toarray())
+
+
+def test_unsupported_vectorizer_is_rejected():
+    """
+    Tests that a vectorizer with options the featurizer doesn't reproduce raises a ValueError.
+    """
+    vectorizer = TfidfVectorizer(analyzer='char').fit(training_texts)
+    with pytest.raises(ValueError):
+        TfidfFeaturizer.from_vectorizer(vectorizer)
+    # Signed hashing can't be weighted like the training features either
+    signed_vectorizer = make_hashing_vectorizer(64)
+    signed_vectorizer.set_params(hashing__alternate_sign=True).fit(training_texts)
+    with pytest.raises(ValueError):
+        TfidfFeaturizer.from_vectorizer(signed_vectorizer)
+
+
+def test_sorted_vocabulary_lookup():
+    """
+    Tests that the sorted vocabulary returns the column of known terms and -1 for the others,
+    including terms longer than any vocabulary term.
+    """
+    vocabulary = SortedVocabulary.from_terms(["happy", "sad day", "café", "love"])
+    columns = vocabulary.lookup(["love", "café", "unknown", "sad day", "happy", "a much longer unknown term", "lov"])
+    assert columns.tolist() == [3, 2, -1, 1, 0, -1, -1]
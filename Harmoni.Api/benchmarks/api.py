@@ -0,0 +1,322 @@
+"""
+Latency and throughput benchmark of the prediction API.
+
+Runs offline against the app in-process, with a synthetic model unless `--model-dir` points to a
+real one: a random EmotionClassifier exported as a compact artifact, over a vocabulary of made-up
+words whose lemmas and stop words are stored with it, so neither NLTK data nor the network is needed.
+
+For every text-length distribution it reports:
+    - per-stage timings of a prediction: preprocess, TF-IDF transform, forward and serialization
+      of the response, at batch sizes 1 and 32;
+    - p50/p95/p99 latency and requests per second of POST /predict_emotion at every concurrency level.
+
+Results are written as JSON. Passing a previous result file as `--baseline` compares the two runs
+and exits with status 1 when a latency grew, or the throughput dropped, by more than `--threshold`.
+
+Usage, from the Harmoni.Api directory:
+    python -m benchmarks.api --output baseline.json
+    python -m benchmarks.api --baseline baseline.json --threshold 0.2
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import string
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Number of words of the texts of every distribution, drawn uniformly between the bounds
+text_length_distributions = {'short': (3, 10), 'medium': (15, 40), 'long': (80, 200)}
+
+# Stop words of the synthetic model, mixed into the texts so the preprocessing has some to remove
+synthetic_stop_words = ('i', 'me', 'the', 'a', 'an', 'and', 'to', 'of', 'is', 'was', 'it', 'so', 'very')
+
+synthetic_labels = ('anger', 'fear', 'joy', 'love', 'sadness', 'surprise')
+
+
+def make_vocabulary(size, seed=0):
+    """
+    Makes up a vocabulary of distinct lowercase words, none of them a stop word.
+    """
+    rng = np.random.default_rng(seed)
+    letters = np.array(list(string.ascii_lowercase))
+    words = set()
+    while len(words) < size:
+        word = ''.join(rng.choice(letters, size=rng.integers(3, 10)))
+        if word not in synthetic_stop_words:
+            words.add(word)
+    return sorted(words)
+
+
+def generate_texts(vocabulary, count, length_range, seed=0):
+    """
+    Generates texts whose words follow a Zipf-like distribution over the vocabulary, with stop words,
+    capitalization and punctuation like real messages.
+
+    Args:
+        vocabulary (list[str]): The words to draw from, most frequent first.
+        count (int): The number of texts.
+        length_range (tuple[int, int]): The minimum and maximum number of words of a text.
+        seed (int): The random seed.
+
+    Returns:
+        list[str]: The texts.
+    """
+    rng = np.random.default_rng(seed)
+    frequencies = 1 / np.arange(1, len(vocabulary) + 1)
+    words = np.array(list(vocabulary) + list(synthetic_stop_words))
+    probabilities = np.concatenate([frequencies / frequencies.sum() * 0.7,
+                                    np.full(len(synthetic_stop_words), 0.3 / len(synthetic_stop_words))])
+    texts = []
+    for _ in range(count):
+        text = ' '.join(rng.choice(words, size=rng.integers(length_range[0], length_range[1] + 1), p=probabilities))
+        texts.append(text.capitalize() + rng.choice(['.', '!', '?', '...', '!!']))
+    return texts
+
+
+def build_synthetic_model(model_directory, vocabulary, seed=0):
+    """
+    Exports a randomly initialized EmotionClassifier as the compact artifact of a model directory.
+
+    Args:
+        model_directory (str): The directory the `best_emotion_model` artifact is written to.
+        vocabulary (list[str]): The words of the synthetic texts.
+        seed (int): The random seed of the training texts and weights.
+    """
+    import torch
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.preprocessing import LabelEncoder
+
+    from EmotionClassifier import EmotionClassifier
+    from model_artifact import export_artifact
+
+    # The vectorizer sees preprocessed texts, i.e. without stop words and in lowercase
+    training_texts = [text.lower() for text in generate_texts(vocabulary, 5000, (5, 40), seed)]
+    tfidf_vectorizer = TfidfVectorizer(max_features=5000, ngram_range=(1, 2),
+                                       stop_words=list(synthetic_stop_words)).fit(training_texts)
+    torch.manual_seed(seed)
+    model = EmotionClassifier(len(tfidf_vectorizer.vocabulary_), len(synthetic_labels)).eval()
+    export_artifact(os.path.join(model_directory, 'best_emotion_model'), model, tfidf_vectorizer,
+                    LabelEncoder().fit(synthetic_labels), lemma_table={word: word for word in vocabulary},
+                    preprocessing_stop_words=synthetic_stop_words)
+
+
+def load_app(model_directory, cache_size):
+    """
+    Imports the API module with the model of a directory, in offline mode.
+
+    Returns:
+        module: The `main` module.
+    """
+    os.environ.update(HARMONI_MODEL_DIR=model_directory, HARMONI_OFFLINE='1', HARMONI_CACHE_SIZE=str(cache_size))
+    return importlib.import_module('main')
+
+
+def summarize_latencies(seconds):
+    """
+    Returns the p50, p95 and p99 of a list of durations, in milliseconds.
+    """
+    milliseconds = np.asarray(seconds) * 1000
+    return {f'p{percentile}_ms': float(np.percentile(milliseconds, percentile)) for percentile in (50, 95, 99)}
+
+
+def measure_stages(main, texts, batch_size, batch_count=200):
+    """
+    Times every stage of the prediction of batches of texts.
+
+    Args:
+        main (module): The API module.
+        texts (list[str]): The texts, predicted `batch_size` at a time and cycled through.
+        batch_size (int): The number of texts of every batch.
+        batch_count (int): The number of batches timed.
+
+    Returns:
+        dict: The latency percentiles of every stage, per batch.
+    """
+    stage_seconds = {'preprocess': [], 'transform': [], 'forward': [], 'serialization': []}
+    for batch_index in range(batch_count):
+        start = batch_index * batch_size % max(1, len(texts) - batch_size + 1)
+        batch = texts[start:start + batch_size]
+        started = time.perf_counter()
+        token_lists = main.model_registry.current['text_preprocessor'].tokenize_batch(batch)
+        preprocessed = time.perf_counter()
+        features = main.featurize_tokens(token_lists)
+        transformed = time.perf_counter()
+        probability_rows = main.predict_feature_probabilities(features)
+        predicted = time.perf_counter()
+        serving_model = main.model_registry.current
+        main.EmotionBatchResponse(results=[
+            main.build_emotion_response(probabilities, serving_model['version'], serving_model['class_labels'])
+            for probabilities in probability_rows
+        ]).model_dump_json(exclude_none=True)
+        serialized = time.perf_counter()
+
+        stage_seconds['preprocess'].append(preprocessed - started)
+        stage_seconds['transform'].append(transformed - preprocessed)
+        stage_seconds['forward'].append(predicted - transformed)
+        stage_seconds['serialization'].append(serialized - predicted)
+    return {stage: summarize_latencies(seconds) for stage, seconds in stage_seconds.items()}
+
+
+async def run_load(main, texts, concurrency, request_count):
+    """
+    Sends requests to POST /predict_emotion from concurrent clients, in-process.
+
+    Args:
+        main (module): The API module.
+        texts (list[str]): The texts sent, in turn.
+        concurrency (int): The number of clients sending requests at the same time.
+        request_count (int): The total number of requests.
+
+    Returns:
+        dict: The latency percentiles, requests per second and number of failed requests.
+    """
+    import httpx
+
+    latencies = []
+    errors = 0
+    next_request = iter(range(request_count))
+
+    async def client_loop(client):
+        nonlocal errors
+        for index in next_request:
+            started = time.perf_counter()
+            response = await client.post('/predict_emotion', json={'text': texts[index % len(texts)]})
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code != 200
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as client:
+        # Warm up the micro-batcher and the executor outside of the measurement
+        await client.post('/predict_emotion', json={'text': texts[0]})
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {**summarize_latencies(latencies), 'requests_per_second': request_count / elapsed, 'errors': errors}
+
+
+def run_benchmark(main, vocabulary, distributions, concurrency_levels, request_count, stage_batch_sizes=(1, 32)):
+    """
+    Runs the stage timings and the load test of every text-length distribution.
+
+    Returns:
+        dict: The results of every distribution, by name.
+    """
+    results = {}
+    for seed, distribution in enumerate(distributions):
+        texts = generate_texts(vocabulary, max(request_count, 256), text_length_distributions[distribution],
+                               seed=seed + 1)
+        results[distribution] = {
+            'stages': {f'batch_{batch_size}': measure_stages(main, texts, batch_size)
+                       for batch_size in stage_batch_sizes},
+            'load': {f'concurrency_{concurrency}': asyncio.run(run_load(main, texts, concurrency, request_count))
+                     for concurrency in concurrency_levels},
+        }
+    return results
+
+
+def flatten_metrics(results, prefix=''):
+    """
+    Flattens nested results into a dictionary of 'path/to/metric' values.
+    """
+    metrics = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            metrics.update(flatten_metrics(value, f'{prefix}{key}/'))
+        elif isinstance(value, (int, float)):
+            metrics[f'{prefix}{key}'] = value
+    return metrics
+
+
+def compare_results(results, baseline, threshold):
+    """
+    Compares the results of a run against those of a baseline run.
+
+    Latencies (`*_ms`) regress when they grow by more than `threshold`, and the requests per second
+    when they drop by more than `threshold`. Metrics missing from either run are ignored.
+
+    Args:
+        results (dict): The current results.
+        baseline (dict): The baseline results.
+        threshold (float): The relative change tolerated, e.g. 0.2 for 20%.
+
+    Returns:
+        list[str]: A description of every regression.
+    """
+    current_metrics = flatten_metrics(results)
+    baseline_metrics = flatten_metrics(baseline)
+    regressions = []
+    for name, baseline_value in baseline_metrics.items():
+        value = current_metrics.get(name)
+        if value is None or not baseline_value:
+            continue
+        change = value / baseline_value - 1
+        if name.endswith('_ms') and change > threshold:
+            regressions.append(f"{name}: {baseline_value:.3f} -> {value:.3f} ms (+{change:.0%})")
+        elif name.endswith('requests_per_second') and change < -threshold:
+            regressions.append(f"{name}: {baseline_value:.1f} -> {value:.1f} requests/s ({change:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the latency and throughput of the prediction API.")
+    parser.add_argument('--model-dir', help='directory containing the model to load (default: a synthetic model)')
+    parser.add_argument('--vocabulary-size', type=int, default=3000, help='number of words of the synthetic texts')
+    parser.add_argument('--distribution', action='append', dest='distributions', choices=text_length_distributions,
+                        help='text-length distribution, can be repeated (default: all)')
+    parser.add_argument('--concurrency', action='append', type=int, dest='concurrency_levels',
+                        help='number of concurrent clients, can be repeated (default: 1, 8 and 32)')
+    parser.add_argument('--requests', type=int, default=500, help='number of requests per concurrency level')
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='size of the prediction cache, disabled by default to measure the model')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative latency increase or throughput drop reported as a regression')
+    args = parser.parse_args()
+
+    vocabulary = make_vocabulary(args.vocabulary_size)
+    with tempfile.TemporaryDirectory() as synthetic_directory:
+        model_directory = args.model_dir
+        if model_directory is None:
+            build_synthetic_model(synthetic_directory, vocabulary)
+            model_directory = synthetic_directory
+        main_module = load_app(model_directory, args.cache_size)
+        results = {
+            'model_directory': args.model_dir,
+            'inference_backend': main_module.inference_executor.backend,
+            'results': run_benchmark(main_module, vocabulary, args.distributions or list(text_length_distributions),
+                                     args.concurrency_levels or [1, 8, 32], args.requests),
+        }
+        main_module.inference_executor.shutdown()
+
+    for distribution, distribution_results in results['results'].items():
+        print(f"{distribution} texts")
+        for batch, stages in distribution_results['stages'].items():
+            timings = ', '.join(f"{stage} {latency['p50_ms']:.3f} ms" for stage, latency in stages.items())
+            print(f"  {batch.replace('_', ' ')} p50: {timings}")
+        for concurrency, load in distribution_results['load'].items():
+            print(f"  {concurrency.replace('_', ' ')}: p50 {load['p50_ms']:.2f} ms, p95 {load['p95_ms']:.2f} ms, "
+                  f"p99 {load['p99_ms']:.2f} ms, {load['requests_per_second']:.0f} requests/s, "
+                  f"{load['errors']} errors")
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_results(results['results'], baseline['results'], args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+from benchmarks.api import compare_results, generate_texts, make_vocabulary  # Functions under test
+
+
+def test_compare_results_reports_regressions_beyond_threshold():
+    """
+    Tests that latencies growing and throughput dropping beyond the threshold are reported,
+    and that smaller changes and metrics missing from either run are not.
+    """
+    baseline = {'short': {'stages': {'batch_1': {'forward': {'p50_ms': 1.0, 'p99_ms': 2.0}}},
+                          'load': {'concurrency_8': {'p50_ms': 10.0, 'requests_per_second': 400.0, 'errors': 0}}}}
+    results = {'short': {'stages': {'batch_1': {'forward': {'p50_ms': 1.1, 'p99_ms': 3.0}}},
+                         'load': {'concurrency_8': {'p50_ms': 9.0, 'requests_per_second': 300.0, 'errors': 0},
+                                  'concurrency_32': {'p50_ms': 50.0, 'requests_per_second': 100.0}}}}
+
+    regressions = compare_results(results, baseline, threshold=0.2)
+
+    # The p99 grew by 50% and the throughput dropped by 25%; the p50 changes are within 20%
+    assert len(regressions) == 2
+    assert regressions[0].startswith('short/stages/batch_1/forward/p99_ms')
+    assert regressions[1].startswith('short/load/concurrency_8/requests_per_second')
+    # Nothing regresses against itself
+    assert compare_results(baseline, baseline, threshold=0.0) == []
+
+
+def test_generate_texts_respects_length_range():
+    """
+    Tests that synthetic texts are reproducible and have a number of words within the range.
+    """
+    vocabulary = make_vocabulary(100)
+    texts = generate_texts(vocabulary, 50, (3, 10), seed=1)
+
+    assert texts == generate_texts(vocabulary, 50, (3, 10), seed=1)  # Same seed, same texts
+    assert all(3 <= len(text.split()) <= 10 for text in texts)
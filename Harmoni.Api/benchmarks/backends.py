@@ -0,0 +1,193 @@
+"""
+Inference backend benchmark of the PyTorch model.
+
+Prepares the model with every backend of `inference_backends` and reports its p50/p99 latency and
+throughput at batch sizes 1, 32 and 256, along with its parity with the eager model. The eager
+model is measured both with its dense forward pass and with the sparse one the API uses.
+
+The model is loaded from a compact artifact or `.pth` bundle in `--model-dir`, or a randomly
+initialized EmotionClassifier of `--input-size` features is used. Inputs are TF-IDF-like sparse
+rows, or the features of the texts of a held-out CSV (`text` and `label` columns) with `--holdout`.
+
+Usage, from the Harmoni.Api directory:
+    python -m benchmarks.backends --model-dir . --holdout ../FastAPIProject1/emotions_test.csv
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import torch
+from scipy import sparse
+
+from EmotionClassifier import EmotionClassifier
+from inference_backends import check_parity, inference_backends, prepare_inference_model
+
+default_batch_sizes = (1, 32, 256)
+
+
+def load_model(model_directory, input_size):
+    """
+    Loads the model to benchmark.
+
+    Returns:
+        tuple: The model in evaluation mode, its featurizer (or None for a random model) and its labels.
+    """
+    artifact_path = os.path.join(model_directory, 'best_emotion_model') if model_directory else None
+    bundle_path = f'{artifact_path}.pth' if artifact_path else None
+    if artifact_path and os.path.isdir(artifact_path):
+        from model_artifact import load_artifact
+
+        artifact = load_artifact(artifact_path)
+        if not artifact['is_pytorch_model']:
+            raise SystemExit(f"{artifact_path} doesn't hold a PyTorch model")
+        return artifact['model'], artifact['featurizer'], artifact['labels']
+    if bundle_path and os.path.exists(bundle_path):
+        from TfidfFeaturizer import TfidfFeaturizer
+
+        bundle = torch.load(bundle_path, map_location=torch.device('cpu'), weights_only=False)
+        model = EmotionClassifier(bundle['input_size'], bundle['num_classes'])
+        model.load_state_dict(bundle['model_state_dict'])
+        return (model.eval(), TfidfFeaturizer.from_vectorizer(bundle['tfidf_vectorizer']),
+                list(bundle['label_encoder'].classes_))
+
+    torch.manual_seed(0)
+    return EmotionClassifier(input_size, 6).eval(), None, None
+
+
+def load_holdout(holdout_path, featurizer, labels):
+    """
+    Featurizes the texts of a held-out CSV file like the API does.
+
+    Returns:
+        tuple: The sparse features and the encoded labels.
+    """
+    import pandas as pd
+    from TextPreprocessor import TextPreprocessor
+    from featurization_spec import load_featurization_spec, spec_stop_words
+
+    holdout_df = pd.read_csv(holdout_path)
+    text_preprocessor = TextPreprocessor.from_nltk(stop_words=spec_stop_words(load_featurization_spec()))
+    features = featurizer.transform(text_preprocessor.tokenize_batch(holdout_df['text']))
+    label_numbers = {label: number for number, label in enumerate(labels)}
+    return features, np.array([label_numbers.get(label, label) for label in holdout_df['label']])
+
+
+def random_features(rows, input_size, nonzeros_per_row=12, seed=0):
+    """
+    Builds L2-normalized sparse rows with about as many non-zeros as a short preprocessed text.
+    """
+    features = sparse.random(rows, input_size, density=min(1.0, nonzeros_per_row / input_size), format='csr',
+                             random_state=seed, dtype=np.float64)
+    row_norms = np.sqrt(features.multiply(features).sum(axis=1)).A1
+    row_norms[row_norms == 0] = 1
+    return sparse.diags(1 / row_norms) @ features
+
+
+def measure_latency(predict, features, batch_size, iterations, warmup=5):
+    """
+    Times the prediction of batches of features.
+
+    Returns:
+        dict: The p50 and p99 latency of a batch, in milliseconds, and the throughput in rows per second.
+    """
+    batches = [features[(start % features.shape[0]):(start % features.shape[0]) + batch_size]
+               for start in range(0, batch_size * iterations, batch_size)]
+    batches = [batch for batch in batches if batch.shape[0] == batch_size] or [features[:batch_size]]
+    with torch.no_grad():
+        for batch in batches[:warmup]:
+            predict(batch)
+        latencies = []
+        for index in range(iterations):
+            batch = batches[index % len(batches)]
+            started = time.perf_counter()
+            predict(batch)
+            latencies.append(time.perf_counter() - started)
+    latencies = np.array(latencies)
+    return {
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'rows_per_second': float(batches[0].shape[0] * len(latencies) / latencies.sum()),
+    }
+
+
+def benchmark_backends(model, features, labels, backends, batch_sizes=default_batch_sizes, iterations=200):
+    """
+    Prepares the model with every backend and measures it.
+
+    Returns:
+        list[dict]: The preparation time, parity and latency of every backend that could be prepared,
+            and the error of the others.
+    """
+    input_size = features.shape[1]
+    results = []
+    candidates = [('eager-sparse', None)] + [(backend, backend) for backend in backends]
+    for name, backend in candidates:
+        started = time.perf_counter()
+        if backend is None:
+            # What the API runs by default: the eager model fed with the sparse features directly
+            def predict(batch):
+                return model.forward_sparse(batch)
+        else:
+            try:
+                inference_model = prepare_inference_model(model, backend, input_size)
+            except Exception as error:
+                results.append({'backend': name, 'error': f'{type(error).__name__}: {error}'})
+                continue
+
+            def predict(batch, inference_model=inference_model):
+                return inference_model(torch.from_numpy(batch.toarray().astype(np.float32)))
+        prepare_seconds = time.perf_counter() - started
+
+        parity = check_parity(model, inference_model, features, labels) if backend else None
+        # Fewer iterations for larger batches, which take longer each
+        latency = {batch_size: measure_latency(predict, features, batch_size,
+                                               max(10, int(iterations / batch_size ** 0.5)))
+                   for batch_size in batch_sizes}
+        results.append({'backend': name, 'prepare_seconds': prepare_seconds, 'parity': parity, 'latency': latency})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the latency of the CPU inference backends.")
+    parser.add_argument('--model-dir', help='directory containing the model to load (default: a random model)')
+    parser.add_argument('--input-size', type=int, default=5000, help='number of features of the random model')
+    parser.add_argument('--holdout', help='CSV file of held-out texts and labels for the parity check')
+    parser.add_argument('--rows', type=int, default=2048, help='number of random rows without --holdout')
+    parser.add_argument('--backend', action='append', dest='backends', choices=inference_backends,
+                        help='backend to measure, can be repeated (default: all)')
+    parser.add_argument('--iterations', type=int, default=200, help='batches timed at batch size 1')
+    parser.add_argument('--threads', type=int, help='number of torch threads')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model, featurizer, labels = load_model(args.model_dir, args.input_size)
+    if args.holdout:
+        if featurizer is None:
+            raise SystemExit("--holdout needs a trained model from --model-dir")
+        features, holdout_labels = load_holdout(args.holdout, featurizer, labels)
+    else:
+        features, holdout_labels = random_features(args.rows, model.fc1.in_features), None
+
+    results = benchmark_backends(model, features, holdout_labels, args.backends or inference_backends,
+                                 iterations=args.iterations)
+    for result in results:
+        if 'error' in result:
+            print(f"{result['backend']}: unavailable ({result['error']})")
+            continue
+        parity = result['parity']
+        parity_text = f", agreement {parity['agreement']:.4f}" if parity else ''
+        print(f"{result['backend']} (prepared in {result['prepare_seconds']:.2f} s{parity_text})")
+        for batch_size, latency in result['latency'].items():
+            print(f"  batch {batch_size:>3}: p50 {latency['p50_ms']:.3f} ms, p99 {latency['p99_ms']:.3f} ms, "
+                  f"{latency['rows_per_second']:.0f} rows/s")
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
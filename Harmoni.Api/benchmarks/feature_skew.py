@@ -0,0 +1,201 @@
+"""
+Training/serving feature skew harness.
+
+Runs a corpus (a CSV file with a `text` column, and optionally a `label` column) through both pipelines
+of a model directory and compares them:
+    - the training pipeline of `emotions.py`: the texts preprocessed in parallel worker processes with the
+      stop words of the featurization spec of the model (or of the spec shipped with the code for models
+      saved without one), then transformed by the fitted vectorizer of the bundle;
+    - the serving pipeline of `main.py`: the model loaded as the API loads it (the compact artifact when
+      there is one), its preprocessor from `create_text_preprocessor` and its featurizer.
+
+It reports the throughput of both pipelines, the share of texts whose features differ, the features
+differing on the most texts, and how often the predictions of the two pipelines disagree.
+
+Usage, from the Harmoni.Api directory:
+    python -m benchmarks.feature_skew --model-dir . --corpus ../FastAPIProject1/emotions.csv --output skew.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from featurization_spec import check_featurization_spec, load_featurization_spec, spec_stop_words
+
+
+def compute_feature_skew(training_features, serving_features, feature_names=None, tolerance=1e-9, top=20):
+    """
+    Compares the features of the same texts computed by the training and serving pipelines.
+
+    Args:
+        training_features (scipy.sparse matrix): The features of the training pipeline, one row per text.
+        serving_features (scipy.sparse matrix): The features of the serving pipeline, in the same order.
+        feature_names (list[str]): The name of every column, or None to name them by index.
+        tolerance (float): The largest absolute difference of a value considered equal.
+        top (int): The number of most skewed features reported.
+
+    Returns:
+        dict: The share of 'rows_skewed', the 'mean_row_l1' distance between the rows, the 'features_skewed'
+            count and the 'top_features', each with its 'feature' name, the 'rows' it differs on and its
+            'mean_abs_difference' over all the rows.
+    """
+    if training_features.shape != serving_features.shape:
+        raise ValueError(f"The pipelines compute {training_features.shape} and {serving_features.shape} features")
+    differences = abs(training_features.tocsr() - serving_features.tocsr()).tocsr()
+    differences.data[differences.data <= tolerance] = 0
+    differences.eliminate_zeros()
+
+    rows = max(differences.shape[0], 1)
+    # Number of texts every feature differs on, and its mean absolute difference
+    rows_per_feature = np.bincount(differences.indices, minlength=differences.shape[1])
+    difference_per_feature = np.asarray(differences.sum(axis=0)).ravel() / rows
+    skewed_features = np.flatnonzero(rows_per_feature)
+    top_features = skewed_features[np.lexsort((-difference_per_feature[skewed_features],
+                                               -rows_per_feature[skewed_features]))][:top]
+    return {
+        'rows_skewed': float(np.mean(np.diff(differences.indptr) > 0)) if differences.shape[0] else 0.0,
+        'mean_row_l1': float(differences.sum() / rows),
+        'features_skewed': len(skewed_features),
+        'top_features': [{'feature': feature_names[column] if feature_names is not None else str(column),
+                          'rows': int(rows_per_feature[column]),
+                          'mean_abs_difference': float(difference_per_feature[column])}
+                         for column in top_features],
+    }
+
+
+def compare_predictions(training_probabilities, serving_probabilities, labels=None):
+    """
+    Compares the predictions of the same texts from the training and serving features.
+
+    Args:
+        training_probabilities (np.ndarray): The (num_texts, num_classes) probabilities from the training features.
+        serving_probabilities (np.ndarray): The probabilities from the serving features.
+        labels (np.ndarray): The true class index of every text, or None.
+
+    Returns:
+        dict: The 'disagreement' rate of the predicted classes, the 'mean_abs_probability_difference' and,
+            with labels, the 'training_accuracy' and 'serving_accuracy'.
+    """
+    training_predictions = training_probabilities.argmax(axis=1)
+    serving_predictions = serving_probabilities.argmax(axis=1)
+    if not len(serving_predictions):
+        return {'disagreement': 0.0, 'mean_abs_probability_difference': 0.0}
+    comparison = {
+        'disagreement': float(np.mean(training_predictions != serving_predictions)),
+        'mean_abs_probability_difference': float(np.abs(training_probabilities - serving_probabilities).mean()),
+    }
+    if labels is not None:
+        comparison['training_accuracy'] = float(np.mean(training_predictions == labels))
+        comparison['serving_accuracy'] = float(np.mean(serving_predictions == labels))
+    return comparison
+
+
+def run_training_pipeline(training_model, texts, workers=None):
+    """
+    Featurizes texts like the training script: preprocessing in parallel, then the fitted vectorizer.
+
+    Returns:
+        tuple: The features and the elapsed seconds.
+    """
+    from preprocessing_cache import preprocess_parallel
+
+    spec = training_model['featurization_spec'] or load_featurization_spec()
+    started = time.perf_counter()
+    processed_texts, _ = preprocess_parallel(texts, spec_stop_words(spec), workers)
+    features = training_model['tfidf_vectorizer'].transform(processed_texts)
+    return features, time.perf_counter() - started
+
+
+def run_serving_pipeline(serving_model, text_preprocessor, featurizer, texts, batch_size=256):
+    """
+    Featurizes texts like the API, in batches of its maximum batch size.
+
+    Returns:
+        tuple: The features and the elapsed seconds.
+    """
+    from scipy import sparse
+
+    from model_loader import featurize
+
+    started = time.perf_counter()
+    batches = [featurize(serving_model, featurizer, text_preprocessor.tokenize_batch(texts[start:start + batch_size]))
+               for start in range(0, len(texts), batch_size)]
+    features = sparse.vstack(batches).tocsr()
+    return features, time.perf_counter() - started
+
+
+def feature_names_of(vectorizer):
+    """
+    Returns the term of every column of a vectorizer, or None when it hashes the terms.
+    """
+    if hasattr(vectorizer, 'get_feature_names_out') and hasattr(vectorizer, 'vocabulary_'):
+        return vectorizer.get_feature_names_out().tolist()
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the skew between the training and serving features.")
+    parser.add_argument('--model-dir', default='.', help='directory containing the model bundle (default: .)')
+    parser.add_argument('--corpus', required=True, help='CSV file of the texts to featurize')
+    parser.add_argument('--text-column', default='text', help='column holding the texts')
+    parser.add_argument('--label-column', default='label', help='column holding the labels, if present')
+    parser.add_argument('--rows', type=int, help='number of rows of the corpus to use (default: all)')
+    parser.add_argument('--workers', type=int, help='preprocessing worker processes (default: the CPU count)')
+    parser.add_argument('--top', type=int, default=20, help='number of most skewed features reported')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    from model_loader import create_featurizer, create_text_preprocessor, load_model, predict_probabilities
+
+    corpus_df = pd.read_csv(args.corpus, nrows=args.rows)
+    texts = corpus_df[args.text_column].astype(str).tolist()
+
+    # The bundle holds the fitted vectorizer of the training; the API serves the compact artifact when there is one
+    training_model = load_model(args.model_dir, compact=False)
+    serving_model = load_model(args.model_dir)
+    text_preprocessor = create_text_preprocessor(serving_model)
+    featurizer = create_featurizer(serving_model)
+
+    training_features, training_seconds = run_training_pipeline(training_model, texts, args.workers)
+    serving_features, serving_seconds = run_serving_pipeline(serving_model, text_preprocessor, featurizer, texts)
+
+    labels = None
+    if args.label_column in corpus_df:
+        label_indices = {str(label): index for index, label in enumerate(serving_model['labels'])}
+        labels = np.array([label_indices.get(str(label), -1) for label in corpus_df[args.label_column]])
+    results = {
+        'model': {'training': training_model['path'], 'serving': serving_model['path']},
+        'texts': len(texts),
+        'spec_differences': check_featurization_spec(serving_model['featurization_spec'], load_featurization_spec(),
+                                                     text_preprocessor, featurizer),
+        'throughput_texts_per_second': {'training': len(texts) / training_seconds,
+                                        'serving': len(texts) / serving_seconds},
+        'features': compute_feature_skew(training_features, serving_features,
+                                         feature_names_of(training_model['tfidf_vectorizer']), top=args.top),
+        'predictions': compare_predictions(predict_probabilities(training_model, training_features),
+                                           predict_probabilities(serving_model, serving_features), labels),
+    }
+
+    print(f"{results['texts']} texts: training pipeline {results['throughput_texts_per_second']['training']:.0f} "
+          f"texts/s, serving pipeline {results['throughput_texts_per_second']['serving']:.0f} texts/s")
+    for difference in results['spec_differences']:
+        print(f"Spec difference: {difference}")
+    skew = results['features']
+    print(f"Features differ on {skew['rows_skewed']:.2%} of the texts ({skew['features_skewed']} features, "
+          f"mean L1 distance {skew['mean_row_l1']:.4f})")
+    for feature in skew['top_features']:
+        print(f"  {feature['feature']}: {feature['rows']} texts, mean difference {feature['mean_abs_difference']:.5f}")
+    predictions = results['predictions']
+    accuracy = (f", accuracy {predictions['training_accuracy']:.4f} (training features) vs "
+                f"{predictions['serving_accuracy']:.4f} (serving features)" if labels is not None else '')
+    print(f"Predictions disagree on {predictions['disagreement']:.2%} of the texts{accuracy}")
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import numpy as np  # For building features and probabilities
+from scipy import sparse  # Sparse feature matrices
+
+from benchmarks.feature_skew import compare_predictions, compute_feature_skew  # Functions under test
+
+
+def test_compute_feature_skew_ranks_the_features_differing_on_most_texts():
+    """
+    Tests that the texts and features whose values differ are counted, ignoring differences below the tolerance.
+    """
+    training_features = sparse.csr_matrix(np.array([[0.5, 0.5, 0.0], [0.0, 1.0, 0.0], [0.2, 0.0, 0.8]]))
+    # The first feature is missing from two texts when serving, the last one differs below the tolerance
+    serving_features = sparse.csr_matrix(np.array([[0.0, 0.5, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 0.8 + 1e-12]]))
+
+    skew = compute_feature_skew(training_features, serving_features, feature_names=['not', 'happy', 'sad'])
+    assert skew['rows_skewed'] == 2 / 3
+    assert skew['features_skewed'] == 1
+    assert skew['top_features'][0]['feature'] == 'not'
+    assert skew['top_features'][0]['rows'] == 2
+    # Assert that identical features have no skew
+    assert compute_feature_skew(training_features, training_features)['rows_skewed'] == 0
+
+
+def test_compare_predictions_counts_disagreements():
+    """
+    Tests that the predictions of the two pipelines are compared, with the accuracy of each.
+    """
+    training_probabilities = np.array([[0.9, 0.1], [0.2, 0.8]])
+    serving_probabilities = np.array([[0.4, 0.6], [0.2, 0.8]])
+
+    comparison = compare_predictions(training_probabilities, serving_probabilities, labels=np.array([0, 1]))
+    assert comparison['disagreement'] == 0.5
+    assert comparison['training_accuracy'] == 1.0
+    assert comparison['serving_accuracy'] == 0.5
@@ -0,0 +1,182 @@
+"""
+Feature pipeline benchmark: the TF-IDF vocabulary against hashed features.
+
+Preprocesses the texts of a CSV file (`text` and `label` columns) like the training script, then,
+for the TfidfVectorizer and the hashing pipeline of `make_hashing_vectorizer`, reports:
+    - the test accuracy of Logistic Regression, Complement Naive Bayes and the EmotionClassifier network,
+      trained on the same 80/20 split as the training script;
+    - the size of the pickled vectorizer and of the compact artifact of the Logistic Regression;
+    - the load time of the pickled vectorizer and of the artifact;
+    - the transform throughput of the vectorizer (joined texts) and of the featurizer the API uses (token lists).
+
+Usage, from the Harmoni.Api directory:
+    python -m benchmarks.features --dataset ../FastAPIProject1/emotions.csv --output features.json
+"""
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+# Feature pipelines compared, in the order they are reported
+feature_modes = ('tfidf', 'hashing')
+
+
+def make_vectorizer(feature_mode, stop_words, max_features=5000, hashing_features=2 ** 14):
+    """
+    Creates the unfitted vectorizer of a feature mode, with the options of the featurization spec.
+    """
+    from featurization_spec import create_vectorizer, load_featurization_spec
+
+    spec = load_featurization_spec()
+    spec['features'].update(mode=feature_mode, max_features=max_features, hashing_features=hashing_features)
+    return create_vectorizer(spec, stop_words)
+
+
+def directory_size(path):
+    """
+    Returns the total size of the files of a directory, in bytes.
+    """
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def best_time(function, repeats):
+    """
+    Returns the shortest duration of several calls of a function, in seconds.
+    """
+    durations = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return min(durations)
+
+
+def benchmark_feature_mode(feature_mode, train_tokens, test_tokens, train_labels, test_labels, label_encoder,
+                           stop_words, output_directory, max_features=5000, hashing_features=2 ** 14, epochs=5,
+                           repeats=5):
+    """
+    Trains the candidate models on the features of a feature mode and measures its vectorizer.
+
+    Returns:
+        dict: The 'columns' of the features, the 'accuracy' of every model, the 'size_bytes' and 'load_seconds'
+            of the pickled vectorizer and artifact, and the 'transform_rows_per_second' of the vectorizer
+            and featurizer.
+    """
+    import torch
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.naive_bayes import ComplementNB
+
+    from EmotionClassifier import EmotionClassifier
+    from model_artifact import export_artifact, load_artifact
+    from model_training import train_candidates
+    from TfidfFeaturizer import TfidfFeaturizer
+
+    train_texts = [' '.join(tokens) for tokens in train_tokens]
+    test_texts = [' '.join(tokens) for tokens in test_tokens]
+    vectorizer = make_vectorizer(feature_mode, stop_words, max_features, hashing_features)
+    started = time.perf_counter()
+    train_features = vectorizer.fit_transform(train_texts)
+    fit_seconds = time.perf_counter() - started
+    test_features = vectorizer.transform(test_texts)
+
+    # --- Accuracy ---
+    classes = np.unique(train_labels)
+    models = {
+        "Logistic Regression": LogisticRegression(max_iter=200),
+        "Complement Naive Bayes": ComplementNB(),
+        "Artificial Neural Network": EmotionClassifier(train_features.shape[1], len(label_encoder.classes_)),
+    }
+    model_results = train_candidates(models, train_features, train_labels, test_features, classes,
+                                     torch.device('cpu'), workers=0, network_options={'max_epochs': epochs},
+                                     report=lambda message: None)
+    accuracy = {model_name: float(np.mean(results['predictions'] == test_labels))
+                for model_name, results in model_results.items()}
+
+    # --- Size and load time ---
+    pickle_buffer = io.BytesIO()
+    joblib.dump(vectorizer, pickle_buffer)
+    pickle_path = os.path.join(output_directory, f'{feature_mode}_vectorizer.joblib')
+    with open(pickle_path, 'wb') as pickle_file:
+        pickle_file.write(pickle_buffer.getvalue())
+    artifact_path = os.path.join(output_directory, f'{feature_mode}_artifact')
+    export_artifact(artifact_path, model_results["Logistic Regression"]['model'], vectorizer, label_encoder)
+
+    # --- Transform throughput ---
+    featurizer = TfidfFeaturizer.from_vectorizer(vectorizer)
+    vectorizer_seconds = best_time(lambda: vectorizer.transform(test_texts), repeats)
+    # A new featurizer every time, so its memoized token analysis doesn't carry over between repeats
+    featurizer_seconds = best_time(lambda: TfidfFeaturizer.from_vectorizer(vectorizer).transform(test_tokens),
+                                   repeats)
+    return {
+        'columns': train_features.shape[1],
+        'fit_seconds': fit_seconds,
+        'accuracy': accuracy,
+        'size_bytes': {'vectorizer_pickle': len(pickle_buffer.getvalue()), 'artifact': directory_size(artifact_path)},
+        'load_seconds': {'vectorizer_pickle': best_time(lambda: joblib.load(pickle_path), repeats),
+                         'artifact': best_time(lambda: load_artifact(artifact_path), repeats),
+                         'artifact_mmap': best_time(lambda: load_artifact(artifact_path, mmap=True), repeats)},
+        'transform_rows_per_second': {'vectorizer': len(test_texts) / vectorizer_seconds,
+                                      'featurizer': len(test_tokens) / featurizer_seconds},
+        'featurizer_parity': bool(np.allclose(featurizer.transform(test_tokens).toarray(), test_features.toarray())),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the TF-IDF vocabulary with hashed features.")
+    parser.add_argument('--dataset', default='../FastAPIProject1/emotions.csv',
+                        help='CSV file of texts and labels (default: the training dataset)')
+    parser.add_argument('--rows', type=int, help='number of rows of the dataset to use (default: all)')
+    parser.add_argument('--max-features', type=int, default=5000, help='vocabulary size of the TfidfVectorizer')
+    parser.add_argument('--hashing-features', type=int, default=2 ** 14, help='number of hashed feature columns')
+    parser.add_argument('--epochs', type=int, default=5, help='maximum number of epochs of the network')
+    parser.add_argument('--repeats', type=int, default=5, help='number of timed loads and transforms')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    import pandas as pd
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import LabelEncoder
+
+    from TextPreprocessor import TextPreprocessor
+    from featurization_spec import load_featurization_spec, spec_stop_words
+
+    dataset_df = pd.read_csv(args.dataset, nrows=args.rows)
+    text_preprocessor = TextPreprocessor.from_nltk(stop_words=spec_stop_words(load_featurization_spec()))
+    token_lists = text_preprocessor.tokenize_batch(dataset_df['text'])
+    label_encoder = LabelEncoder()
+    encoded_labels = label_encoder.fit_transform(dataset_df['label'])
+    # The same split as the training script
+    train_tokens, test_tokens, train_labels, test_labels = train_test_split(token_lists, encoded_labels,
+                                                                          test_size=0.2, random_state=42)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as output_directory:
+        for feature_mode in feature_modes:
+            results[feature_mode] = benchmark_feature_mode(
+                feature_mode, train_tokens, test_tokens, train_labels, test_labels, label_encoder,
+                text_preprocessor.stop_words, output_directory, max_features=args.max_features,
+                hashing_features=args.hashing_features, epochs=args.epochs, repeats=args.repeats)
+
+    for feature_mode, result in results.items():
+        accuracy = ', '.join(f"{model_name} {value:.4f}" for model_name, value in result['accuracy'].items())
+        print(f"{feature_mode} ({result['columns']} columns, featurizer parity {result['featurizer_parity']})")
+        print(f"  accuracy: {accuracy}")
+        print(f"  size: vectorizer pickle {result['size_bytes']['vectorizer_pickle'] / 1024:.0f} KiB, "
+              f"artifact {result['size_bytes']['artifact'] / 1024:.0f} KiB")
+        print(f"  load: vectorizer pickle {result['load_seconds']['vectorizer_pickle'] * 1000:.1f} ms, "
+              f"artifact {result['load_seconds']['artifact'] * 1000:.1f} ms, "
+              f"memory-mapped artifact {result['load_seconds']['artifact_mmap'] * 1000:.1f} ms")
+        print(f"  transform: vectorizer {result['transform_rows_per_second']['vectorizer']:.0f} rows/s, "
+              f"featurizer {result['transform_rows_per_second']['featurizer']:.0f} rows/s")
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Startup-time benchmark of the API.
+
+Imports `main` in fresh interpreters, as a new replica would, and reports the wall time until
+the model is ready along with the time of every startup phase recorded by `main.startup_timings`
+(imports, NLTK resources, model load, preprocessor, featurizer). Passing several model
+directories compares them, e.g. a compact artifact against the pickled bundles.
+
+Usage, from the Harmoni.Api directory:
+    python -m benchmarks.startup --model-dir models/compact --model-dir models/legacy --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Script run in every fresh interpreter, printing the phase timings of the import
+startup_script = "import json, main; print(json.dumps(main.startup_timings))"
+
+
+def measure_startup(model_directory, offline=True):
+    """
+    Imports the API in a fresh interpreter.
+
+    Args:
+        model_directory (str): The directory the API loads its model from.
+        offline (bool): Whether to start in offline mode, without calling the NLTK downloader.
+
+    Returns:
+        dict: The wall time of the whole startup, in seconds, and the time of every phase.
+    """
+    environment = dict(os.environ, HARMONI_MODEL_DIR=model_directory, HARMONI_OFFLINE='1' if offline else '0')
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', startup_script], env=environment,
+                               capture_output=True, text=True, check=True)
+    wall_seconds = time.perf_counter() - started
+    phases = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {'wall_seconds': wall_seconds, 'phases': phases}
+
+
+def benchmark_startup(model_directory, runs, offline=True):
+    """
+    Measures the startup several times and summarizes it.
+
+    Returns:
+        dict: The median and maximum wall time, and the median time of every phase, in seconds.
+    """
+    measurements = [measure_startup(model_directory, offline) for _ in range(runs)]
+    wall_times = [measurement['wall_seconds'] for measurement in measurements]
+    return {
+        'model_directory': model_directory,
+        'runs': runs,
+        'wall_seconds_median': statistics.median(wall_times),
+        'wall_seconds_max': max(wall_times),
+        'phase_seconds_median': {
+            phase: statistics.median(measurement['phases'][phase] for measurement in measurements)
+            for phase in measurements[0]['phases']
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the startup time of the API.")
+    parser.add_argument('--model-dir', action='append', dest='model_directories',
+                        help='directory containing the model to load, can be repeated (default: .)')
+    parser.add_argument('--runs', type=int, default=5, help='number of fresh interpreters per model directory')
+    parser.add_argument('--online', action='store_true', help='allow the NLTK downloader for missing resources')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = [benchmark_startup(model_directory, args.runs, offline=not args.online)
+               for model_directory in args.model_directories or ['.']]
+    for result in results:
+        phases = ', '.join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in result['phase_seconds_median'].items())
+        print(f"{result['model_directory']}: {result['wall_seconds_median']:.2f} s median ({phases})")
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+"""
+Offline bulk scoring of large CSV or Parquet corpora with the model the API serves.
+
+The input is streamed in chunks of `--chunk-size` rows, so the corpus never has to fit in memory.
+Every chunk goes through the same batched preprocess, featurize and predict steps as the API, in a
+pool of worker processes that each load the model once, and its predictions are appended to the
+output in input order: the row number, the columns kept from the input, the predicted emotion and
+number, and the probability of every emotion.
+
+After every chunk written, a checkpoint records how far the scoring got. Running the same command
+again after an interruption resumes after the last chunk written; `--restart` starts over.
+
+CSV outputs are a single file. Parquet outputs (paths ending in `.parquet`) are a directory with
+one part file per chunk, which pandas and pyarrow read as a single dataset. Parquet needs pyarrow.
+
+Usage, from the Harmoni.Api directory:
+    python bulk_score.py messages.csv scores.csv --model-dir . --keep-column id --workers 8
+"""
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model_loader import (create_featurizer, create_text_preprocessor, featurize, get_class_labels, load_model,
+                          predict_probabilities)
+
+# Model, preprocessor and featurizer of the current process, set by initialize_worker
+worker_state = {}
+
+
+def initialize_worker(model_directory):
+    """
+    Loads the model once in a worker process, or in the main process when scoring inline.
+
+    Args:
+        model_directory (str): The directory containing the model.
+    """
+    model_data = load_model(model_directory)
+    if model_data['is_pytorch_model']:
+        import torch
+
+        # Every worker gets a single thread to avoid oversubscribing the CPUs shared with the other workers
+        torch.set_num_threads(1)
+    worker_state.update(
+        model_data=model_data,
+        text_preprocessor=create_text_preprocessor(model_data),
+        featurizer=create_featurizer(model_data),
+    )
+
+
+def score_texts(texts, inference_batch_size=1024):
+    """
+    Predicts the emotion probabilities of texts with the model of the current process.
+
+    Args:
+        texts (list[str]): The texts to score.
+        inference_batch_size (int): The number of texts featurized and predicted at once.
+
+    Returns:
+        np.ndarray: The (num_texts, num_classes) probabilities.
+    """
+    model_data = worker_state['model_data']
+    token_lists = worker_state['text_preprocessor'].tokenize_batch(texts)
+    probabilities = [
+        predict_probabilities(model_data, featurize(model_data, worker_state['featurizer'],
+                                                    token_lists[start:start + inference_batch_size]))
+        for start in range(0, len(token_lists), inference_batch_size)
+    ]
+    num_classes = len(model_data['labels'])
+    return np.vstack(probabilities) if probabilities else np.empty((0, num_classes))
+
+
+def read_chunks(input_path, chunk_size, columns):
+    """
+    Reads a CSV or Parquet file in chunks.
+
+    Args:
+        input_path (str): The file to read, Parquet if it ends in `.parquet`, CSV otherwise.
+        chunk_size (int): The number of rows of every chunk (the last one can be smaller).
+        columns (list[str]): The columns to read.
+
+    Yields:
+        pd.DataFrame: The chunks, in order.
+    """
+    if input_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        for record_batch in pq.ParquetFile(input_path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield record_batch.to_pandas()
+    else:
+        yield from pd.read_csv(input_path, usecols=columns, chunksize=chunk_size)
+
+
+def build_output_chunk(chunk, probabilities, first_row, keep_columns, class_labels):
+    """
+    Builds the output rows of a chunk from its predicted probabilities.
+
+    Args:
+        chunk (pd.DataFrame): The input chunk.
+        probabilities (np.ndarray): The probabilities of every row of the chunk.
+        first_row (int): The row number of the first row of the chunk in the input.
+        keep_columns (list[str]): The input columns copied to the output.
+        class_labels (list[tuple[str, int]]): The emotion and emotion number of every class, see `get_class_labels`.
+
+    Returns:
+        pd.DataFrame: The output rows.
+    """
+    # The classes are labeled from the label encoder of the model, like the API does
+    class_indices = probabilities.argmax(axis=1) if len(probabilities) else np.empty(0, dtype=np.int64)
+    output = pd.DataFrame({'row': np.arange(first_row, first_row + len(chunk))})
+    for column in keep_columns:
+        output[column] = chunk[column].to_numpy()
+    output['emotion'] = [class_labels[class_index][0] for class_index in class_indices]
+    output['number'] = np.array([number for _, number in class_labels], dtype=np.int64)[class_indices]
+    for class_index, (emotion_label, _) in enumerate(class_labels):
+        output[f'probability_{emotion_label}'] = probabilities[:, class_index]
+    return output
+
+
+class CsvOutput:
+    """
+    CSV output file appended to chunk by chunk. Its size after every chunk is the checkpoint
+    position: resuming truncates whatever was written after it.
+    """
+
+    def __init__(self, path, position):
+        """
+        Args:
+            path (str): The output file.
+            position (int): The size of the output written so far, 0 to start a new file.
+
+        Raises:
+            ValueError: If resuming and the file is missing or shorter than the output written so far.
+        """
+        if position:
+            size = os.path.getsize(path) if os.path.exists(path) else None
+            if size is None or size < position:
+                found = 'is missing' if size is None else f'has {size} bytes'
+                raise ValueError(f"Output {path} {found} but the checkpoint recorded {position} bytes written, "
+                                 f"pass --restart to start over")
+        self.file = open(path, 'r+b' if position else 'wb')
+        self.file.truncate(position)
+        self.file.seek(position)
+        self.write_header = position == 0
+
+    def write(self, output_chunk, chunk_index):
+        """
+        Appends a chunk and returns the new position once it is on disk.
+        """
+        output_chunk.to_csv(self.file, header=self.write_header, index=False)
+        self.write_header = False
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetOutput:
+    """
+    Parquet dataset directory with one part file per chunk.
+    """
+
+    def __init__(self, path, position):
+        """
+        Args:
+            path (str): The output directory.
+            position (int): The number of chunks written so far, 0 to start a new dataset.
+
+        Raises:
+            ValueError: If resuming and part files written before the checkpoint are missing.
+        """
+        self.path = path
+        missing = [chunk_index for chunk_index in range(position)
+                   if not os.path.exists(os.path.join(path, f'part-{chunk_index:06d}.parquet'))]
+        if missing:
+            raise ValueError(f"Output {path} is missing {len(missing)} of the {position} part files recorded by the "
+                             f"checkpoint, pass --restart to start over")
+        os.makedirs(path, exist_ok=True)
+        for file_name in os.listdir(path):
+            # Remove the parts after the checkpoint, e.g. one written when the scoring was interrupted
+            if file_name.startswith('part-') and int(file_name[5:].split('.')[0]) >= position:
+                os.remove(os.path.join(path, file_name))
+
+    def write(self, output_chunk, chunk_index):
+        """
+        Writes the part file of a chunk and returns the number of chunks written.
+        """
+        part_path = os.path.join(self.path, f'part-{chunk_index:06d}.parquet')
+        output_chunk.to_parquet(f'{part_path}.tmp', index=False)
+        os.replace(f'{part_path}.tmp', part_path)
+        return chunk_index + 1
+
+    def close(self):
+        pass
+
+
+def load_checkpoint(checkpoint_path, expected):
+    """
+    Loads the checkpoint of a previous run of the same scoring.
+
+    Args:
+        checkpoint_path (str): The checkpoint file.
+        expected (dict): The settings the checkpoint must have been written with.
+
+    Returns:
+        dict: The checkpoint, or None if there is none.
+
+    Raises:
+        ValueError: If the checkpoint was written by a different scoring.
+    """
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    for key, value in expected.items():
+        if checkpoint.get(key) != value:
+            raise ValueError(f"Checkpoint {checkpoint_path} was written with {key}={checkpoint.get(key)!r} instead of "
+                             f"{value!r}, pass --restart to start over")
+    return checkpoint
+
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    """
+    Writes a checkpoint atomically, so an interruption never leaves a partial one.
+    """
+    with open(f'{checkpoint_path}.tmp', 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, indent=2)
+    os.replace(f'{checkpoint_path}.tmp', checkpoint_path)
+
+
+def score_file(input_path, output_path, model_directory='.', text_column='text', keep_columns=(), chunk_size=10000,
+               workers=None, checkpoint_path=None, restart=False, report=print):
+    """
+    Scores every row of a CSV or Parquet file, resuming from the checkpoint of a previous run.
+
+    Args:
+        input_path (str): The file to score.
+        output_path (str): The file (CSV) or directory (Parquet) to write the predictions to.
+        model_directory (str): The directory containing the model.
+        text_column (str): The column holding the texts.
+        keep_columns (iterable[str]): Input columns copied to the output, e.g. an id.
+        chunk_size (int): The number of rows read, scored and written at once.
+        workers (int): The number of worker processes, 0 to score in the current process. Defaults to the CPU count.
+        checkpoint_path (str): The checkpoint file. Defaults to the output path followed by `.checkpoint.json`.
+        restart (bool): Whether to ignore an existing checkpoint and start over.
+        report (callable): Function called with a progress message after every chunk.
+
+    Returns:
+        dict: The number of rows scored in total and by this run, and the rows per second of this run.
+    """
+    keep_columns = list(keep_columns)
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    checkpoint_path = checkpoint_path or f'{output_path}.checkpoint.json'
+    model_data = load_model(model_directory)
+    model_version = model_data['version']
+    class_labels = get_class_labels(model_data)
+    settings = {'input': os.path.abspath(input_path), 'output': os.path.abspath(output_path),
+                'chunk_size': chunk_size, 'text_column': text_column, 'keep_columns': keep_columns,
+                'model_version': model_version}
+    checkpoint = None if restart else load_checkpoint(checkpoint_path, settings)
+    chunks_done = checkpoint['chunks_done'] if checkpoint else 0
+    rows_done = checkpoint['rows_done'] if checkpoint else 0
+    output_class = ParquetOutput if output_path.endswith('.parquet') else CsvOutput
+    output = output_class(output_path, checkpoint['output_position'] if checkpoint else 0)
+    if checkpoint:
+        report(f"Resuming after {rows_done} rows ({chunks_done} chunks)")
+
+    pool = None
+    if workers > 0:
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=initialize_worker, initargs=(model_directory,))
+    else:
+        initialize_worker(model_directory)
+
+    started = time.perf_counter()
+    rows_scored = 0
+    # Chunks being scored, in input order, bounded so that reading doesn't run ahead of the workers
+    pending = collections.deque()
+
+    def write_next():
+        nonlocal chunks_done, rows_done, rows_scored
+        chunk, probabilities = pending.popleft()
+        probabilities = probabilities.result() if pool is not None else probabilities
+        output_chunk = build_output_chunk(chunk, probabilities, rows_done, keep_columns, class_labels)
+        output_position = output.write(output_chunk, chunks_done)
+        chunks_done += 1
+        rows_done += len(chunk)
+        rows_scored += len(chunk)
+        save_checkpoint(checkpoint_path, {**settings, 'chunks_done': chunks_done, 'rows_done': rows_done,
+                                          'output_position': output_position})
+        elapsed = time.perf_counter() - started
+        report(f"{rows_done} rows scored, {rows_scored / elapsed:.0f} rows/s")
+
+    try:
+        columns = [text_column] + [column for column in keep_columns if column != text_column]
+        for chunk_index, chunk in enumerate(read_chunks(input_path, chunk_size, columns)):
+            if chunk_index < chunks_done:
+                # Already scored by a previous run
+                continue
+            texts = chunk[text_column].fillna('').astype(str).tolist()
+            pending.append((chunk, pool.submit(score_texts, texts) if pool is not None else score_texts(texts)))
+            # Inline scoring writes every chunk right away, a pool keeps two chunks per worker in flight
+            if len(pending) > 2 * workers:
+                write_next()
+        while pending:
+            write_next()
+    finally:
+        output.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    summary = {'rows': rows_done, 'rows_scored': rows_scored, 'seconds': elapsed,
+               'rows_per_second': rows_scored / elapsed if elapsed else 0.0}
+    report(f"Scored {rows_scored} rows in {elapsed:.1f} s ({summary['rows_per_second']:.0f} rows/s), "
+           f"{rows_done} rows in {output_path}")
+    return summary
+
+
+def main():
+    """
+    Scores a CSV or Parquet file of texts with the model the API serves.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('input', help='the CSV or .parquet file to score')
+    parser.add_argument('output', help='the CSV file, or .parquet directory, to write the predictions to')
+    parser.add_argument('--model-dir', default=os.getenv('HARMONI_MODEL_DIR', '.'),
+                        help='directory containing the model (default: $HARMONI_MODEL_DIR or .)')
+    parser.add_argument('--text-column', default='text', help='column holding the texts (default: text)')
+    parser.add_argument('--keep-column', action='append', dest='keep_columns', default=[],
+                        help='input column copied to the output, can be repeated')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='number of rows scored at once')
+    parser.add_argument('--workers', type=int, help='number of worker processes, 0 to score in this process '
+                                                    '(default: the CPU count)')
+    parser.add_argument('--checkpoint', help='checkpoint file (default: the output path + .checkpoint.json)')
+    parser.add_argument('--restart', action='store_true', help='ignore an existing checkpoint and start over')
+    args = parser.parse_args()
+
+    try:
+        score_file(args.input, args.output, model_directory=args.model_dir, text_column=args.text_column,
+                   keep_columns=args.keep_columns, chunk_size=args.chunk_size, workers=args.workers,
+                   checkpoint_path=args.checkpoint, restart=args.restart,
+                   report=lambda message: print(message, file=sys.stderr))
+    except ValueError as error:
+        sys.exit(str(error))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+from unittest.mock import patch  # To interrupt the scoring
+
+import numpy as np  # For comparing the probabilities
+import pandas as pd  # To write the input and read the output
+import pytest  # Testing framework
+import torch  # To create the model
+from sklearn.feature_extraction.text import TfidfVectorizer  # For fitting the model vectorizer
+from sklearn.preprocessing import LabelEncoder  # For encoding the labels
+
+import bulk_score  # Module under test
+from EmotionClassifier import EmotionClassifier  # The model scored
+from model_artifact import export_artifact  # To save the model as the API loads it
+
+words = ['happy', 'sad', 'angry', 'scared', 'love', 'wow', 'day', 'night', 'friend', 'work']
+
+
+@pytest.fixture
+def model_directory(tmp_path):
+    """
+    Pytest fixture exporting a small EmotionClassifier artifact, with the lemmas of its whole vocabulary.
+    """
+    torch.manual_seed(0)
+    tfidf_vectorizer = TfidfVectorizer().fit([' '.join(words)])
+    model = EmotionClassifier(len(tfidf_vectorizer.vocabulary_), 6).eval()
+    export_artifact(str(tmp_path / 'best_emotion_model'), model, tfidf_vectorizer, LabelEncoder().fit(range(6)),
+                    lemma_table={word: word for word in words}, preprocessing_stop_words=['the', 'a'])
+    return str(tmp_path)
+
+
+@pytest.fixture
+def input_path(tmp_path):
+    """
+    Pytest fixture writing a CSV file of 25 texts with an id column.
+    """
+    rng = np.random.default_rng(0)
+    texts = [' '.join(rng.choice(words + ['the', 'a'], size=5)) for _ in range(25)]
+    path = tmp_path / 'messages.csv'
+    pd.DataFrame({'id': [f'm{index}' for index in range(25)], 'text': texts}).to_csv(path, index=False)
+    return str(path)
+
+
+def test_score_file_writes_every_row_in_order(tmp_path, model_directory, input_path):
+    """
+    Tests that every row gets a prediction and probabilities summing to 1, in input order,
+    matching the scores of the whole file at once.
+    """
+    output_path = str(tmp_path / 'scores.csv')
+    summary = bulk_score.score_file(input_path, output_path, model_directory, keep_columns=['id'], chunk_size=10,
+                                    workers=0, report=lambda message: None)
+    output = pd.read_csv(output_path)
+
+    assert summary['rows'] == summary['rows_scored'] == 25
+    assert output['row'].tolist() == list(range(25))
+    assert output['id'].tolist() == [f'm{index}' for index in range(25)]  # The kept column follows the rows
+    probabilities = output.filter(like='probability_').to_numpy()
+    assert probabilities.shape == (25, 6)
+    assert np.allclose(probabilities.sum(axis=1), 1)
+    assert (output['number'] == probabilities.argmax(axis=1)).all()
+    # Scoring in chunks gives the same probabilities as scoring everything at once
+    expected = bulk_score.score_texts(pd.read_csv(input_path)['text'].tolist())
+    assert np.allclose(probabilities, expected, atol=1e-6)
+
+
+def test_score_file_resumes_after_interruption(tmp_path, model_directory, input_path):
+    """
+    Tests that a scoring interrupted after some chunks resumes from its checkpoint and
+    produces the same output as an uninterrupted one.
+    """
+    expected_path = str(tmp_path / 'expected.csv')
+    bulk_score.score_file(input_path, expected_path, model_directory, chunk_size=10, workers=0,
+                          report=lambda message: None)
+
+    output_path = str(tmp_path / 'scores.csv')
+    score_texts = bulk_score.score_texts
+    calls = []
+
+    def interrupted_score_texts(texts):
+        calls.append(len(texts))
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return score_texts(texts)
+
+    # Interrupt the scoring of the second chunk
+    with patch('bulk_score.score_texts', interrupted_score_texts), pytest.raises(KeyboardInterrupt):
+        bulk_score.score_file(input_path, output_path, model_directory, chunk_size=10, workers=0,
+                              report=lambda message: None)
+    summary = bulk_score.score_file(input_path, output_path, model_directory, chunk_size=10, workers=0,
+                                    report=lambda message: None)
+
+    assert summary['rows_scored'] == 15  # Only the chunks after the checkpoint were scored again
+    pd.testing.assert_frame_equal(pd.read_csv(output_path), pd.read_csv(expected_path))
+    # A different chunk size can't resume from the checkpoint
+    with pytest.raises(ValueError):
+        bulk_score.score_file(input_path, output_path, model_directory, chunk_size=5, workers=0)
+
+
+def test_score_file_rejects_a_checkpoint_without_its_output(tmp_path, model_directory, input_path):
+    """
+    Tests that resuming fails with a ValueError when the output of the checkpoint was removed or cut short,
+    and that --restart scores everything again.
+    """
+    output_path = tmp_path / 'scores.csv'
+    bulk_score.score_file(input_path, str(output_path), model_directory, chunk_size=10, workers=0,
+                          report=lambda message: None)
+
+    output_path.write_text(output_path.read_text()[:100])  # Cut the output short
+    with pytest.raises(ValueError, match='--restart'):
+        bulk_score.score_file(input_path, str(output_path), model_directory, chunk_size=10, workers=0)
+    output_path.unlink()  # Remove the output
+    with pytest.raises(ValueError, match='is missing'):
+        bulk_score.score_file(input_path, str(output_path), model_directory, chunk_size=10, workers=0)
+
+    summary = bulk_score.score_file(input_path, str(output_path), model_directory, chunk_size=10, workers=0,
+                                    restart=True, report=lambda message: None)
+    assert summary['rows_scored'] == 25  # Assert that the restart scored every row
+
+
+class PredictOnlyModel:
+    """
+    A model without scores, predicting the class number stored for every row.
+    """
+
+    def __init__(self, predictions):
+        self.predictions = np.asarray(predictions)
+
+    def predict(self, features):
+        return self.predictions[:features.shape[0]]
+
+
+def test_models_without_scores_give_their_predicted_class():
+    """
+    Tests that a model without scores, predicting the class numbers of text labels, gets all the probability
+    on the column of its predicted class.
+    """
+    from model_loader import predict_probabilities  # For scoring the model
+
+    label_encoder = LabelEncoder().fit(['anger', 'joy', 'sadness'])
+    features = TfidfVectorizer().fit_transform(['sad night', 'angry day', 'happy day'])
+    model_data = {'model': PredictOnlyModel(label_encoder.transform(['sadness', 'anger', 'joy'])),
+                  'is_pytorch_model': False, 'labels': label_encoder.classes_}
+
+    assert np.array_equal(predict_probabilities(model_data, features), np.eye(3)[[2, 0, 1]])
@@ -0,0 +1,47 @@
+import pytest  # Python testing framework
+from sklearn.feature_extraction.text import TfidfVectorizer  # For converting text to numerical vectors
+from sklearn.linear_model import LogisticRegression  # Models trained on the sample texts
+from sklearn.naive_bayes import ComplementNB
+from sklearn.preprocessing import LabelEncoder  # For encoding categorical labels
+from sklearn.tree import DecisionTreeClassifier  # A model that can't be exported
+
+
+@pytest.fixture
+def sample_texts():
+    """
+    Pytest fixture providing short preprocessed texts covering every emotion.
+    """
+    return ["feel happy today", "so sad and lonely", "love my family", "angry at everyone",
+            "afraid of the dark", "what a surprise", "happy happy day", "sad news today"]
+
+
+@pytest.fixture
+def sample_labels():
+    """
+    Pytest fixture providing the emotion number of every sample text.
+    """
+    return [1, 0, 2, 3, 4, 5, 1, 0]
+
+
+@pytest.fixture
+def sample_features(sample_texts, sample_labels):
+    """
+    Pytest fixture providing a TF-IDF vectorizer fitted on the sample texts, their features and a label encoder
+    fitted on their labels, the way the training script exports its models.
+    """
+    vectorizer = TfidfVectorizer()
+    return vectorizer, vectorizer.fit_transform(sample_texts), LabelEncoder().fit(sample_labels)
+
+
+@pytest.fixture
+def trained_models(sample_features, sample_labels):
+    """
+    Pytest fixture providing models trained on the sample features by display name, best first like the
+    candidates of the training script: two that can be exported as compact artifacts and one that can't.
+    """
+    _, features, _ = sample_features
+    return {
+        "Logistic Regression": LogisticRegression(max_iter=200).fit(features, sample_labels),
+        "Decision Tree": DecisionTreeClassifier().fit(features, sample_labels),
+        "Complement Naive Bayes": ComplementNB().fit(features, sample_labels),
+    }
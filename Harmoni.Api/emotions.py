@@ -1,341 +1,353 @@
 import datetime
+import os
+import time
 import joblib
-import nltk
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-import re
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.linear_model import LogisticRegression
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.model_selection import train_test_split
-from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import (accuracy_score, classification_report, confusion_matrix,
-                             roc_curve, auc, mean_absolute_percentage_error,
-                             mean_absolute_error)
+                             mean_absolute_percentage_error, mean_absolute_error)
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.naive_bayes import MultinomialNB, ComplementNB
 from sklearn.svm import LinearSVC
 from sklearn.preprocessing import label_binarize
-from itertools import cycle
 import torch
-import torch.nn as nn
-import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader, TensorDataset
 
 # Import the EmotionClassifier class
 from EmotionClassifier import EmotionClassifier
-
-# Record the starting time of the script
-script_start_time = datetime.datetime.now()
-
-# Check for GPU availability for PyTorch
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
-# Print the script's start time
-print(f"Script started at: {script_start_time}")
-
-# Download necessary NLTK resources
-nltk.download('stopwords')
-nltk.download('wordnet')
-
-# Load the dataset containing text and emotion labels
-emotion_data_df = pd.read_csv('../FastAPIProject1/emotions.csv')
-
-# --- Exploratory Data Analysis (EDA) ---
-print("--- Exploratory Data Analysis ---")
-print(emotion_data_df.info())
-print("\n--- Missing Values ---")
-print(emotion_data_df.isnull().sum())
-print("\n--- Emotion Label Distribution ---")
-print(emotion_data_df['label'].value_counts())
-
-# Visualize the distribution of emotion labels
-plt.figure(figsize=(8, 6))
-sns.countplot(x='label', data=emotion_data_df)
-plt.title('Distribution of Emotions')
-plt.xlabel('Emotion Label')
-plt.ylabel('Number of Samples')
-plt.show()
-
-# --- Preprocessing ---
-text_lemmatizer = WordNetLemmatizer()
-english_stop_words = set(stopwords.words('english'))
-
-# Remove 'not' from stop words to improve model accuracy
-if 'not' in english_stop_words:
-    english_stop_words.remove('not')
-
-
-# Function to preprocess text data
-def preprocess_text_data(text):
+from TextPreprocessor import TextPreprocessor
+from featurization_spec import create_vectorizer, load_featurization_spec, resolve_featurization_spec, spec_stop_words
+from preprocessing_cache import load_or_preprocess
+from inference_backends import check_parity, inference_backends, prepare_inference_model
+from incremental_update import fallback_bundle_name
+from model_artifact import export_artifact
+from model_cascade import export_cascade, tune_threshold
+from model_loader import predict_probabilities
+from model_pool import export_model_pool
+from model_training import train_candidates
+from evaluation_report import compute_roc, show_report, write_metrics, write_report_in_background
+
+
+def main():
     """
-    Preprocesses the input text by converting it to lowercase, removing non-alphanumeric characters,
-    splitting it into tokens, lemmatizing the tokens, and removing stop words.
-
-    Args:
-        text (str): The text to preprocess.
-
-    Returns:
-        str: The preprocessed text.
+    Trains the candidate emotion models on the dataset, reports their evaluation and saves the best one.
     """
-    text = text.lower()
-    text = re.sub(r'[^a-zA-Z\s]', '', text)
-    tokens = text.split()
-    tokens = [text_lemmatizer.lemmatize(word) for word in tokens if word not in english_stop_words]
-    return ' '.join(tokens)
-
-
-# Apply the preprocessing function to the text data
-emotion_data_df['processed_text'] = emotion_data_df['text'].apply(preprocess_text_data)
-
-# Encode the emotion labels
-label_encoder = LabelEncoder()
-emotion_data_df['label_encoded'] = label_encoder.fit_transform(emotion_data_df['label'])
-
-# --- Split the data into training and testing sets ---
-text_data = emotion_data_df['text']
-encoded_labels = emotion_data_df['label_encoded']
-train_text, test_text, train_labels, test_labels = train_test_split(text_data, encoded_labels, test_size=0.2, random_state=42)
-
-# --- TF-IDF Vectorization ---
-tfidf_vectorizer = TfidfVectorizer(max_features=5000, ngram_range=(1, 2), stop_words=list(english_stop_words))
-
-# Fit and transform the training text data, and transform the testing text data
-train_tfidf_features = tfidf_vectorizer.fit_transform(train_text)
-test_tfidf_features = tfidf_vectorizer.transform(test_text)
-
-# Convert the TF-IDF features to dense arrays
-train_dense_features = train_tfidf_features.toarray()
-test_dense_features = test_tfidf_features.toarray()
-
-
-# --- Define PyTorch Neural Network Model ---
-
-# --- Initialize different machine learning models ---
-ml_models = {
-    "Logistic Regression": LogisticRegression(max_iter=200, solver="saga", n_jobs=-1),
-    "Artificial Neural Network": EmotionClassifier(train_dense_features.shape[1], len(label_encoder.classes_)).to(device),
-    "Decision Tree": DecisionTreeClassifier(random_state=42),
-    "Multinomial Naive Bayes": MultinomialNB(),
-    "Complement Naive Bayes": ComplementNB(),
-    "Linear SVM": LinearSVC(random_state=42, dual=False, max_iter=200)
-}
-
-# --- Convert training and testing data to PyTorch tensors and create DataLoaders ---
-training_dataset = TensorDataset(
-    torch.FloatTensor(train_dense_features),
-    torch.LongTensor(train_labels.values)
-)
-testing_dataset = TensorDataset(
-    torch.FloatTensor(test_dense_features),
-    torch.LongTensor(test_labels.values)
-)
-
-training_dataloader = DataLoader(training_dataset, batch_size=32, shuffle=True)
-testing_dataloader = DataLoader(testing_dataset, batch_size=32, shuffle=False)
-
-# Dictionary to store the results of each model
-model_results = {}
-
-# Iterate through each model in the 'ml_models' dictionary
-for model_name, model in ml_models.items():
-    print(f"Training {model_name}...")
-    # Train the Artificial Neural Network if it's the current model
-    if model_name == "Artificial Neural Network":
-        # Define the loss function (Cross-Entropy Loss for multi-class classification)
-        loss_criterion = nn.CrossEntropyLoss()
-        # Define the optimizer (Adam optimizer)
-        optimizer = optim.Adam(model.parameters())
-
-        # Training loop for a specified number of epochs
-        for epoch in range(10):
-            # Set the model to training mode
-            model.train()
-            running_loss = 0.0
-            # Iterate over batches of data from the training DataLoader
-            for batch_inputs, batch_labels in training_dataloader:
-                # Move the input data and labels to the specified device (GPU if available)
-                batch_inputs, batch_labels = batch_inputs.to(device), batch_labels.to(device)
-
-                # Zero the gradients from the previous iteration
-                optimizer.zero_grad()
-                # Perform the forward pass to get the model's output
-                model_outputs = model(batch_inputs)
-                # Calculate the loss
-                loss = loss_criterion(model_outputs, batch_labels)
-                # Perform backpropagation to calculate gradients
-                loss.backward()
-                # Update the model's parameters
-                optimizer.step()
-                # Accumulate the running loss
-                running_loss += loss.item()
-
-            # Print the average loss for the current epoch
-            print(f'Epoch {epoch + 1}, Loss: {running_loss / len(training_dataloader):.4f}')
-
-        # Evaluation phase for the Neural Network
-        model.eval()
-        all_predictions = []
-        all_true_labels = []
-        with torch.no_grad():
-            for batch_inputs, batch_labels in testing_dataloader:
-                batch_inputs, batch_labels = batch_inputs.to(device), batch_labels.to(device)
-                model_outputs = model(batch_inputs)
-                _, predicted_labels = torch.max(model_outputs, 1)  # Get the predicted class labels
-                all_predictions.extend(predicted_labels.cpu().numpy())
-                all_true_labels.extend(batch_labels.cpu().numpy())
-
-        predictions = np.array(all_predictions)
-        true_labels = np.array(all_true_labels)
-    else:
-        # Train other machine learning models
-        model.fit(train_tfidf_features, train_labels)
-        predictions = model.predict(test_tfidf_features)
-        true_labels = test_labels
-
-    # Store the results for each model
-    model_results[model_name] = {
-        "accuracy": accuracy_score(true_labels, predictions),
-        "report": classification_report(true_labels, predictions, output_dict=True),
-        "confusion": confusion_matrix(true_labels, predictions),
-        "predictions": predictions
+    # Record the starting time of the script
+    script_start_time = datetime.datetime.now()
+
+    # Check for GPU availability for PyTorch
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    # Print the script's start time
+    print(f"Script started at: {script_start_time}")
+
+    # Download the necessary NLTK resources if they aren't installed yet
+    TextPreprocessor.ensure_nltk_resources()
+
+    # Directory of the headless evaluation report, written instead of showing the figures interactively
+    report_directory = os.getenv('HARMONI_REPORT_DIR')
+
+    # Load the dataset containing text and emotion labels
+    dataset_path = '../FastAPIProject1/emotions.csv'
+    emotion_data_df = pd.read_csv(dataset_path)
+
+    # --- Exploratory Data Analysis (EDA) ---
+    print("--- Exploratory Data Analysis ---")
+    print(emotion_data_df.info())
+    print("\n--- Missing Values ---")
+    print(emotion_data_df.isnull().sum())
+    print("\n--- Emotion Label Distribution ---")
+    print(emotion_data_df['label'].value_counts())
+
+    # --- Featurization Spec ---
+    # The preprocessing and vectorizer are those of the featurization spec shared with the API, which is stamped
+    # into the saved models so the API can check that it serves them with the same features. It removes the
+    # English stop words except 'not', which improves the accuracy. HARMONI_FEATURES=hashing hashes the terms
+    # into HARMONI_HASHING_FEATURES columns instead of learning a vocabulary, so the vectorizer only stores its
+    # idf vector; both feed the same models
+    featurization_spec = load_featurization_spec()
+    featurization_spec['features']['mode'] = os.getenv('HARMONI_FEATURES', featurization_spec['features']['mode'])
+    featurization_spec['features']['hashing_features'] = int(os.getenv(
+        'HARMONI_HASHING_FEATURES', featurization_spec['features']['hashing_features']))
+    english_stop_words = spec_stop_words(featurization_spec)
+    featurization_spec = resolve_featurization_spec(featurization_spec, english_stop_words)
+    feature_mode = featurization_spec['features']['mode']
+    print(f"Featurization spec {featurization_spec['id']} ({feature_mode} features)")
+
+    # --- Preprocessing ---
+
+    # Preprocess the texts in parallel chunks, or load them from the cache if neither the dataset nor the
+    # preprocessing changed since the last run. The lemmas of the dataset vocabulary come with them, so the
+    # API doesn't have to look them up in WordNet.
+    preprocessing_start_time = datetime.datetime.now()
+    preprocessing = load_or_preprocess(dataset_path, emotion_data_df['text'], english_stop_words,
+                                       cache_directory=os.getenv('HARMONI_PREPROCESSING_CACHE_DIR',
+                                                                 'preprocessing_cache'),
+                                       workers=int(os.getenv('HARMONI_PREPROCESSING_WORKERS', '0')) or None)
+    emotion_data_df['processed_text'] = preprocessing['processed_text']
+    lemma_table = preprocessing['lemma_table']
+    print(f"Preprocessing {'loaded from the cache' if preprocessing['cached'] else 'computed'} "
+          f"in {datetime.datetime.now() - preprocessing_start_time}")
+
+    # Encode the emotion labels
+    label_encoder = LabelEncoder()
+    emotion_data_df['label_encoded'] = label_encoder.fit_transform(emotion_data_df['label'])
+
+    # --- Split the data into training and testing sets ---
+    # The model learns from the preprocessed text, which is also what the API feeds it
+    text_data = emotion_data_df['processed_text']
+    encoded_labels = emotion_data_df['label_encoded']
+    classes = np.unique(encoded_labels)
+    train_text, test_text, train_labels, test_labels = train_test_split(text_data, encoded_labels, test_size=0.2, random_state=42)
+
+    # --- TF-IDF Vectorization ---
+    tfidf_vectorizer = create_vectorizer(featurization_spec, english_stop_words)
+
+    # Fit and transform the training text data, and transform the testing text data
+    train_tfidf_features = tfidf_vectorizer.fit_transform(train_text)
+    test_tfidf_features = tfidf_vectorizer.transform(test_text)
+    print(f"{feature_mode} features: {train_tfidf_features.shape[1]} columns")
+
+    # --- Define PyTorch Neural Network Model ---
+
+    # --- Initialize different machine learning models ---
+    ml_models = {
+        "Logistic Regression": LogisticRegression(max_iter=200, solver="saga", n_jobs=-1),
+        "Artificial Neural Network": EmotionClassifier(train_tfidf_features.shape[1], len(label_encoder.classes_)).to(device),
+        "Decision Tree": DecisionTreeClassifier(random_state=42),
+        "Multinomial Naive Bayes": MultinomialNB(),
+        "Complement Naive Bayes": ComplementNB(),
+        "Linear SVM": LinearSVC(random_state=42, dual=False, max_iter=200),
+        # Linear model learning incrementally with partial_fit, which incremental_update can update
+        "SGD Classifier": SGDClassifier(loss="log_loss", random_state=42)
     }
 
-# --- ROC Curve Calculation and Plotting ---
-plt.figure(figsize=(10, 8))
-binarized_test_labels = label_binarize(test_labels, classes=np.unique(encoded_labels))
-num_classes = binarized_test_labels.shape[1]
-color_cycle = cycle(['blue', 'red', 'green', 'orange', 'purple', 'brown'])
-
-best_auc = 0
-best_model_name = ""
-best_model = None
-
-# Iterate through the results of each model to plot ROC curve
-for model_name, results in model_results.items():
-    if model_name == "Artificial Neural Network":
-        ml_models[model_name].eval()
-        all_probabilities = []
-        with torch.no_grad():
-            for batch_inputs, _ in testing_dataloader:
-                batch_inputs = batch_inputs.to(device)
-                model_outputs = ml_models[model_name](batch_inputs)
-                probabilities = torch.softmax(model_outputs, dim=1)  # Get class probabilities
-                all_probabilities.extend(probabilities.cpu().numpy())
-        y_score = np.array(all_probabilities)
-    elif model_name == "Linear SVM":
-        #decision_scores = ml_models[model_name].decision_function(test_tfidf_features)
-        y_score = ml_models[model_name].decision_function(test_tfidf_features)
-        if len(y_score.shape) == 1:
-            y_score = np.vstack([-y_score, y_score]).T
+    # --- Train every model and score it once on the test set ---
+    # The sklearn models are fitted in worker processes while the network trains here, until its loss on a
+    # validation split of the training data stops improving; its best weights are checkpointed along the way
+    training_start_time = time.perf_counter()
+    model_results = train_candidates(
+        ml_models, train_tfidf_features, train_labels.values, test_tfidf_features, classes, device,
+        workers=int(os.getenv('HARMONI_TRAINING_WORKERS', '0')) or None,
+        network_options={'max_epochs': int(os.getenv('HARMONI_ANN_MAX_EPOCHS', '50')),
+                         'patience': int(os.getenv('HARMONI_ANN_PATIENCE', '3')),
+                         'checkpoint_path': 'ann_checkpoint.pth'})
+    training_seconds = time.perf_counter() - training_start_time
+
+    for model_name, results in model_results.items():
+        # The models fitted in worker processes come back as copies
+        ml_models[model_name] = results['model']
+        results['accuracy'] = accuracy_score(test_labels, results['predictions'])
+        results['report'] = classification_report(test_labels, results['predictions'], output_dict=True)
+        results['confusion'] = confusion_matrix(test_labels, results['predictions'])
+
+    # Report the training time of every candidate; the total is lower than their sum since they train concurrently
+    timing_df = pd.DataFrame({model_name: {'Fit (s)': results['fit_seconds'], 'Score (s)': results['score_seconds'],
+                                           'Total (s)': results['total_seconds']}
+                              for model_name, results in model_results.items()}).T
+    print("\nTraining Time per Model:")
+    print(timing_df.round(2))
+    ann_results = model_results["Artificial Neural Network"]
+    print(f"Artificial Neural Network stopped after {ann_results['epochs']} epochs, "
+          f"best epoch {ann_results['best_epoch']}")
+    print(f"All models trained and scored in {training_seconds:.1f} s")
+
+    # --- ROC Curve Calculation ---
+    binarized_test_labels = label_binarize(test_labels, classes=classes)
+
+    best_auc = 0
+    best_model_name = ""
+    best_model = None
+
+    # Compute the ROC curve of each model from the scores computed once on the test set during the training
+    for model_name, results in model_results.items():
+        results['roc'] = compute_roc(binarized_test_labels, results['scores'])
+        current_auc = results['roc']['auc']
+        if current_auc > best_auc:
+            best_auc = current_auc
+            best_model_name = model_name
+            best_model = ml_models[model_name]
+
+    # --- WAPE and MAPE Comparison ---
+    for model_name, results in model_results.items():
+        results['mape'] = mean_absolute_percentage_error(test_labels, results['predictions'])
+        results['wape'] = mean_absolute_error(test_labels, results['predictions']) / np.mean(test_labels)
+
+    metrics_df = pd.DataFrame({'MAPE': {model_name: results['mape'] for model_name, results in model_results.items()},
+                               'WAPE': {model_name: results['wape'] for model_name, results in model_results.items()}})
+    print("\nMAPE and WAPE Comparison:")
+    print(metrics_df)
+
+    accuracy_df = pd.DataFrame({'Accuracy': {model_name: results['accuracy']
+                                             for model_name, results in model_results.items()}})
+    print(accuracy_df)
+
+    # --- Figures ---
+    # Label distribution, ROC curves, MAPE/WAPE, confusion matrices and accuracy. Headless runs render them
+    # in a background process while the best model is saved, instead of blocking on every plt.show()
+    report_data = {
+        'label_counts': {str(label): int(count)
+                         for label, count in sorted(emotion_data_df['label'].value_counts().items())},
+        'class_names': label_encoder.classes_.tolist(),
+        'best_model': best_model_name,
+        'models': {model_name: {key: results[key] for key in ('roc', 'mape', 'wape', 'confusion', 'accuracy')}
+                   for model_name, results in model_results.items()},
+    }
+    report_future = None
+    if report_directory:
+        report_future = write_report_in_background(report_directory, report_data)
+    else:
+        show_report(report_data)
+
+    # Save the best model
+    if best_model_name == "Artificial Neural Network":
+        torch.save({
+            'model_state_dict': best_model.state_dict(),
+            'input_size': train_tfidf_features.shape[1],
+            'num_classes': len(label_encoder.classes_),
+            'label_encoder': label_encoder,
+            'tfidf_vectorizer': tfidf_vectorizer,
+            'lemma_table': lemma_table,
+            'stop_words': english_stop_words,
+            'featurization_spec': featurization_spec,
+            'model_name': best_model_name
+        }, 'best_emotion_model.pth')
+    else:
+        joblib.dump({
+            'model': best_model,
+            'label_encoder': label_encoder,
+            'tfidf_vectorizer': tfidf_vectorizer,
+            'lemma_table': lemma_table,
+            'stop_words': english_stop_words,
+            'featurization_spec': featurization_spec,
+            'model_name': best_model_name
+        }, 'best_emotion_model.joblib')
+
+    # incremental_update can't update models without partial_fit, so it updates the best candidate that can instead
+    if best_model_name == "Artificial Neural Network" or hasattr(best_model, 'partial_fit'):
+        if os.path.exists(fallback_bundle_name):
+            os.remove(fallback_bundle_name)
     else:
-        if hasattr(ml_models[model_name], "predict_proba"):
-            y_score = ml_models[model_name].predict_proba(test_tfidf_features)
-        else:
+        fallback_model_name = max((model_name for model_name in model_results
+                                   if hasattr(ml_models[model_name], 'partial_fit')),
+                                  key=lambda model_name: model_results[model_name]['roc']['auc'])
+        joblib.dump({
+            'model': ml_models[fallback_model_name],
+            'label_encoder': label_encoder,
+            'tfidf_vectorizer': tfidf_vectorizer,
+            'lemma_table': lemma_table,
+            'stop_words': english_stop_words,
+            'featurization_spec': featurization_spec,
+            'model_name': fallback_model_name
+        }, fallback_bundle_name)
+        print(f"{fallback_model_name} saved for incremental updates")
+
+    # Also export the compact artifact the API loads without pickle (not available for the Decision Tree)
+    try:
+        export_artifact('best_emotion_model', best_model, tfidf_vectorizer, label_encoder, lemma_table=lemma_table,
+                        preprocessing_stop_words=english_stop_words, featurization_spec=featurization_spec)
+    except ValueError as error:
+        print(f"Compact artifact not exported: {error}")
+
+    # Print the name and AUC of the best model
+    print(f"Best model ({best_model_name}) with AUC = {best_auc:.2f} saved")
+
+    # --- Cheap-First Cascade ---
+    # A cheap model answers the texts it is confident about and escalates the others to the network. Its
+    # threshold is the lowest one whose accuracy on the test split reaches the target accuracy, by default
+    # the accuracy of the network alone
+    cheap_model_name = os.getenv('HARMONI_CASCADE_CHEAP_MODEL', 'Complement Naive Bayes')
+    expensive_model_name = "Artificial Neural Network"
+    cascade_target_accuracy = float(os.getenv('HARMONI_CASCADE_TARGET_ACCURACY',
+                                              model_results[expensive_model_name]['accuracy']))
+    # The probabilities the API computes for the cheap model, not the scores of the ROC curves
+    cheap_probabilities = predict_probabilities({'model': ml_models[cheap_model_name], 'is_pytorch_model': False,
+                                                 'labels': classes}, test_tfidf_features)
+    cascade_tuning = tune_threshold(cheap_probabilities, model_results[expensive_model_name]['predictions'],
+                                    test_labels.values, cascade_target_accuracy)
+    cascade_tuning['target_accuracy'] = cascade_target_accuracy
+    try:
+        export_cascade('best_emotion_cascade', ml_models[cheap_model_name], ml_models[expensive_model_name].cpu(),
+                       tfidf_vectorizer, label_encoder, cascade_tuning,
+                       model_names={'cheap': cheap_model_name, 'expensive': expensive_model_name},
+                       lemma_table=lemma_table, preprocessing_stop_words=english_stop_words,
+                       featurization_spec=featurization_spec)
+        print(f"Cascade saved: {cheap_model_name} answers {1 - cascade_tuning['escalation_rate']:.1%} of the test "
+              f"texts (threshold {cascade_tuning['threshold']}), accuracy {cascade_tuning['accuracy']:.4f} "
+              f"for a target of {cascade_target_accuracy:.4f}")
+    except ValueError as error:
+        print(f"Cascade not exported: {error}")
+
+    # --- Candidate Model Pool ---
+    # Every candidate that can be exported as a compact artifact, best first, so the API can A/B test and shadow
+    # them on the same features as the best model
+    ranked_models = {model_name: ml_models[model_name].cpu() if isinstance(ml_models[model_name], torch.nn.Module)
+                     else ml_models[model_name]
+                     for model_name in sorted(model_results, key=lambda name: -model_results[name]['roc']['auc'])}
+    try:
+        pool = export_model_pool('candidate_models', ranked_models, best_model_name, tfidf_vectorizer, label_encoder,
+                                 lemma_table=lemma_table, preprocessing_stop_words=english_stop_words,
+                                 featurization_spec=featurization_spec)
+        print(f"Candidate models saved: {', '.join(pool['models'])} (primary {pool['primary']})")
+        for model_name, reason in pool['skipped'].items():
+            print(f"{model_name} not in the candidate models: {reason}")
+    except ValueError as error:
+        print(f"Candidate models not exported: {error}")
+
+    # --- Inference Backend Parity ---
+    # Check that the quantized and compiled CPU backends the API can serve the network with predict like the eager model
+    backend_parity = {}
+    if best_model_name == "Artificial Neural Network":
+        eager_model = best_model.cpu().eval()
+        print("\nInference backend parity on the test set:")
+        for backend in inference_backends[1:]:
             try:
-                #decision_scores = ml_models[model_name].decision_function(test_tfidf_features)
-                y_score = ml_models[model_name].decision_function(test_tfidf_features)
-                if len(y_score.shape) == 1:
-                    y_score = np.vstack([-y_score, y_score]).T
-                else:
-                    y_score = y_score
-            except AttributeError:
-                y_score = label_binarize(ml_models[model_name].predict(test_tfidf_features), classes=np.unique(encoded_labels))
-
-    fpr = dict()
-    tpr = dict()
-    roc_auc = dict()
-    for i in range(num_classes):
-        fpr[i], tpr[i], _ = roc_curve(binarized_test_labels[:, i], y_score[:, i])
-        roc_auc[i] = auc(fpr[i], tpr[i])
-    fpr["micro"], tpr["micro"], _ = roc_curve(binarized_test_labels.ravel(), y_score.ravel())
-    current_auc = auc(fpr["micro"], tpr["micro"])
-    plt.plot(fpr["micro"], tpr["micro"], label=f'{model_name} (AUC = {current_auc:.2f})', color=next(color_cycle))
-    if current_auc > best_auc:
-        best_auc = current_auc
-        best_model_name = model_name
-        best_model = ml_models[model_name]
-
-plt.plot([0, 1], [0, 1], 'k--')
-plt.xlabel('False Positive Rate')
-plt.ylabel('True Positive Rate')
-plt.title('ROC Curve for Multi-Class Classification')
-plt.legend(loc="lower right")
-plt.show()
-
-# Save the best model
-if best_model_name == "Artificial Neural Network":
-    torch.save({
-        'model_state_dict': best_model.state_dict(),
-        'input_size': train_dense_features.shape[1],
-        'num_classes': len(label_encoder.classes_),
-        'label_encoder': label_encoder,
-        'tfidf_vectorizer': tfidf_vectorizer
-    }, 'best_emotion_model.pth')
-else:
-    joblib.dump({
-        'model': best_model,
-        'label_encoder': label_encoder,
-        'tfidf_vectorizer': tfidf_vectorizer
-    }, 'best_emotion_model.joblib')
-
-# Print the name and AUC of the best model
-print(f"Best model ({best_model_name}) with AUC = {best_auc:.2f} saved")
-
-# --- WAPE and MAPE Comparison ---
-mape_scores = {}
-wape_scores = {}
-for model_name, results in model_results.items():
-    mape = mean_absolute_percentage_error(test_labels, results['predictions'])
-    wape = mean_absolute_error(test_labels, results['predictions']) / np.mean(test_labels)
-    mape_scores[model_name] = mape
-    wape_scores[model_name] = wape
-
-metrics_df = pd.DataFrame({'MAPE': mape_scores, 'WAPE': wape_scores})
-print("\nMAPE and WAPE Comparison:")
-print(metrics_df)
-
-plt.figure(figsize=(12, 6))
-plt.subplot(1, 2, 1)
-sns.barplot(x=metrics_df.index, y='MAPE', data=metrics_df)
-plt.title('MAPE Comparison')
-plt.xticks(rotation=45)
-plt.subplot(1, 2, 2)
-sns.barplot(x=metrics_df.index, y='WAPE', data=metrics_df)
-plt.title('WAPE Comparison')
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.show()
-
-# --- Confusion Matrix Visualization ---
-for model_name, results in model_results.items():
-    plt.figure(figsize=(8, 6))
-    sns.heatmap(results['confusion'], annot=True, fmt='d', cmap='Blues',
-                xticklabels=label_encoder.classes_, yticklabels=label_encoder.classes_)
-    plt.title(f'Confusion Matrix - {model_name}')
-    plt.xlabel('Predicted')
-    plt.ylabel('True')
-    plt.show()
-
-# --- Accuracy Visualization ---
-accuracy_scores = {model_name: results['accuracy'] for model_name, results in model_results.items()}
-accuracy_df = pd.DataFrame({'Accuracy': accuracy_scores})
-
-plt.figure(figsize=(10, 6))
-sns.barplot(x=accuracy_df.index, y='Accuracy', data=accuracy_df)
-plt.title('Model Accuracy Comparison')
-plt.xlabel('Model')
-plt.xticks(rotation=45)
-plt.ylim(0, 1)
-plt.tight_layout()
-plt.show()
-
-print(accuracy_df)
-
-# Record the ending time of the script
-script_end_time = datetime.datetime.now()
-# Print the script's end time
-print(f"Script ended at: {script_end_time}")
+                inference_model = prepare_inference_model(eager_model, backend, test_tfidf_features.shape[1])
+            except Exception as error:
+                # e.g. onnxruntime not installed, or no compiler for torch.compile
+                print(f"{backend}: unavailable ({type(error).__name__}: {error})")
+                continue
+            parity = check_parity(eager_model, inference_model, test_tfidf_features, test_labels.values)
+            backend_parity[backend] = parity
+            print(f"{backend}: agreement {parity['agreement']:.4f}, accuracy {parity['accuracy']:.4f} "
+                  f"({parity['accuracy_delta']:+.4f})")
+
+    # --- Evaluation Metrics ---
+    if report_directory:
+        metrics_path = write_metrics(report_directory, {
+            'dataset': {'path': dataset_path, 'samples': len(emotion_data_df),
+                        'label_counts': report_data['label_counts']},
+            'best_model': {'name': best_model_name, 'auc': best_auc},
+            'features': {'mode': feature_mode, 'columns': train_tfidf_features.shape[1],
+                         'featurization_spec_id': featurization_spec['id']},
+            'training_seconds': training_seconds,
+            'models': {model_name: {
+                'accuracy': results['accuracy'],
+                'auc': results['roc']['auc'],
+                'class_auc': results['roc']['class_auc'],
+                'mape': results['mape'],
+                'wape': results['wape'],
+                'fit_seconds': results['fit_seconds'],
+                'score_seconds': results['score_seconds'],
+                'classification_report': results['report'],
+                'confusion_matrix': results['confusion'],
+                **({key: results[key] for key in ('epochs', 'best_epoch', 'best_validation_loss')}
+                   if 'best_epoch' in results else {}),
+            } for model_name, results in model_results.items()},
+            'backend_parity': backend_parity,
+            'cascade': {'models': {'cheap': cheap_model_name, 'expensive': expensive_model_name}, **cascade_tuning},
+        })
+        print(f"\nMetrics written to {metrics_path}")
+        print(f"Report written to {report_future.result()}")
+
+    # Record the ending time of the script
+    script_end_time = datetime.datetime.now()
+    # Print the script's end time
+    print(f"Script ended at: {script_end_time}")
+
+
+# The worker processes of the preprocessing and training pools import this module, so only run the script itself
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Figures and metrics of the evaluation of the training script.
+
+The figures are built from plain report data (label counts, ROC curves, confusion matrices and
+scores of every model), so they can be shown interactively one after the other, or rendered
+headless by a background process into a report directory: one PNG per figure and a self-contained
+`report.html` embedding them all. The metrics are written to `metrics.json` next to them.
+"""
+import base64
+import html
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def compute_roc(binarized_labels, scores):
+    """
+    Computes the micro-averaged ROC curve of a model and the AUC of every class.
+
+    Args:
+        binarized_labels (np.ndarray): The (num_samples, num_classes) one-hot true labels.
+        scores (np.ndarray): The (num_samples, num_classes) class scores of the model.
+
+    Returns:
+        dict: The micro-averaged 'fpr' and 'tpr' lists, their 'auc', and the 'class_auc' list.
+    """
+    from sklearn.metrics import auc, roc_curve
+
+    class_auc = []
+    for i in range(binarized_labels.shape[1]):
+        class_fpr, class_tpr, _ = roc_curve(binarized_labels[:, i], scores[:, i])
+        class_auc.append(auc(class_fpr, class_tpr))
+    fpr, tpr, _ = roc_curve(binarized_labels.ravel(), scores.ravel())
+    return {'fpr': fpr.tolist(), 'tpr': tpr.tolist(), 'auc': auc(fpr, tpr), 'class_auc': class_auc}
+
+
+def plot_label_distribution(label_counts):
+    """
+    Plots the number of samples of every emotion label.
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    figure = plt.figure(figsize=(8, 6))
+    sns.barplot(x=list(label_counts), y=list(label_counts.values()))
+    plt.title('Distribution of Emotions')
+    plt.xlabel('Emotion Label')
+    plt.ylabel('Number of Samples')
+    return figure
+
+
+def plot_roc_curves(models):
+    """
+    Plots the micro-averaged ROC curve of every model.
+    """
+    from itertools import cycle
+
+    import matplotlib.pyplot as plt
+
+    figure = plt.figure(figsize=(10, 8))
+    color_cycle = cycle(['blue', 'red', 'green', 'orange', 'purple', 'brown'])
+    for model_name, model in models.items():
+        plt.plot(model['roc']['fpr'], model['roc']['tpr'], label=f"{model_name} (AUC = {model['roc']['auc']:.2f})",
+                 color=next(color_cycle))
+    plt.plot([0, 1], [0, 1], 'k--')
+    plt.xlabel('False Positive Rate')
+    plt.ylabel('True Positive Rate')
+    plt.title('ROC Curve for Multi-Class Classification')
+    plt.legend(loc="lower right")
+    return figure
+
+
+def plot_error_comparison(models):
+    """
+    Plots the MAPE and WAPE of every model side by side.
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    model_names = list(models)
+    figure = plt.figure(figsize=(12, 6))
+    for position, metric in enumerate(['MAPE', 'WAPE'], start=1):
+        plt.subplot(1, 2, position)
+        sns.barplot(x=model_names, y=[models[model_name][metric.lower()] for model_name in model_names])
+        plt.title(f'{metric} Comparison')
+        plt.xticks(rotation=45)
+    plt.tight_layout()
+    return figure
+
+
+def plot_confusion_matrix(model_name, confusion, class_names):
+    """
+    Plots the confusion matrix of a model.
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    figure = plt.figure(figsize=(8, 6))
+    sns.heatmap(np.asarray(confusion), annot=True, fmt='d', cmap='Blues', xticklabels=class_names,
+                yticklabels=class_names)
+    plt.title(f'Confusion Matrix - {model_name}')
+    plt.xlabel('Predicted')
+    plt.ylabel('True')
+    return figure
+
+
+def plot_accuracy_comparison(models):
+    """
+    Plots the accuracy of every model.
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    figure = plt.figure(figsize=(10, 6))
+    sns.barplot(x=list(models), y=[model['accuracy'] for model in models.values()])
+    plt.title('Model Accuracy Comparison')
+    plt.xlabel('Model')
+    plt.xticks(rotation=45)
+    plt.ylim(0, 1)
+    plt.tight_layout()
+    return figure
+
+
+def create_figures(report_data):
+    """
+    Builds the figures of the report one at a time.
+
+    Args:
+        report_data (dict): The 'label_counts', 'class_names' and the 'models' with their 'roc', 'mape',
+            'wape', 'confusion' and 'accuracy'.
+
+    Yields:
+        tuple: The file name and the matplotlib figure of every figure, in the order of the report.
+    """
+    models = report_data['models']
+    yield 'label_distribution', plot_label_distribution(report_data['label_counts'])
+    yield 'roc_curves', plot_roc_curves(models)
+    yield 'error_comparison', plot_error_comparison(models)
+    for index, (model_name, model) in enumerate(models.items()):
+        yield f'confusion_matrix_{index}', plot_confusion_matrix(model_name, model['confusion'],
+                                                                 report_data['class_names'])
+    yield 'accuracy_comparison', plot_accuracy_comparison(models)
+
+
+def show_report(report_data):
+    """
+    Shows the figures of the report interactively, one after the other.
+    """
+    import matplotlib.pyplot as plt
+
+    for _, figure in create_figures(report_data):
+        plt.show()
+        plt.close(figure)
+
+
+def write_report(report_directory, report_data):
+    """
+    Renders the figures of the report with the non-interactive Agg backend into a directory,
+    as PNG files and a self-contained `report.html`.
+
+    Args:
+        report_directory (str): The directory the report is written to.
+        report_data (dict): The report data, see `create_figures`.
+
+    Returns:
+        str: The path of the HTML report.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    os.makedirs(report_directory, exist_ok=True)
+    sections = []
+    for name, figure in create_figures(report_data):
+        path = os.path.join(report_directory, f'{name}.png')
+        figure.savefig(path, dpi=100)
+        plt.close(figure)
+        with open(path, 'rb') as image_file:
+            image = base64.b64encode(image_file.read()).decode('ascii')
+        sections.append(f'<img alt="{html.escape(name)}" src="data:image/png;base64,{image}">')
+
+    best_model = report_data.get('best_model')
+    title = 'Emotion Model Evaluation'
+    summary = f"<p>Best model: {html.escape(str(best_model))}</p>" if best_model else ''
+    report_path = os.path.join(report_directory, 'report.html')
+    with open(report_path, 'w', encoding='utf-8') as report_file:
+        report_file.write(f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{title}</title></head>\n'
+                          f'<body><h1>{title}</h1>{summary}\n' + '\n'.join(sections) + '\n</body></html>\n')
+    return report_path
+
+
+def write_report_in_background(report_directory, report_data):
+    """
+    Renders the report in a separate process, keeping the plotting off the critical path.
+
+    Returns:
+        concurrent.futures.Future: The future of the path of the HTML report.
+    """
+    pool = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'))
+    future = pool.submit(write_report, report_directory, report_data)
+    # The submitted report still completes; the worker exits once it is done
+    pool.shutdown(wait=False)
+    return future
+
+
+def write_metrics(report_directory, metrics):
+    """
+    Writes the metrics of the evaluation to `metrics.json` in the report directory.
+
+    Args:
+        report_directory (str): The directory the report is written to.
+        metrics (dict): The metrics; numpy values and arrays are converted to JSON numbers and lists.
+
+    Returns:
+        str: The path of the metrics file.
+    """
+    def to_json(value):
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+        if isinstance(value, np.generic):
+            return value.item()
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    os.makedirs(report_directory, exist_ok=True)
+    metrics_path = os.path.join(report_directory, 'metrics.json')
+    with open(f'{metrics_path}.tmp', 'w', encoding='utf-8') as metrics_file:
+        json.dump(metrics, metrics_file, indent=2, default=to_json)
+    os.replace(f'{metrics_path}.tmp', metrics_path)
+    return metrics_path
@@ -0,0 +1,56 @@
+import json  # For reading the metrics file back
+import os  # For checking the report files
+
+import numpy as np  # For building the test inputs
+
+import evaluation_report  # Module under test
+
+# Report data of two models over three classes, as built by the training script
+binarized_labels = np.eye(3)[[0, 1, 2, 0, 1, 2]]
+report_data = {
+    'label_counts': {'0': 2, '1': 2, '2': 2},
+    'class_names': [0, 1, 2],
+    'best_model': 'Perfect',
+    'models': {
+        name: {'roc': evaluation_report.compute_roc(binarized_labels, scores), 'mape': 0.1, 'wape': 0.2,
+               'confusion': np.diag([2, 2, 2]), 'accuracy': 1.0}
+        for name, scores in {'Perfect': binarized_labels, 'Constant': np.full((6, 3), 1 / 3)}.items()
+    },
+}
+
+
+def test_compute_roc():
+    """
+    Tests the micro-averaged AUC of perfect and uninformative scores.
+    """
+    assert report_data['models']['Perfect']['roc']['auc'] == 1.0
+    assert report_data['models']['Perfect']['roc']['class_auc'] == [1.0, 1.0, 1.0]
+    assert report_data['models']['Constant']['roc']['auc'] == 0.5
+
+
+def test_report_is_rendered_headless_in_the_background(tmp_path):
+    """
+    Tests that the report is rendered by a background process into one PNG per figure and a
+    self-contained HTML page embedding them all.
+    """
+    report_path = evaluation_report.write_report_in_background(str(tmp_path), report_data).result(timeout=300)
+
+    # Label distribution, ROC curves, errors, one confusion matrix per model and accuracy
+    figure_names = ['label_distribution', 'roc_curves', 'error_comparison', 'confusion_matrix_0',
+                    'confusion_matrix_1', 'accuracy_comparison']
+    assert report_path == os.path.join(str(tmp_path), 'report.html')
+    for name in figure_names:
+        assert os.path.getsize(tmp_path / f'{name}.png') > 0
+    with open(report_path, encoding='utf-8') as report_file:
+        assert report_file.read().count('src="data:image/png;base64,') == len(figure_names)
+
+
+def test_metrics_are_written_as_json(tmp_path):
+    """
+    Tests that the metrics, including numpy numbers and arrays, are written to metrics.json.
+    """
+    metrics_path = evaluation_report.write_metrics(str(tmp_path), {
+        'accuracy': np.float64(0.75), 'confusion_matrix': np.diag([1, 2]), 'epochs': np.int64(3)})
+
+    with open(metrics_path, encoding='utf-8') as metrics_file:
+        assert json.load(metrics_file) == {'accuracy': 0.75, 'confusion_matrix': [[1, 0], [0, 2]], 'epochs': 3}
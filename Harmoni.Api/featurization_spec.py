@@ -0,0 +1,143 @@
+"""
+Versioned featurization spec shared by the training script and the API.
+
+`featurization_spec.json` describes how a text becomes the features of the models: the preprocessing
+(lowercasing, removed characters, stop words and lemmatizer of TextPreprocessor) and the TF-IDF or
+hashed vectorizer fitted on its output. The training script builds its preprocessing and vectorizer
+from it and stamps the resolved spec, with the exact stop word list, into every model it saves.
+The API checks the stamped spec of the model it loads against the preprocessing it serves with,
+so that training and serving features can't silently drift apart.
+
+The 'stop_words' of the preprocessing are either "nltk:english", the NLTK English stop words without
+the 'keep_stop_words', or, in a resolved spec, the list of the stop words themselves.
+"""
+import copy
+import hashlib
+import json
+import os
+
+# Version of the spec layout and preprocessing rules, increased when the features of a text change
+featurization_spec_version = 1
+
+# The spec shipped with the code, loaded by default
+default_spec_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'featurization_spec.json')
+
+
+def load_featurization_spec(path=default_spec_path):
+    """
+    Loads a featurization spec.
+
+    Args:
+        path (str): The spec file. Defaults to the spec shipped with the code.
+
+    Returns:
+        dict: The spec.
+
+    Raises:
+        ValueError: If the spec has a version this code doesn't implement.
+    """
+    with open(path) as spec_file:
+        spec = json.load(spec_file)
+    if spec['version'] != featurization_spec_version:
+        raise ValueError(f"Unsupported featurization spec version {spec['version']}, "
+                         f"expected {featurization_spec_version}")
+    return spec
+
+
+def spec_stop_words(spec):
+    """
+    Returns the stop words removed by the preprocessing of a spec, resolved or not.
+
+    Returns:
+        set[str]: The stop words.
+    """
+    stop_words = spec['preprocessing']['stop_words']
+    if isinstance(stop_words, list):
+        return set(stop_words)
+    if stop_words != 'nltk:english':
+        raise ValueError(f"Unknown stop words '{stop_words}', expected 'nltk:english' or a list")
+    from nltk.corpus import stopwords
+
+    return set(stopwords.words('english')) - set(spec['preprocessing'].get('keep_stop_words', ()))
+
+
+def resolve_featurization_spec(spec, stop_words=None):
+    """
+    Returns the spec to stamp into a model: the stop word list is spelled out, so the model keeps
+    describing its own training even if the NLTK data or the shipped spec change, and an 'id' hashes it all.
+
+    Args:
+        spec (dict): The spec, e.g. from `load_featurization_spec`.
+        stop_words (iterable[str]): The stop words the training removed. Defaults to those of the spec.
+
+    Returns:
+        dict: The resolved spec.
+    """
+    resolved = copy.deepcopy(spec)
+    resolved.pop('id', None)
+    resolved['preprocessing']['stop_words'] = sorted(spec_stop_words(spec) if stop_words is None else stop_words)
+    resolved['id'] = hashlib.sha256(json.dumps(resolved, sort_keys=True).encode()).hexdigest()[:16]
+    return resolved
+
+
+def create_vectorizer(spec, stop_words):
+    """
+    Creates the unfitted vectorizer of a spec: a TfidfVectorizer, or the hashing pipeline of
+    `make_hashing_vectorizer` for the 'hashing' mode.
+
+    Args:
+        spec (dict): The spec.
+        stop_words (iterable[str]): The stop words removed by the preprocessing, also removed by the vectorizer.
+
+    Returns:
+        TfidfVectorizer | Pipeline: The vectorizer.
+    """
+    features = spec['features']
+    options = {'ngram_range': tuple(features['ngram_range']), 'stop_words': sorted(stop_words)}
+    if features['mode'] == 'hashing':
+        from TfidfFeaturizer import make_hashing_vectorizer
+
+        return make_hashing_vectorizer(features['hashing_features'], **options)
+    if features['mode'] == 'tfidf':
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        return TfidfVectorizer(max_features=features['max_features'], **options)
+    raise ValueError(f"Unknown feature mode '{features['mode']}', expected 'tfidf' or 'hashing'")
+
+
+def check_featurization_spec(model_spec, serving_spec, text_preprocessor, featurizer=None):
+    """
+    Compares the spec stamped into a model with the preprocessing and features the API serves it with.
+
+    Args:
+        model_spec (dict): The resolved spec of the model, or None for models saved without one.
+        serving_spec (dict): The spec of the serving code, from `load_featurization_spec`.
+        text_preprocessor (TextPreprocessor): The preprocessor the model is served with.
+        featurizer (TfidfFeaturizer): The featurizer the model is served with, or None.
+
+    Returns:
+        list[str]: The differences, empty when the model is served with its training featurization.
+    """
+    if model_spec is None:
+        return ["the model was saved without a featurization spec, its training preprocessing is unknown"]
+    differences = []
+    if model_spec['version'] != serving_spec['version']:
+        differences.append(f"featurization spec version {model_spec['version']}, "
+                           f"the API implements version {serving_spec['version']}")
+    for key in ('lowercase', 'non_letter_pattern', 'lemmatizer'):
+        trained, served = model_spec['preprocessing'].get(key), serving_spec['preprocessing'].get(key)
+        if trained != served:
+            differences.append(f"preprocessing {key} {trained!r} at training, {served!r} when serving")
+
+    trained_stop_words = spec_stop_words(model_spec)
+    removed_only_when_serving = sorted(set(text_preprocessor.stop_words) - trained_stop_words)
+    kept_only_when_serving = sorted(trained_stop_words - set(text_preprocessor.stop_words))
+    if removed_only_when_serving:
+        differences.append(f"stop words removed only when serving: {', '.join(removed_only_when_serving[:10])}")
+    if kept_only_when_serving:
+        differences.append(f"stop words kept only when serving: {', '.join(kept_only_when_serving[:10])}")
+
+    if featurizer is not None and list(featurizer.ngram_range) != list(model_spec['features']['ngram_range']):
+        differences.append(f"n-gram range {model_spec['features']['ngram_range']} at training, "
+                           f"{list(featurizer.ngram_range)} when serving")
+    return differences
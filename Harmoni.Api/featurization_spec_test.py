@@ -0,0 +1,64 @@
+import pytest  # Python testing framework
+from sklearn.feature_extraction.text import TfidfVectorizer  # The vectorizer of the default spec
+
+from TextPreprocessor import TextPreprocessor  # The preprocessing the spec describes
+from featurization_spec import (check_featurization_spec, create_vectorizer, load_featurization_spec,  # Under test
+                                resolve_featurization_spec, spec_stop_words)
+
+
+def identity(word):
+    """
+    Fake lemmatizer returning the word itself.
+    """
+    return word
+
+
+def test_shipped_spec_describes_the_text_preprocessor():
+    """
+    Tests that the spec shipped with the code matches what TextPreprocessor implements and keeps 'not'.
+    """
+    spec = load_featurization_spec()
+    assert spec['preprocessing']['non_letter_pattern'] == TextPreprocessor.non_letter_pattern.pattern
+    stop_words = spec_stop_words(spec)
+    assert 'not' not in stop_words  # Assert that 'not' is kept in the texts
+    assert {'the', 'a', 'i'} <= stop_words
+    assert isinstance(create_vectorizer(spec, stop_words), TfidfVectorizer)
+
+
+def test_resolved_spec_spells_out_its_stop_words():
+    """
+    Tests that a resolved spec lists its stop words and gets an id that changes with them.
+    """
+    spec = load_featurization_spec()
+    resolved = resolve_featurization_spec(spec, {'the', 'a'})
+    assert resolved['preprocessing']['stop_words'] == ['a', 'the']
+    assert spec_stop_words(resolved) == {'a', 'the'}
+    assert resolved['id'] == resolve_featurization_spec(resolved, {'a', 'the'})['id']  # Assert a stable id
+    assert resolved['id'] != resolve_featurization_spec(spec, {'the'})['id']
+
+
+def test_check_reports_the_preprocessing_differences():
+    """
+    Tests that serving with other stop words, another preprocessing or without a spec is reported,
+    and that serving with the training featurization isn't.
+    """
+    serving_spec = load_featurization_spec()
+    model_spec = resolve_featurization_spec(serving_spec, {'the', 'a'})
+
+    assert check_featurization_spec(model_spec, serving_spec, TextPreprocessor({'the', 'a'}, identity)) == []
+    differences = check_featurization_spec(model_spec, serving_spec, TextPreprocessor({'the', 'a', 'not'}, identity))
+    assert differences == ["stop words removed only when serving: not"]  # Assert that the dropped 'not' is found
+
+    model_spec['preprocessing']['lemmatizer'] = 'porter'
+    assert len(check_featurization_spec(model_spec, serving_spec, TextPreprocessor({'the', 'a'}, identity))) == 1
+    assert len(check_featurization_spec(None, serving_spec, TextPreprocessor({'the'}, identity))) == 1
+
+
+def test_unsupported_spec_version_is_rejected(tmp_path):
+    """
+    Tests that a spec of another version isn't loaded.
+    """
+    spec_path = tmp_path / 'featurization_spec.json'
+    spec_path.write_text('{"version": 99, "preprocessing": {}, "features": {}}')
+    with pytest.raises(ValueError):
+        load_featurization_spec(str(spec_path))
@@ -0,0 +1,326 @@
+"""
+Incremental update of the trained emotion model with newly labeled messages, without a full retrain.
+
+The model bundle saved by the training script is updated in place of retraining every candidate:
+Naive Bayes and SGD-style linear models with `partial_fit`, and the EmotionClassifier network by
+fine-tuning its current weights for a few epochs with a low learning rate. The fitted TF-IDF
+vectorizer and label encoder are kept frozen, so the feature space and the labels don't change and
+the texts are preprocessed and featurized exactly like the API does.
+
+Models without `partial_fit` (Logistic Regression, Linear SVM, Decision Tree) can't be updated. When
+the best model is one of them, the training script also saves the best candidate that can, e.g. the
+SGD Classifier, as the `incremental_emotion_model.joblib` bundle, and that model is updated instead.
+
+The update only replaces the model if it passes an accuracy gate on a holdout set: its accuracy
+must not drop by more than `--max-accuracy-drop` below the accuracy of the best model, nor be below
+`--min-accuracy`. The updated bundle and its compact artifact are then written to the output directory
+(the model directory by default). The bundle file is replaced atomically, while the artifact directory
+is swapped in by renames that leave it missing for an instant (see `replace_directory`). The updated
+model also replaces its artifact in the pool of candidate models `candidate_models/`, as its primary
+model, and the cascade `best_emotion_cascade/` is removed if the updated model is one of its stages,
+since its threshold was tuned for the previous one; emotions.py exports it again.
+
+Usage, from the Harmoni.Api directory:
+    python incremental_update.py new_messages.csv holdout.csv --model-dir .
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from model_artifact import export_artifact
+from model_loader import create_featurizer, create_text_preprocessor, featurize, load_model, predict_probabilities
+from model_pool import update_model_pool
+
+# Bundle of the best candidate that can be updated incrementally, saved by the training script when the
+# best model can't be
+fallback_bundle_name = 'incremental_emotion_model.joblib'
+
+
+def encode_labels(label_encoder, labels):
+    """
+    Encodes labels with the frozen label encoder of the model.
+
+    Raises:
+        ValueError: If some labels weren't seen by the model.
+    """
+    labels = np.asarray(labels)
+    unknown_labels = set(labels.tolist()) - set(np.asarray(label_encoder.classes_).tolist())
+    if unknown_labels:
+        raise ValueError(f"Labels unknown to the model, which needs a full retrain: {sorted(unknown_labels)}")
+    return label_encoder.transform(labels)
+
+
+def read_labeled_texts(data_path, model_data, text_preprocessor, featurizer, text_column='text',
+                       label_column='label'):
+    """
+    Reads a CSV file of labeled texts and computes their features and class numbers.
+
+    Returns:
+        tuple: The TF-IDF features and the class numbers.
+    """
+    data = pd.read_csv(data_path, usecols=[text_column, label_column])
+    texts = data[text_column].fillna('').astype(str).tolist()
+    features = featurize(model_data, featurizer, text_preprocessor.tokenize_batch(texts))
+    return features, encode_labels(model_data['label_encoder'], data[label_column])
+
+
+def predict_classes(model_data, features):
+    """
+    Predicts the class numbers of TF-IDF features.
+    """
+    if model_data['is_pytorch_model']:
+        # Sparse forward pass, without densifying the whole holdout set
+        model_data['model'].eval()
+        return predict_probabilities(model_data, features).argmax(axis=1)
+    return np.asarray(model_data['model'].predict(features))
+
+
+def can_update_incrementally(model_data):
+    """
+    Returns whether a loaded model can learn new samples without a full retrain: PyTorch networks and models
+    with `partial_fit`.
+    """
+    return model_data['is_pytorch_model'] or hasattr(model_data['model'], 'partial_fit')
+
+
+def load_fallback_model(model_data, model_directory, report=print):
+    """
+    Returns the model bundle to update in place of a best model that can't be updated incrementally:
+    the fallback bundle saved by the training script, featurized like the best model.
+
+    Raises:
+        ValueError: If the directory has no fallback bundle.
+    """
+    import joblib
+
+    fallback_path = os.path.join(model_directory, fallback_bundle_name)
+    if not os.path.exists(fallback_path):
+        raise ValueError(f"Models of type {type(model_data['model']).__name__} can't be updated incrementally "
+                         f"and {model_directory} has no {fallback_bundle_name}, retrain them with emotions.py")
+    fallback = joblib.load(fallback_path)
+    report(f"The {type(model_data['model']).__name__} of {model_data['path']} can't be updated incrementally, "
+           f"updating the {fallback.get('model_name')} of {fallback_path} instead")
+    # Trained by the same run on the same features, so only the model and its name differ
+    return {**model_data, 'model': fallback['model'], 'display_name': fallback.get('model_name'),
+            'path': fallback_path}
+
+
+def update_model(model_data, features, labels, network_options=None, report=print):
+    """
+    Updates a trained model with new samples, in place.
+
+    Args:
+        model_data (dict): The model bundle returned by `load_model(..., compact=False)`.
+        features (scipy.sparse matrix): The TF-IDF features of the new samples.
+        labels (np.ndarray): The class numbers of the new samples.
+        network_options (dict): Other arguments of `model_training.train_network` for networks.
+        report (callable): Function receiving the progress messages.
+
+    Raises:
+        ValueError: If the model can't be updated incrementally.
+    """
+    model = model_data['model']
+    if model_data['is_pytorch_model']:
+        import torch
+        from sklearn.model_selection import train_test_split
+
+        from SparseFeatureDataset import SparseFeatureDataset
+        from model_training import train_network
+
+        # Fine-tune the current weights, stopping on a validation split of the new samples
+        fit_indices, validation_indices = train_test_split(np.arange(len(labels)), test_size=0.1, random_state=42)
+        options = {'max_epochs': 5, 'patience': 2, 'learning_rate': 0.0001, **(network_options or {})}
+        train_network(model, SparseFeatureDataset(features[fit_indices], labels[fit_indices]),
+                      SparseFeatureDataset(features[validation_indices], labels[validation_indices]),
+                      torch.device('cpu'), report=report, **options)
+    elif hasattr(model, 'partial_fit'):
+        model.partial_fit(features, labels)
+    else:
+        raise ValueError(f"Models of type {type(model).__name__} can't be updated incrementally, "
+                         f"retrain them with emotions.py")
+
+
+def save_bundle(model_data, output_directory):
+    """
+    Saves an updated model bundle in the format it was loaded from, replacing the previous one atomically.
+
+    Returns:
+        str: The path of the bundle.
+    """
+    bundle = {
+        'label_encoder': model_data['label_encoder'],
+        'tfidf_vectorizer': model_data['tfidf_vectorizer'],
+        'lemma_table': model_data['lemma_table'],
+        'stop_words': model_data['stop_words'],
+        'featurization_spec': model_data['featurization_spec'],
+        'model_name': model_data['display_name'],
+    }
+    os.makedirs(output_directory, exist_ok=True)
+    model = model_data['model']
+    if model_data['is_pytorch_model']:
+        import torch
+        from EmotionClassifier import EmotionClassifier
+
+        path = os.path.join(output_directory, 'best_emotion_model.pth')
+        if isinstance(model, EmotionClassifier):
+            bundle = {'model_state_dict': model.state_dict(), 'input_size': model.fc1.in_features,
+                      'num_classes': model.fc3.out_features, **bundle}
+        else:
+            bundle = model
+        torch.save(bundle, f'{path}.tmp')
+    else:
+        import joblib
+
+        path = os.path.join(output_directory, 'best_emotion_model.joblib')
+        joblib.dump({'model': model, **bundle}, f'{path}.tmp')
+    os.replace(f'{path}.tmp', path)
+    return path
+
+
+def refresh_derived_models(model_data, model_directory, output_directory, report=print):
+    """
+    Brings the pool of candidate models and the cascade of the output directory in line with an updated model:
+    the model replaces its artifact in the pool, as its primary model, and a cascade using it is removed.
+    """
+    model_name = model_data['display_name']
+    pool_path = os.path.join(model_directory, 'candidate_models')
+    if os.path.isdir(pool_path):
+        with open(os.path.join(pool_path, 'pool.json')) as pool_file:
+            pool = json.load(pool_file)
+        try:
+            # Bundles saved without their name are the best model of the training, the primary model of the pool
+            update_model_pool(pool_path, model_name or pool['models'][pool['primary']], model_data['model'],
+                              model_data['tfidf_vectorizer'], model_data['label_encoder'],
+                              lemma_table=model_data['lemma_table'], preprocessing_stop_words=model_data['stop_words'],
+                              featurization_spec=model_data['featurization_spec'],
+                              output_path=os.path.join(output_directory, 'candidate_models'))
+        except ValueError as error:
+            report(f"Candidate models not updated: {error}")
+
+    cascade_path = os.path.join(output_directory, 'best_emotion_cascade')
+    if os.path.isdir(cascade_path):
+        with open(os.path.join(cascade_path, 'cascade.json')) as cascade_file:
+            stage_names = json.load(cascade_file)['models'].values()
+        if model_name is None or model_name in stage_names:
+            shutil.rmtree(cascade_path)
+            report(f"Cascade {cascade_path} removed, its threshold was tuned for the previous {model_name or 'model'}; "
+                   f"retrain with emotions.py to export it again")
+
+
+def update_model_directory(new_data_path, holdout_path, model_directory='.', output_directory=None,
+                           text_column='text', label_column='label', max_accuracy_drop=0.01, min_accuracy=None,
+                           network_options=None, report=print):
+    """
+    Updates the model of a directory with newly labeled texts, if it passes the accuracy gate.
+
+    Args:
+        new_data_path (str): The CSV file of the new labeled texts.
+        holdout_path (str): The CSV file of the labeled texts the accuracy gate is evaluated on.
+        model_directory (str): The directory containing the model bundle.
+        output_directory (str): The directory the updated model is written to. Defaults to the model directory.
+        text_column (str): The column holding the texts.
+        label_column (str): The column holding the labels.
+        max_accuracy_drop (float): The largest holdout accuracy drop accepted.
+        min_accuracy (float): The lowest holdout accuracy accepted, or None.
+        network_options (dict): Other arguments of `model_training.train_network` for networks.
+        report (callable): Function receiving the progress messages.
+
+    Returns:
+        dict: The 'samples' learned, the holdout 'accuracy_before' the update (of the best model) and 'accuracy_after'
+            it (of the updated model), whether it was 'accepted', the 'bundle_path' written (or None) and the
+            'seconds' the update took.
+
+    Raises:
+        ValueError: If neither the model nor a fallback model can be updated incrementally, or the data has labels
+            unknown to the model.
+    """
+    start_time = time.perf_counter()
+    output_directory = output_directory or model_directory
+    model_data = load_model(model_directory, compact=False)
+    # The stop words of the featurization spec ('not' is kept), for bundles saved without them
+    text_preprocessor = create_text_preprocessor(model_data)
+    model_data['stop_words'] = set(text_preprocessor.stop_words)
+    featurizer = create_featurizer(model_data)
+
+    features, labels = read_labeled_texts(new_data_path, model_data, text_preprocessor, featurizer, text_column,
+                                          label_column)
+    holdout_features, holdout_labels = read_labeled_texts(holdout_path, model_data, text_preprocessor, featurizer,
+                                                          text_column, label_column)
+    accuracy_before = float(np.mean(predict_classes(model_data, holdout_features) == holdout_labels))
+    if not can_update_incrementally(model_data):
+        model_data = load_fallback_model(model_data, model_directory, report)
+    report(f"Updating the {type(model_data['model']).__name__} of {model_data['path']} with {len(labels)} samples")
+    update_model(model_data, features, labels, network_options, report)
+    accuracy_after = float(np.mean(predict_classes(model_data, holdout_features) == holdout_labels))
+
+    accepted = accuracy_after >= accuracy_before - max_accuracy_drop and (min_accuracy is None
+                                                                         or accuracy_after >= min_accuracy)
+    report(f"Holdout accuracy {accuracy_before:.4f} -> {accuracy_after:.4f}: "
+           f"{'accepted' if accepted else 'rejected, the model is left unchanged'}")
+    bundle_path = None
+    if accepted:
+        bundle_path = save_bundle(model_data, output_directory)
+        try:
+            export_artifact(os.path.join(output_directory, 'best_emotion_model'), model_data['model'],
+                            model_data['tfidf_vectorizer'], model_data['label_encoder'],
+                            lemma_table=model_data['lemma_table'],
+                            preprocessing_stop_words=model_data['stop_words'],
+                            featurization_spec=model_data['featurization_spec'])
+        except ValueError as error:
+            report(f"Compact artifact not exported: {error}")
+        refresh_derived_models(model_data, model_directory, output_directory, report)
+        fallback_path = os.path.join(output_directory, fallback_bundle_name)
+        if os.path.basename(model_data['path']) == fallback_bundle_name and os.path.exists(fallback_path):
+            # The updated fallback model is now the best model, which can be updated itself
+            os.remove(fallback_path)
+    return {
+        'samples': len(labels),
+        'accuracy_before': accuracy_before,
+        'accuracy_after': accuracy_after,
+        'accepted': accepted,
+        'bundle_path': bundle_path,
+        'seconds': time.perf_counter() - start_time,
+    }
+
+
+def main():
+    """
+    Updates the trained emotion model with newly labeled texts, without a full retrain.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('new_data', help='the CSV file of the new labeled texts')
+    parser.add_argument('holdout', help='the CSV file of the labeled texts the accuracy gate is evaluated on')
+    parser.add_argument('--model-dir', default=os.getenv('HARMONI_MODEL_DIR', '.'),
+                        help='directory containing the model (default: $HARMONI_MODEL_DIR or .)')
+    parser.add_argument('--output-dir', help='directory the updated model is written to (default: the model directory)')
+    parser.add_argument('--text-column', default='text', help='column holding the texts (default: text)')
+    parser.add_argument('--label-column', default='label', help='column holding the labels (default: label)')
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.01,
+                        help='largest holdout accuracy drop accepted (default: 0.01)')
+    parser.add_argument('--min-accuracy', type=float, help='lowest holdout accuracy accepted')
+    parser.add_argument('--epochs', type=int, default=5, help='maximum fine-tuning epochs of networks (default: 5)')
+    args = parser.parse_args()
+    if args.epochs < 1:
+        parser.error('--epochs must be at least 1')
+
+    try:
+        summary = update_model_directory(args.new_data, args.holdout, model_directory=args.model_dir,
+                                         output_directory=args.output_dir, text_column=args.text_column,
+                                         label_column=args.label_column, max_accuracy_drop=args.max_accuracy_drop,
+                                         min_accuracy=args.min_accuracy, network_options={'max_epochs': args.epochs},
+                                         report=lambda message: print(message, file=sys.stderr))
+    except (FileNotFoundError, ValueError) as error:
+        sys.exit(str(error))
+    print(f"{summary['samples']} samples learned in {summary['seconds']:.1f} s")
+    if not summary['accepted']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
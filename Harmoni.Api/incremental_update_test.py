@@ -0,0 +1,195 @@
+import os  # For checking the written files
+
+import joblib  # To save the model bundles
+import numpy as np  # For building the test data
+import pandas as pd  # To write the labeled texts
+import pytest  # Testing framework
+import torch  # To create the network
+from sklearn.feature_extraction.text import TfidfVectorizer  # For fitting the model vectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier  # Models without and with partial_fit
+from sklearn.naive_bayes import ComplementNB, MultinomialNB  # Models with partial_fit
+from sklearn.preprocessing import LabelEncoder  # For encoding the labels
+
+import incremental_update  # Module under test
+from EmotionClassifier import EmotionClassifier  # Network fine-tuned by the update
+from model_cascade import export_cascade  # To export the cascade next to the model
+from model_loader import find_model_version, load_model  # To load the updated model
+from model_pool import export_model_pool, load_model_pool  # To export the pool of candidate models
+
+# Words telling every emotion apart, and words found in every text
+emotion_words = {0: ['sad', 'cry'], 1: ['happy', 'joy'], 2: ['love', 'adore'], 3: ['angry', 'mad'],
+                 4: ['scared', 'fear'], 5: ['wow', 'surprise']}
+filler_words = ['day', 'night', 'friend', 'work']
+stop_words = ['the', 'a']
+
+
+def make_texts(num_texts, seed):
+    """
+    Builds labeled texts whose emotion words give their label away.
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.arange(num_texts) % 6
+    texts = [' '.join(rng.choice(filler_words, 3).tolist() + rng.choice(emotion_words[label], 2).tolist())
+             for label in labels]
+    return texts, labels
+
+
+def write_texts(path, num_texts, seed):
+    texts, labels = make_texts(num_texts, seed)
+    pd.DataFrame({'text': texts, 'label': labels}).to_csv(path, index=False)
+    return str(path)
+
+
+def fit_vectorizer():
+    vocabulary = filler_words + [word for words in emotion_words.values() for word in words]
+    return TfidfVectorizer().fit([' '.join(vocabulary)])
+
+
+@pytest.fixture
+def naive_bayes_directory(tmp_path):
+    """
+    Pytest fixture saving a Multinomial Naive Bayes bundle fitted on few texts.
+    """
+    tfidf_vectorizer = fit_vectorizer()
+    texts, labels = make_texts(12, 0)
+    model = MultinomialNB().fit(tfidf_vectorizer.transform(texts), labels)
+    joblib.dump({'model': model, 'label_encoder': LabelEncoder().fit(range(6)), 'tfidf_vectorizer': tfidf_vectorizer,
+                 'lemma_table': None, 'stop_words': stop_words}, tmp_path / 'best_emotion_model.joblib')
+    return str(tmp_path)
+
+
+def test_naive_bayes_is_updated_with_partial_fit(tmp_path, naive_bayes_directory):
+    """
+    Tests that a Naive Bayes model learns the new samples on top of its training, with the same
+    vocabulary, and that the updated bundle and compact artifact are written.
+    """
+    summary = incremental_update.update_model_directory(write_texts(tmp_path / 'new.csv', 60, 1),
+                                                        write_texts(tmp_path / 'holdout.csv', 30, 2),
+                                                        naive_bayes_directory, report=lambda message: None)
+    updated = load_model(naive_bayes_directory, compact=False)
+
+    assert summary['accepted'] and summary['samples'] == 60
+    assert summary['accuracy_after'] >= summary['accuracy_before']
+    assert updated['model'].class_count_.sum() == 12 + 60  # Training and new samples
+    assert updated['tfidf_vectorizer'].vocabulary_ == fit_vectorizer().vocabulary_  # Frozen feature space
+    assert os.path.isdir(os.path.join(naive_bayes_directory, 'best_emotion_model'))
+
+
+def test_network_is_fine_tuned_from_its_weights(tmp_path):
+    """
+    Tests that the network is fine-tuned from its current weights and saved in the bundle format.
+    """
+    torch.manual_seed(0)
+    tfidf_vectorizer = fit_vectorizer()
+    model = EmotionClassifier(len(tfidf_vectorizer.vocabulary_), 6).eval()
+    initial_weight = model.fc1.weight.detach().clone()
+    torch.save({'model_state_dict': model.state_dict(), 'input_size': model.fc1.in_features, 'num_classes': 6,
+                'label_encoder': LabelEncoder().fit(range(6)), 'tfidf_vectorizer': tfidf_vectorizer,
+                'lemma_table': None, 'stop_words': stop_words}, tmp_path / 'best_emotion_model.pth')
+
+    summary = incremental_update.update_model_directory(write_texts(tmp_path / 'new.csv', 120, 1),
+                                                        write_texts(tmp_path / 'holdout.csv', 30, 2), str(tmp_path),
+                                                        max_accuracy_drop=1.0,
+                                                        network_options={'learning_rate': 0.01, 'max_epochs': 3},
+                                                        report=lambda message: None)
+    updated = load_model(str(tmp_path), compact=False)
+
+    assert summary['accepted'] and summary['bundle_path'].endswith('best_emotion_model.pth')
+    assert not torch.equal(updated['model'].fc1.weight, initial_weight)
+    assert summary['accuracy_after'] > summary['accuracy_before']
+
+
+def test_rejected_update_leaves_the_model_unchanged(tmp_path, naive_bayes_directory):
+    """
+    Tests that an update failing the accuracy gate isn't written.
+    """
+    bundle_path = os.path.join(naive_bayes_directory, 'best_emotion_model.joblib')
+    modified_time = os.stat(bundle_path).st_mtime_ns
+
+    summary = incremental_update.update_model_directory(write_texts(tmp_path / 'new.csv', 60, 1),
+                                                        write_texts(tmp_path / 'holdout.csv', 30, 2),
+                                                        naive_bayes_directory, min_accuracy=1.01,
+                                                        report=lambda message: None)
+
+    assert not summary['accepted'] and summary['bundle_path'] is None
+    assert os.stat(bundle_path).st_mtime_ns == modified_time
+    assert not os.path.exists(os.path.join(naive_bayes_directory, 'best_emotion_model'))
+
+
+def test_models_without_partial_fit_and_unknown_labels_are_rejected(tmp_path, naive_bayes_directory):
+    """
+    Tests that models that can't learn incrementally and labels unknown to the model raise a ValueError.
+    """
+    new_data_path = write_texts(tmp_path / 'new.csv', 12, 1)
+    unknown_path = tmp_path / 'unknown.csv'
+    pd.DataFrame({'text': ['happy day'], 'label': [7]}).to_csv(unknown_path, index=False)
+    with pytest.raises(ValueError, match='Labels unknown'):
+        incremental_update.update_model_directory(str(unknown_path), new_data_path, naive_bayes_directory,
+                                                  report=lambda message: None)
+
+    tfidf_vectorizer = fit_vectorizer()
+    texts, labels = make_texts(12, 0)
+    joblib.dump({'model': LogisticRegression().fit(tfidf_vectorizer.transform(texts), labels),
+                 'label_encoder': LabelEncoder().fit(range(6)), 'tfidf_vectorizer': tfidf_vectorizer},
+                tmp_path / 'best_emotion_model.joblib')
+    with pytest.raises(ValueError, match="can't be updated incrementally"):
+        incremental_update.update_model_directory(new_data_path, new_data_path, str(tmp_path),
+                                                  report=lambda message: None)
+
+
+def test_fallback_model_is_updated_and_replaces_the_best_model_in_the_pool(tmp_path):
+    """
+    Tests that a best model without partial_fit falls back to the SGD bundle saved by the training, which becomes
+    the best model and the primary model of the pool once updated, while a cascade not using it is kept.
+    """
+    tfidf_vectorizer = fit_vectorizer()
+    texts, labels = make_texts(12, 0)
+    features = tfidf_vectorizer.transform(texts)
+    label_encoder = LabelEncoder().fit(range(6))
+    models = {"Logistic Regression": LogisticRegression().fit(features, labels),
+              "SGD Classifier": SGDClassifier(loss='log_loss', random_state=42).fit(features, labels),
+              "Complement Naive Bayes": ComplementNB().fit(features, labels)}
+    bundle = {'label_encoder': label_encoder, 'tfidf_vectorizer': tfidf_vectorizer, 'lemma_table': None,
+              'stop_words': stop_words}
+    joblib.dump({'model': models["Logistic Regression"], 'model_name': "Logistic Regression", **bundle},
+                tmp_path / 'best_emotion_model.joblib')
+    joblib.dump({'model': models["SGD Classifier"], 'model_name': "SGD Classifier", **bundle},
+                tmp_path / incremental_update.fallback_bundle_name)
+    previous_pool = export_model_pool(str(tmp_path / 'candidate_models'), models, "Logistic Regression",
+                                      tfidf_vectorizer, label_encoder)
+    export_cascade(str(tmp_path / 'best_emotion_cascade'), models["Complement Naive Bayes"],
+                   models["Logistic Regression"], tfidf_vectorizer, label_encoder,
+                   {'threshold': 0.5, 'accuracy': 1.0, 'escalation_rate': 0.5},
+                   model_names={'cheap': "Complement Naive Bayes", 'expensive': "Logistic Regression"})
+
+    summary = incremental_update.update_model_directory(write_texts(tmp_path / 'new.csv', 120, 1),
+                                                        write_texts(tmp_path / 'holdout.csv', 30, 2), str(tmp_path),
+                                                        max_accuracy_drop=1.0, report=lambda message: None)
+    updated = load_model(str(tmp_path), compact=False)
+
+    assert summary['accepted']
+    assert isinstance(updated['model'], SGDClassifier)  # Assert that the updated fallback is the best model
+    assert updated['display_name'] == "SGD Classifier"
+    assert not os.path.exists(tmp_path / incremental_update.fallback_bundle_name)
+    pool = load_model_pool(str(tmp_path / 'candidate_models'))
+    assert pool['primary'] == 'sgd_classifier' and pool['version'] != previous_pool['version']
+    assert os.path.isdir(tmp_path / 'best_emotion_cascade')  # Assert that the cascade without it is kept
+
+
+def test_cascade_using_the_updated_model_is_removed(tmp_path, naive_bayes_directory):
+    """
+    Tests that the cascade is removed when the updated model may be one of its stages, here a bundle saved
+    without its name, since its threshold is stale.
+    """
+    model_data = load_model(naive_bayes_directory, compact=False)
+    export_cascade(str(tmp_path / 'best_emotion_cascade'), model_data['model'], model_data['model'],
+                   model_data['tfidf_vectorizer'], model_data['label_encoder'],
+                   {'threshold': 0.5, 'accuracy': 1.0, 'escalation_rate': 0.5},
+                   model_names={'cheap': "Multinomial Naive Bayes", 'expensive': "Multinomial Naive Bayes"})
+    assert find_model_version(naive_bayes_directory, cascade=True) is not None
+
+    incremental_update.update_model_directory(write_texts(tmp_path / 'new.csv', 60, 1),
+                                              write_texts(tmp_path / 'holdout.csv', 30, 2), naive_bayes_directory,
+                                              report=lambda message: None)
+
+    assert not os.path.exists(tmp_path / 'best_emotion_cascade')  # Assert that the stale cascade isn't served
@@ -0,0 +1,145 @@
+"""
+CPU inference backends of PyTorch models.
+
+The API runs its PyTorch model in fp32 eager mode by default. This module prepares alternatives
+selected at model load time, each taking the same dense feature tensor and returning the logits:
+    - "eager": the model itself.
+    - "int8": the Linear layers dynamically quantized to int8, which mostly speeds up fc1.
+    - "torchscript": the model traced, frozen and optimized for inference with TorchScript.
+    - "compile": the model compiled with `torch.compile` (needs a C++ compiler on the host).
+    - "onnx": the model exported to ONNX and run with onnxruntime, when it is installed.
+
+Quantized and compiled models can make slightly different predictions than the eager one, so
+`check_parity` compares a backend against the eager model on a held-out set before it is trusted.
+"""
+import os
+import tempfile
+
+import numpy as np
+import torch
+from torch import nn
+
+inference_backends = ('eager', 'int8', 'torchscript', 'compile', 'onnx')
+
+
+class OnnxModel:
+    """
+    Runs an ONNX export of a model with onnxruntime, taking and returning torch tensors like the model.
+    """
+
+    def __init__(self, model, input_size):
+        """
+        Args:
+            model (nn.Module): The model to export, in evaluation mode.
+            input_size (int): The number of input features.
+
+        Raises:
+            ImportError: If onnxruntime isn't installed.
+        """
+        import onnxruntime
+
+        example_features = torch.zeros(1, input_size)
+        with tempfile.TemporaryDirectory() as export_directory:
+            export_path = os.path.join(export_directory, 'model.onnx')
+            # The batch dimension stays dynamic so one session serves every batch size
+            torch.onnx.export(model, (example_features,), export_path, input_names=['features'],
+                              output_names=['logits'], dynamic_axes={'features': {0: 'batch'}, 'logits': {0: 'batch'}},
+                              dynamo=False)
+            session_options = onnxruntime.SessionOptions()
+            session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.session = onnxruntime.InferenceSession(export_path, session_options,
+                                                        providers=['CPUExecutionProvider'])
+
+    def __call__(self, features):
+        logits, = self.session.run(['logits'], {'features': features.numpy()})
+        return torch.from_numpy(logits)
+
+
+def prepare_inference_model(model, backend, input_size):
+    """
+    Prepares a model for inference with one of the backends.
+
+    Args:
+        model (nn.Module): The model, in evaluation mode. It is left unchanged.
+        backend (str): One of `inference_backends`.
+        input_size (int): The number of input features, used to trace the model.
+
+    Returns:
+        callable: Function mapping a (batch_size, input_size) float tensor to the logits.
+
+    Raises:
+        ValueError: If the backend is unknown.
+        ImportError: If the backend needs a package that isn't installed (onnxruntime).
+    """
+    if backend not in inference_backends:
+        raise ValueError(f"Unknown torch backend '{backend}', expected one of {', '.join(inference_backends)}")
+    if backend == 'eager':
+        return model
+
+    example_features = torch.zeros(1, input_size)
+    if backend == 'int8':
+        # Weights are stored as int8 and activations quantized on the fly, no calibration data needed
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    if backend == 'torchscript':
+        with torch.no_grad():
+            traced_model = torch.jit.trace(model, example_features)
+        return torch.jit.optimize_for_inference(torch.jit.freeze(traced_model))
+    if backend == 'onnx':
+        return OnnxModel(model, input_size)
+
+    compiled_model = torch.compile(model, dynamic=True)
+    # Compile now rather than on the first request, which also surfaces a missing compiler at load time
+    with torch.no_grad():
+        compiled_model(example_features)
+    return compiled_model
+
+
+def predict_classes(inference_model, features, batch_size=256):
+    """
+    Predicts the class of every row of a feature matrix, batch by batch.
+
+    Args:
+        inference_model (callable): The model or backend returned by `prepare_inference_model`.
+        features (np.ndarray | scipy.sparse matrix): The features, one row per sample.
+        batch_size (int): The number of rows densified and predicted at once.
+
+    Returns:
+        np.ndarray: The predicted class of every row.
+    """
+    predictions = []
+    with torch.no_grad():
+        for start in range(0, features.shape[0], batch_size):
+            batch = features[start:start + batch_size]
+            batch = batch.toarray() if hasattr(batch, 'toarray') else np.asarray(batch)
+            logits = inference_model(torch.from_numpy(batch.astype(np.float32)))
+            predictions.append(logits.argmax(dim=1).numpy())
+    return np.concatenate(predictions) if predictions else np.empty(0, dtype=np.int64)
+
+
+def check_parity(reference_model, inference_model, features, labels=None, batch_size=256):
+    """
+    Compares the predictions of a backend against those of the eager model on a held-out set.
+
+    Args:
+        reference_model (callable): The eager model.
+        inference_model (callable): The backend to check.
+        features (np.ndarray | scipy.sparse matrix): The held-out features.
+        labels (array-like): The held-out labels, to compare the accuracy of both models.
+        batch_size (int): The number of rows predicted at once.
+
+    Returns:
+        dict: The share of rows where both models predict the same class ('agreement') and,
+            with labels, the accuracy of both models and its difference.
+    """
+    reference_predictions = predict_classes(reference_model, features, batch_size)
+    predictions = predict_classes(inference_model, features, batch_size)
+    parity = {
+        'samples': len(predictions),
+        'agreement': float(np.mean(reference_predictions == predictions)) if len(predictions) else 1.0,
+    }
+    if labels is not None:
+        labels = np.asarray(labels)
+        parity['reference_accuracy'] = float(np.mean(reference_predictions == labels))
+        parity['accuracy'] = float(np.mean(predictions == labels))
+        parity['accuracy_delta'] = parity['accuracy'] - parity['reference_accuracy']
+    return parity
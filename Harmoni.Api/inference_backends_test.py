@@ -0,0 +1,46 @@
+import importlib.util  # To skip the ONNX backend when onnxruntime isn't installed
+
+import numpy as np  # For comparing the predictions
+import pytest  # Testing framework
+import torch  # PyTorch library for tensor computations and neural networks
+from scipy import sparse  # For building sparse TF-IDF-like inputs
+
+from EmotionClassifier import EmotionClassifier  # Import the emotion classifier model
+from inference_backends import check_parity, predict_classes, prepare_inference_model  # Functions under test
+
+
+@pytest.mark.parametrize("backend", [
+    "eager",
+    "int8",
+    "torchscript",
+    pytest.param("onnx", marks=pytest.mark.skipif(importlib.util.find_spec("onnxruntime") is None,
+                                                  reason="onnxruntime isn't installed")),
+])
+def test_backend_matches_eager_model(backend):
+    """
+    Tests that every backend predicts like the eager model on TF-IDF-like inputs.
+    torch.compile is left out as it takes tens of seconds to compile.
+    """
+    torch.manual_seed(0)
+    model = EmotionClassifier(200, 6).eval()  # Evaluation mode so dropout is disabled
+    features = sparse.random(64, 200, density=0.05, format='csr', random_state=0, dtype=np.float64)
+    labels = predict_classes(model, features)
+
+    inference_model = prepare_inference_model(model, backend, 200)
+    parity = check_parity(model, inference_model, features, labels)
+
+    # Quantization may flip a few near ties, the others reproduce the eager predictions
+    assert parity['agreement'] >= (0.95 if backend == "int8" else 1.0)
+    # The eager model is right on every row by construction
+    assert parity['reference_accuracy'] == 1.0
+    assert parity['accuracy'] == pytest.approx(parity['agreement'])
+    # The eager model itself is left unchanged (not quantized in place)
+    assert isinstance(model.fc1, torch.nn.Linear)
+
+
+def test_unknown_backend_raises():
+    """
+    Tests that an unknown backend is rejected.
+    """
+    with pytest.raises(ValueError):
+        prepare_inference_model(EmotionClassifier(10, 6).eval(), "tensorrt", 10)
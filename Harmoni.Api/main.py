@@ -1,26 +1,79 @@
-import joblib
-import nltk
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-import re
-import torch
-import torch.nn as nn
-from fastapi import FastAPI
-from pydantic import BaseModel
-
-# Import the EmotionClassifier class
-from EmotionClassifier import EmotionClassifier
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+# Record the startup time of every phase, from the first import to the model being ready
+startup_timings = {}
+startup_phase_started = time.perf_counter()
+
+import numpy as np
+from fastapi import FastAPI, HTTPException, Response, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, Field, ValidationError
+
+from InferenceExecutor import InferenceExecutor
+from MetricsRegistry import MetricsRegistry, RequestMetricsMiddleware
+from MicroBatcher import MicroBatcher
+from ModelRegistry import ModelRegistry
+from PredictionCache import InMemoryCacheBackend, PredictionCache
+from RequestProfiler import RequestProfiler
+from TextPreprocessor import TextPreprocessor
+from featurization_spec import check_featurization_spec, load_featurization_spec
+from model_cascade import escalated_rows
+from model_loader import (create_featurizer, create_text_preprocessor, featurize, find_model_version, get_class_labels,
+                          load_cascade_model, load_model, load_pool_model, predict_probabilities)
+from structured_logging import configure_logging
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Watches the model directory for new model versions while the API runs, when configured.
+    """
+    watcher = asyncio.create_task(model_registry.watch(model_watch_interval)) if model_watch_interval > 0 else None
+    yield
+    if watcher is not None:
+        watcher.cancel()
+
 
 # Create a FastAPI instance
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Log JSON lines through a background thread so that writing them never blocks a request
+log_listener = configure_logging('harmoni', level=os.getenv('HARMONI_LOG_LEVEL', 'INFO'))
+logger = logging.getLogger('harmoni')
+prediction_logger = logging.getLogger('harmoni.predictions')
+# Share of the predictions logged, logging every one of them is too much for the hot path
+prediction_log_sample_rate = float(os.getenv('HARMONI_PREDICTION_LOG_SAMPLE_RATE', '0.01'))
+
+
+def record_startup_phase(phase):
+    """
+    Records the time elapsed since the previous startup phase ended.
+
+    Args:
+        phase (str): The name of the phase that just ended.
+    """
+    global startup_phase_started
+    now = time.perf_counter()
+    startup_timings[phase] = now - startup_phase_started
+    startup_phase_started = now
 
-# Download necessary NLTK resources
-nltk.download('stopwords')
-nltk.download('wordnet')
 
-# Initialize lemmatizer and stop words
-text_lemmatizer = WordNetLemmatizer()
-english_stop_words = set(stopwords.words('english'))
+record_startup_phase('imports')
+
+# Make sure the necessary NLTK resources are installed. HARMONI_OFFLINE=1 never calls the downloader and
+# skips this check (and the NLTK import it needs), missing resources then fail when WordNet is loaded.
+offline_mode = os.getenv('HARMONI_OFFLINE', '0') == '1'
+if not offline_mode:
+    TextPreprocessor.ensure_nltk_resources()
+record_startup_phase('nltk_resources')
 
 
 def preprocess_text_data(text):
@@ -34,61 +87,638 @@ def preprocess_text_data(text):
     Returns:
         str: The preprocessed text.
     """
-    text = text = text.lower()
-    text = re.sub(r'[^a-zA-Z\s]', '', text)
-    tokens = text.split()
-    tokens = [text_lemmatizer.lemmatize(word) for word in tokens if word not in english_stop_words]
-    return ' '.join(tokens)
-
-
-# Load the best model
-try:
-    model_data = joblib.load('best_emotion_model.joblib')
-    ml_model = model_data['model']
-    label_encoder = model_data['label_encoder']
-    tfidf_vectorizer = model_data['tfidf_vectorizer']
-    is_pytorch_model = False
-except FileNotFoundError:
-    model_data = torch.load('best_emotion_model.pth', map_location=torch.device('cpu'),
-                            weights_only=False)
-    # Check if the loaded model is a simple nn.Sequential
-    if isinstance(model_data, nn.Sequential):
-        ml_model = model_data
-        is_pytorch_model = True
+    return model_registry.current['text_preprocessor'].preprocess(text)
+
+
+# Directory of the best model, preferring the compact artifact over the pickled bundles. The artifact is
+# memory-mapped unless HARMONI_MMAP_ARTIFACT=0, so that all the workers of a host share its pages.
+model_directory = os.getenv('HARMONI_MODEL_DIR', '.')
+mmap_artifact = os.getenv('HARMONI_MMAP_ARTIFACT', '1') == '1'
+
+# Run PyTorch models with one of the CPU inference backends of inference_backends: "eager" (the default),
+# "int8", "torchscript", "compile" or "onnx". Only the eager model uses the sparse forward pass.
+torch_backend = os.getenv('HARMONI_TORCH_BACKEND', 'eager')
+
+# Run inference off the event loop: "inline", "thread" (the default) or "process", see InferenceExecutor
+inference_backend = os.getenv('HARMONI_INFERENCE_BACKEND', 'thread')
+
+# Serve the cheap-first cascade exported by the training script instead of the best model when HARMONI_CASCADE=1:
+# its cheap model answers the texts it is confident about and only escalates the others to the network
+serve_cascade = os.getenv('HARMONI_CASCADE', '0') == '1'
+
+# Serve the pool of candidate models exported by the training script when HARMONI_MODEL_POOL=1: requests can
+# choose their model by name, HARMONI_PRIMARY_MODEL (the best model by default) otherwise, and the
+# HARMONI_SHADOW_MODELS are fed the same features in the background to record how often they agree with it
+# (texts answered from the prediction cache aren't featurized, so they aren't shadowed). Every model of the pool
+# reports the version of the pool followed by its name, e.g. "3f2a9c1e0b7d4a65/complement_naive_bayes".
+# Shadowing needs the inline or thread inference backend: with the process backend the features are computed in
+# the worker processes, whose shadow counters /stats and /metrics wouldn't see, so the shadow models aren't run.
+serve_pool = os.getenv('HARMONI_MODEL_POOL', '0') == '1'
+primary_model_name = os.getenv('HARMONI_PRIMARY_MODEL') or None
+shadow_model_names = [name.strip() for name in os.getenv('HARMONI_SHADOW_MODELS', '').split(',') if name.strip()]
+if shadow_model_names and inference_backend == 'process':
+    logger.warning('shadow models disabled', extra={'shadow_models': shadow_model_names,
+                                                    'reason': 'the process inference backend is used'})
+    shadow_model_names = []
+
+# Compare the featurization spec stamped into a model by the training script with the preprocessing and features
+# it is served with: HARMONI_FEATURIZATION_CHECK=warn (the default) logs the differences, "strict" refuses to load
+# the model (or to reload it, keeping the previous one), and "off" skips the check
+featurization_checks = ('off', 'warn', 'strict')
+featurization_check = os.getenv('HARMONI_FEATURIZATION_CHECK', 'warn')
+if featurization_check not in featurization_checks:
+    raise ValueError(f"Unknown featurization check '{featurization_check}', "
+                     f"expected one of {', '.join(featurization_checks)}")
+serving_featurization_spec = load_featurization_spec()
+
+
+def load_serving_model(record_phase=lambda phase: None):
+    """
+    Loads the best model of the model directory with everything needed to serve it.
+
+    Args:
+        record_phase (callable): Function called with the name of every loading phase when it ends.
+
+    Returns:
+        dict: The model returned by `load_model` (or `load_cascade_model`, or `load_pool_model`) prepared by
+            `prepare_serving_model`. The models of a pool are prepared too, sharing the preprocessor and
+            featurizer of the primary model and versioned by the pool version followed by their name, and the
+            'shadow_models' list the names of the shadow models.
+
+    Raises:
+        ValueError: If a shadow model isn't in the pool, or the model isn't served with its training featurization
+            and HARMONI_FEATURIZATION_CHECK=strict.
+    """
+    if serve_cascade:
+        model_data = load_cascade_model(model_directory, mmap=mmap_artifact)
+    elif serve_pool:
+        model_data = load_pool_model(model_directory, mmap=mmap_artifact, primary=primary_model_name)
+        unknown_models = set(shadow_model_names) - set(model_data['pool'])
+        if unknown_models:
+            raise ValueError(f"Shadow models {sorted(unknown_models)} aren't in the pool, "
+                             f"expected some of {', '.join(model_data['pool'])}")
+    else:
+        model_data = load_model(model_directory, mmap=mmap_artifact)
+    record_phase('model_load')
+
+    # Initialize the preprocessing pipeline, with the stop words and lemmas of the training vocabulary if they
+    # were saved. WordNet loads in the background: words of the lemma table can be served before it's ready.
+    text_preprocessor = create_text_preprocessor(model_data, background_load=True,
+                                                 lemma_cache_size=int(os.getenv('HARMONI_LEMMA_CACHE_SIZE', '100000')))
+    record_phase('preprocessor')
+
+    # Go from preprocessed tokens to TF-IDF features in one pass, without joining and re-tokenizing them.
+    # Vectorizers with options the featurizer doesn't reproduce keep using their own transform.
+    featurizer = create_featurizer(model_data, fused=os.getenv('HARMONI_FUSED_FEATURIZER', '1') == '1')
+    record_phase('featurizer')
+
+    # The models of a cascade or pool were all exported with the same featurization, so checking one is enough
+    differences = ([] if featurization_check == 'off' else
+                   check_featurization_spec(model_data['featurization_spec'], serving_featurization_spec,
+                                            text_preprocessor, featurizer))
+    if differences and featurization_check == 'strict':
+        raise ValueError(f"The model {model_data['path']} isn't served with the featurization it was trained with: "
+                         f"{'; '.join(differences)}")
+    if differences:
+        logger.warning('featurization spec mismatch', extra={'model_path': model_data['path'],
+                                                              'differences': differences})
+
+    if 'pool' not in model_data:
+        serving_model = prepare_serving_model(model_data, text_preprocessor, featurizer)
     else:
-        # If it's a custom model, extract parameters and create an instance
-        input_size = model_data['input_size']
-        num_classes = model_data['num_classes']
-        ml_model = EmotionClassifier(input_size, num_classes)
-        ml_model.load_state_dict(model_data['model_state_dict'])
-        is_pytorch_model = True  # Set the flag
-
-    label_encoder = model_data['label_encoder']
-    tfidf_vectorizer = model_data['tfidf_vectorizer']
-
-# Define emotion mapping dictionary
-emotion_mapping = {
-    0: "sadness",
-    1: "joy",
-    2: "love",
-    3: "anger",
-    4: "fear",
-    5: "surprise",
-}
+        # The models of a pool share the features of the primary model, computed once per request, and are
+        # versioned by the pool version followed by their name
+        pool = {name: {**prepare_serving_model(pool_model, text_preprocessor, featurizer),
+                       'version': f"{model_data['version']}/{name}"}
+                for name, pool_model in model_data['pool'].items()}
+        serving_model = {**pool[model_data['model_name']], 'pool': pool, 'shadow_models': shadow_model_names,
+                         'version': model_data['version'], 'path': model_data['path']}
+    record_phase('inference_backend')
+    return serving_model
+
+
+def prepare_serving_model(model_data, text_preprocessor, featurizer):
+    """
+    Returns a loaded model with everything needed to serve it.
+
+    Args:
+        model_data (dict): The model returned by `load_model`.
+        text_preprocessor (TextPreprocessor): The preprocessing pipeline of the model.
+        featurizer (TfidfFeaturizer): The featurizer of the model, or None to use its vectorizer.
+
+    Returns:
+        dict: The model, with its 'text_preprocessor', its TF-IDF 'featurizer', the 'inference_model' running
+            it with the PyTorch backend and the 'class_labels' naming its outputs.
+    """
+    inference_model = model_data['model']
+    if model_data['is_pytorch_model'] and torch_backend != 'eager':
+        from inference_backends import prepare_inference_model
+
+        # The width of the features, whether their vectorizer has a vocabulary or hashes the terms
+        input_size = featurize(model_data, featurizer, [[]]).shape[1]
+        inference_model = prepare_inference_model(model_data['model'], torch_backend, input_size)
+    return {**model_data, 'text_preprocessor': text_preprocessor, 'featurizer': featurizer,
+            'inference_model': inference_model, 'class_labels': get_class_labels(model_data)}
+
+
+def select_model(serving_model, model_name=None):
+    """
+    Returns the model of the pool named `model_name`, or the model served by default without a name.
+
+    Raises:
+        KeyError: If the model isn't in the pool.
+    """
+    if model_name is None or model_name == serving_model.get('model_name'):
+        return serving_model
+    return serving_model.get('pool', {})[model_name]
+
+
+def prediction_version(serving_model):
+    """
+    Returns the version reported with the predictions of a model. The primary model of a pool has the
+    version of the pool, which the registry compares with the pool on disk, but reports the version it
+    has in the pool like the other models: the pool version followed by its name.
+    """
+    if 'pool' in serving_model:
+        return serving_model['pool'][serving_model['model_name']]['version']
+    return serving_model['version']
+
+
+def warm_up_model(serving_model):
+    """
+    Runs sample texts through a newly loaded model before it is served, one at a time and as a batch,
+    so that its first requests don't pay for lazy initializations.
 
+    Args:
+        serving_model (dict): The model returned by `load_serving_model`.
+    """
+    # Warm up every model of a pool, without running the shadow models
+    for model in serving_model['pool'].values() if 'pool' in serving_model else [serving_model]:
+        for texts in [[text] for text in warmup_texts] + [warmup_texts]:
+            predict_tokenized_probabilities(model['text_preprocessor'].tokenize_batch(texts), model)
+
+
+def on_model_swap(serving_model, previous_serving_model):
+    """
+    Restarts the process pool after a reload, so that its workers load the new model too.
+    """
+    if inference_executor.backend == 'process':
+        inference_executor.restart()
+
+
+# Texts predicted by a reloaded model before it is served
+warmup_texts = ["I am so happy today", "I feel sad and lonely", "I love you", "This makes me angry",
+                "I am scared of the dark", "Wow, I did not expect that"]
+
+# Serve the model of the model directory, and swap in the new versions saved there without a restart: on
+# POST /admin/reload_model when HARMONI_MODEL_RELOAD_ENDPOINT=1, or by polling the directory every
+# HARMONI_MODEL_WATCH_INTERVAL_SECONDS when set
+model_registry = ModelRegistry(load_serving_model,
+                               lambda: find_model_version(model_directory, cascade=serve_cascade, pool=serve_pool),
+                               warmup_fn=warm_up_model, on_swap=on_model_swap)
+model_registry.load(record_startup_phase)
+model_reload_endpoint_enabled = os.getenv('HARMONI_MODEL_RELOAD_ENDPOINT', '0') == '1'
+model_watch_interval = float(os.getenv('HARMONI_MODEL_WATCH_INTERVAL_SECONDS', '0'))
+logger.info('model loaded', extra={'model_path': model_registry.current['path'],
+                                   'model_version': model_registry.current['version'],
+                                   'featurization_spec_id': (model_registry.current['featurization_spec']
+                                                             or {}).get('id'),
+                                   'startup_seconds': startup_timings})
+
+# Cache predictions of repeated texts, HARMONI_CACHE_SIZE=0 disables the cache
+cache_size = int(os.getenv('HARMONI_CACHE_SIZE', '10000'))
+prediction_cache = PredictionCache(InMemoryCacheBackend(
+    max_size=cache_size,
+    ttl_seconds=float(os.getenv('HARMONI_CACHE_TTL_SECONDS', '0')) or None,
+)) if cache_size > 0 else None
+
+# Feed the TF-IDF features to EmotionClassifier models without densifying them
+use_sparse_inference = os.getenv('HARMONI_SPARSE_INFERENCE', '1') == '1'
+
+# Maximum number of texts accepted by a single batch request
+max_batch_size = int(os.getenv('HARMONI_MAX_BATCH_SIZE', '256'))
+
+# Maximum number of texts of a stream being predicted or waiting to be sent, beyond which it stops being read
+stream_max_in_flight = int(os.getenv('HARMONI_STREAM_MAX_IN_FLIGHT', '256'))
+
+# Run the shadow models on a background thread, off the path of the responses. Beyond
+# HARMONI_SHADOW_MAX_PENDING batches waiting for it, new batches aren't shadowed so that it never falls behind.
+shadow_executor = ThreadPoolExecutor(1, thread_name_prefix='harmoni-shadow')
+shadow_slots = threading.BoundedSemaphore(int(os.getenv('HARMONI_SHADOW_MAX_PENDING', '8')))
+
+# Metrics exposed on /metrics in the Prometheus text format
+metrics_registry = MetricsRegistry()
+requests_counter = metrics_registry.counter('harmoni_requests_total', 'HTTP requests by path and status code.',
+                                            ('path', 'status'))
+request_errors_counter = metrics_registry.counter('harmoni_request_errors_total',
+                                                  'HTTP requests that failed with a server error.', ('path',))
+request_latency_histogram = metrics_registry.histogram('harmoni_request_duration_seconds',
+                                                       'Latency of the HTTP requests.', ('path',))
+stage_latency_histogram = metrics_registry.histogram('harmoni_stage_duration_seconds',
+                                                     'Latency of every prediction stage, per batch.', ('stage',))
+batch_size_histogram = metrics_registry.histogram('harmoni_batch_size', 'Number of texts predicted together.',
+                                                  buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+predictions_counter = metrics_registry.counter('harmoni_predictions_total', 'Predictions by emotion.',
+                                               ('emotion',))
+cascade_predictions_counter = metrics_registry.counter('harmoni_cascade_predictions_total',
+                                                       'Predictions of the cascade by the stage answering them.',
+                                                       ('stage',))
+metrics_registry.gauge('harmoni_cascade_escalation_rate',
+                       'Share of the cascade predictions escalated to the expensive model.',
+                       function=lambda: cascade_escalation_rate())
+shadow_predictions_counter = metrics_registry.counter('harmoni_shadow_predictions_total',
+                                                      'Predictions of the shadow models by agreement with the '
+                                                      'primary model.', ('model', 'agreement'))
+shadow_dropped_counter = metrics_registry.counter('harmoni_shadow_dropped_batches_total',
+                                                  'Batches not run by the shadow models because they were behind.')
+shadow_latency_histogram = metrics_registry.histogram('harmoni_shadow_duration_seconds',
+                                                      'Latency of the shadow models, per batch.', ('model',))
+startup_phase_gauge = metrics_registry.gauge('harmoni_startup_phase_seconds',
+                                             'Time of every startup phase, including the model load.', ('phase',))
+metrics_registry.gauge('harmoni_model_load_seconds', 'Time taken to load the model being served.',
+                       function=lambda: model_registry.load_seconds)
+metrics_registry.gauge('harmoni_microbatch_queue_depth', 'Texts waiting to be batched.',
+                       function=lambda: micro_batcher.queue_depth + sum(batcher.queue_depth
+                                                                        for batcher in model_micro_batchers.values()))
+for phase, seconds in startup_timings.items():
+    startup_phase_gauge.set(seconds, phase=phase)
+app.add_middleware(RequestMetricsMiddleware, requests_counter=requests_counter,
+                   errors_counter=request_errors_counter, latency_histogram=request_latency_histogram,
+                   paths=lambda: {route.path for route in app.routes})
+
+# Profile sampled prediction batches with cProfile or the torch profiler, switched on at runtime through
+# POST /debug/profiling when HARMONI_PROFILING_ENDPOINT=1
+request_profiler = RequestProfiler(os.getenv('HARMONI_PROFILE_DIR', 'profiles'))
+profiling_endpoint_enabled = os.getenv('HARMONI_PROFILING_ENDPOINT', '0') == '1'
 
 # Define the request and response models using Pydantic
 class EmotionRequest(BaseModel):
     text: str
+    # Return the top_k most probable emotions with their probability
+    top_k: int | None = Field(None, ge=1)
+    # Predict with this model of the pool instead of the primary one
+    model: str | None = None
+
+
+class EmotionScore(BaseModel):
+    emotion: str
+    number: int
+    probability: float
 
 
 class EmotionResponse(BaseModel):
     emotion: str
     number: int
+    model_version: str | None = None
+    model: str | None = None
+    top_k: list[EmotionScore] | None = None
+
+
+class EmotionBatchRequest(BaseModel):
+    texts: list[str]
+    top_k: int | None = Field(None, ge=1)
+    model: str | None = None
+
+
+class EmotionBatchResponse(BaseModel):
+    results: list[EmotionResponse]
+
+
+class EmotionStreamRequest(BaseModel):
+    id: str | int
+    text: str
+    top_k: int | None = Field(None, ge=1)
+    model: str | None = None
+
+
+class ProfilingRequest(BaseModel):
+    mode: str | None = None
+    sample_rate: float = 0.01
+    max_profiles: int = 10
+
+
+def predict_emotion_probabilities(texts, serving_model=None):
+    """
+    Predicts the emotion probabilities for a list of texts. Texts whose preprocessed form is in the
+    prediction cache are answered from it; the others go through a single TF-IDF transform and
+    a single model call, which is much cheaper than predicting text by text.
+
+    Args:
+        texts (list[str]): The texts to analyze.
+        serving_model (dict): The model to predict with. Defaults to the model currently served.
+
+    Returns:
+        list[np.ndarray]: The probability of every class of the model for each text, in the same order as
+            the input texts.
+    """
+    serving_model = serving_model or model_registry.current
+    with stage_latency_histogram.time(stage='preprocess'):
+        token_lists = serving_model['text_preprocessor'].tokenize_batch(texts)
+    if prediction_cache is None:
+        return list(predict_tokenized_probabilities(token_lists, serving_model))
+
+    model_version = prediction_version(serving_model)
+    processed_texts = [' '.join(tokens) for tokens in token_lists]
+    cached_rows = [prediction_cache.get(model_version, processed_text) for processed_text in processed_texts]
+    # Predict every distinct text that missed the cache only once
+    missing_tokens = {processed_text: tokens for processed_text, tokens, cached_row
+                      in zip(processed_texts, token_lists, cached_rows) if cached_row is None}
+    predicted_rows = {}
+    if missing_tokens:
+        predicted_rows = dict(zip(missing_tokens, predict_tokenized_probabilities(list(missing_tokens.values()),
+                                                                                  serving_model)))
+        for processed_text, probabilities in predicted_rows.items():
+            # Cache values are JSON-serializable
+            prediction_cache.set(model_version, processed_text, probabilities.tolist())
+    return [predicted_rows[processed_text] if cached_row is None else np.asarray(cached_row)
+            for processed_text, cached_row in zip(processed_texts, cached_rows)]
+
+
+def featurize_tokens(token_lists, serving_model=None):
+    """
+    Computes the TF-IDF features of preprocessed texts.
+
+    Args:
+        token_lists (list[list[str]]): The tokens of every preprocessed text.
+        serving_model (dict): The model whose features to compute. Defaults to the model currently served.
+
+    Returns:
+        scipy.sparse.csr_matrix: The TF-IDF features, one row per text.
+    """
+    serving_model = serving_model or model_registry.current
+    return featurize(serving_model, serving_model['featurizer'], token_lists)
+
+
+def predict_tokenized_probabilities(token_lists, serving_model=None):
+    """
+    Predicts the emotion probabilities for a list of preprocessed texts with a single TF-IDF featurization
+    and a single model call.
+
+    Args:
+        token_lists (list[list[str]]): The tokens of every preprocessed text.
+        serving_model (dict): The model to predict with. Defaults to the model currently served.
+
+    Returns:
+        np.ndarray: The (num_texts, num_classes) probabilities, in the same order as the input texts.
+    """
+    serving_model = serving_model or model_registry.current
+    if not token_lists:
+        return np.empty((0, len(serving_model['class_labels'])))
+    with stage_latency_histogram.time(stage='vectorize'):
+        text_tfidf_features = featurize_tokens(token_lists, serving_model)
+    with stage_latency_histogram.time(stage='infer'):
+        probabilities = predict_feature_probabilities(text_tfidf_features, serving_model)
+    if serving_model.get('shadow_models'):
+        # The shadow models get the features already computed, after the primary model has answered
+        submit_shadow_predictions(text_tfidf_features, probabilities.argmax(axis=1), serving_model)
+    return probabilities
+
+
+def submit_shadow_predictions(text_tfidf_features, primary_classes, serving_model):
+    """
+    Queues the predictions of the shadow models of a batch on the shadow thread, unless it is behind.
+
+    Args:
+        text_tfidf_features (scipy.sparse.csr_matrix): The TF-IDF features of the batch.
+        primary_classes (np.ndarray): The classes predicted by the primary model.
+        serving_model (dict): The model served, with its pool and 'shadow_models'.
+    """
+    if not shadow_slots.acquire(blocking=False):
+        shadow_dropped_counter.inc()
+        return
+    future = shadow_executor.submit(run_shadow_predictions, text_tfidf_features, primary_classes, serving_model)
+    future.add_done_callback(lambda _: shadow_slots.release())
+
+
+def run_shadow_predictions(text_tfidf_features, primary_classes, serving_model):
+    """
+    Predicts a batch with every shadow model and records how many of its predictions agree with the primary model.
+    """
+    for model_name in serving_model['shadow_models']:
+        try:
+            with shadow_latency_histogram.time(model=model_name):
+                shadow_probabilities = predict_feature_probabilities(text_tfidf_features,
+                                                                     serving_model['pool'][model_name])
+        except Exception:
+            logger.exception('shadow prediction failed', extra={'model_name': model_name})
+            continue
+        agreed_count = int((shadow_probabilities.argmax(axis=1) == primary_classes).sum())
+        shadow_predictions_counter.inc(agreed_count, model=model_name, agreement='agree')
+        shadow_predictions_counter.inc(len(primary_classes) - agreed_count, model=model_name, agreement='disagree')
+
+
+def shadow_stats(serving_model):
+    """
+    Returns the number of predictions of every shadow model and the share of them agreeing with the primary model.
+    """
+    stats = {}
+    for model_name in serving_model.get('shadow_models', []):
+        agreed_count = shadow_predictions_counter.value(model=model_name, agreement='agree')
+        total_count = agreed_count + shadow_predictions_counter.value(model=model_name, agreement='disagree')
+        stats[model_name] = {'predictions': total_count,
+                             'agreement_rate': agreed_count / total_count if total_count else None}
+    return stats
+
+
+def predict_feature_probabilities(text_tfidf_features, serving_model=None):
+    """
+    Predicts the emotion probabilities for the TF-IDF features of preprocessed texts with a single model call,
+    or for a cascade, with a call to the cheap model and one to the expensive model for the escalated texts.
+
+    Args:
+        text_tfidf_features (scipy.sparse.csr_matrix): The TF-IDF features, one row per text.
+        serving_model (dict): The model to predict with. Defaults to the model currently served.
+
+    Returns:
+        np.ndarray: The (num_texts, num_classes) probabilities, columns in the order of the model classes.
+    """
+    serving_model = serving_model or model_registry.current
+    cascade = serving_model.get('cascade')
+    if cascade is None:
+        return predict_model_probabilities(text_tfidf_features, serving_model)
+
+    # Both stages share the features; only the texts the cheap model isn't confident about are escalated
+    probabilities = predict_probabilities(cascade['cheap_model'], text_tfidf_features)
+    escalated = escalated_rows(probabilities, cascade['threshold'])
+    if escalated.any():
+        probabilities[escalated] = predict_model_probabilities(text_tfidf_features[escalated], serving_model)
+    escalated_count = int(escalated.sum())
+    cascade_predictions_counter.inc(len(probabilities) - escalated_count, stage='cheap')
+    cascade_predictions_counter.inc(escalated_count, stage='expensive')
+    return probabilities
+
+
+def predict_model_probabilities(text_tfidf_features, serving_model):
+    """
+    Predicts the emotion probabilities for the TF-IDF features of preprocessed texts with a single call
+    to the model served (the expensive model of a cascade).
+
+    PyTorch models give the softmax of the logits of their forward pass. sklearn models give the
+    probabilities of `predict_proba`, or the softmax of their decision scores, which ranks the classes
+    like the model but isn't calibrated (linear SVMs, compact linear artifacts).
+
+    Args:
+        text_tfidf_features (scipy.sparse.csr_matrix): The TF-IDF features, one row per text.
+        serving_model (dict): The model to predict with.
+
+    Returns:
+        np.ndarray: The (num_texts, num_classes) probabilities, columns in the order of the model classes.
+    """
+    ml_model = serving_model['model']
+    if serving_model['is_pytorch_model']:
+        # Torch is only imported when the model needs it
+        import torch
+        # Import the EmotionClassifier class
+        from EmotionClassifier import EmotionClassifier
+
+        inference_model = serving_model['inference_model']
+        # Disable gradient calculation for inference
+        with torch.no_grad():
+            if use_sparse_inference and inference_model is ml_model and isinstance(ml_model, EmotionClassifier):
+                # Only gather the first layer weights of the non-zero features
+                model_outputs = ml_model.forward_sparse(text_tfidf_features)
+            else:
+                # Convert TF-IDF features to a PyTorch tensor and get the model's output
+                model_outputs = inference_model(torch.FloatTensor(text_tfidf_features.toarray()))
+            # The probabilities come from the same forward pass as the predicted class
+            return torch.softmax(model_outputs.float(), dim=1).numpy()
+
+    return predict_probabilities(serving_model, text_tfidf_features)
+
+
+def cascade_escalation_rate():
+    """
+    Returns the share of the cascade predictions escalated to the expensive model, 0 before the first one.
+    """
+    escalated_count = cascade_predictions_counter.value(stage='expensive')
+    total_count = cascade_predictions_counter.value(stage='cheap') + escalated_count
+    return escalated_count / total_count if total_count else 0.0
+
+
+def run_prediction_batch(texts, model_name=None):
+    """
+    Runs predict_emotion_probabilities for a batch of a micro-batcher or the batch endpoint, recording
+    its size and profiling it when the request profiler samples it.
+
+    The whole batch is predicted by the model served when it starts, even if a reload swaps in a
+    new version meanwhile.
+
+    Args:
+        texts (list[str]): The texts to analyze.
+        model_name (str): The model of the pool to predict with, or None for the model served by default.
+
+    Returns:
+        list[tuple[np.ndarray, str, list, str]]: The class probabilities of every text, in the same order as
+            the input texts, with the version, the class labels and the pool name of the model that predicted them.
+    """
+    serving_model = select_model(model_registry.current, model_name)
+    batch_size_histogram.observe(len(texts))
+    probability_rows = request_profiler.run(predict_emotion_probabilities, texts, serving_model)
+    model_version = prediction_version(serving_model)
+    return [(probabilities, model_version, serving_model['class_labels'], serving_model.get('model_name'))
+            for probabilities in probability_rows]
+
+
+def build_emotion_response(probabilities, model_version, class_labels, model_name=None, top_k=None):
+    """
+    Builds the response of a text from its predicted class probabilities.
+
+    Args:
+        probabilities (np.ndarray): The probability of every class.
+        model_version (str): The version of the model that predicted them.
+        class_labels (list[tuple[str, int]]): The emotion and emotion number of every class.
+        model_name (str): The pool name of the model that predicted them, or None outside of a pool.
+        top_k (int): The number of most probable emotions to return with their probability, or None.
+
+    Returns:
+        EmotionResponse: The most probable emotion and, with `top_k`, the `top_k` most probable ones.
+    """
+    probabilities = np.asarray(probabilities)
+    emotion_label, emotion_number = class_labels[int(probabilities.argmax())]
+    top_emotions = None
+    if top_k is not None:
+        # Stable sort, so ties keep the class order like argmax
+        ranked_classes = np.argsort(-probabilities, kind='stable')[:top_k]
+        top_emotions = [EmotionScore(emotion=class_labels[class_index][0], number=class_labels[class_index][1],
+                                     probability=float(probabilities[class_index]))
+                        for class_index in ranked_classes]
+    return EmotionResponse(emotion=emotion_label, number=emotion_number, model_version=model_version,
+                           model=model_name, top_k=top_emotions)
+
+
+def record_predictions(emotion_labels_predicted, model_version):
+    """
+    Counts the predicted emotions and logs a sample of them.
+
+    Args:
+        emotion_labels_predicted (list[str]): The predicted emotion labels.
+        model_version (str): The version of the model that predicted them.
+    """
+    for emotion_label in emotion_labels_predicted:
+        predictions_counter.inc(emotion=emotion_label)
+        if random.random() < prediction_log_sample_rate:
+            prediction_logger.info('prediction', extra={'emotion': emotion_label, 'model_version': model_version})
+
+
+def initialize_inference_worker():
+    """
+    Initializes a process pool worker. Importing this module in the worker already loads the model
+    once for its whole lifetime, so only the torch thread count is left to set: each worker gets a
+    single thread to avoid oversubscribing the CPUs shared with the other workers.
+    """
+    if model_registry.current['is_pytorch_model']:
+        import torch
+
+        torch.set_num_threads(1)
+
+
+# Run inference off the event loop
+inference_executor = InferenceExecutor(inference_backend,
+                                       max_workers=int(os.getenv('HARMONI_INFERENCE_WORKERS', '0')) or None,
+                                       initializer=initialize_inference_worker)
+
+# Coalesce concurrent single-text requests into batched predictions
+microbatch_max_wait_ms = float(os.getenv('HARMONI_MICROBATCH_MAX_WAIT_MS', '2'))
+microbatch_max_size = int(os.getenv('HARMONI_MICROBATCH_MAX_SIZE', '64'))
+micro_batcher = MicroBatcher(run_prediction_batch, max_wait_ms=microbatch_max_wait_ms,
+                             max_batch_size=microbatch_max_size, executor=inference_executor)
+# Micro-batchers of the requests choosing another model of the pool, by model name
+model_micro_batchers = {}
+
+
+def check_pool_model(model_name):
+    """
+    Checks that a model requested by name is in the pool of the served model.
+
+    Raises:
+        HTTPException: If the model isn't in the pool.
+    """
+    serving_model = model_registry.current
+    if model_name not in serving_model.get('pool', {}):
+        available_models = ', '.join(serving_model.get('pool', {})) or 'none, the API serves a single model'
+        raise HTTPException(status_code=422, detail=f"Unknown model '{model_name}', available: {available_models}")
+
+
+def get_micro_batcher(model_name=None):
+    """
+    Returns the micro-batcher of the requests for a model of the pool, or of the model served by default.
+
+    Raises:
+        HTTPException: If the model isn't in the pool.
+    """
+    if model_name is None:
+        return micro_batcher
+    check_pool_model(model_name)
+    if model_name not in model_micro_batchers:
+        model_micro_batchers[model_name] = MicroBatcher(functools.partial(run_prediction_batch, model_name=model_name),
+                                                        max_wait_ms=microbatch_max_wait_ms,
+                                                        max_batch_size=microbatch_max_size,
+                                                        executor=inference_executor)
+    return model_micro_batchers[model_name]
 
 
 # Define the API endpoint for emotion prediction
-@app.post("/predict_emotion", response_model=EmotionResponse)
+@app.post("/predict_emotion", response_model=EmotionResponse, response_model_exclude_none=True)
 async def predict_emotion(request: EmotionRequest):
     """
     Predicts the emotion of the input text.
@@ -97,30 +727,193 @@ async def predict_emotion(request: EmotionRequest):
         request (EmotionRequest): The request containing the text to analyze.
 
     Returns:
-        EmotionResponse: The predicted emotion and its corresponding number.
+        EmotionResponse: The predicted emotion and its corresponding number, with the `top_k` most probable
+            emotions when requested.
     """
-    processed_text = preprocess_text_data(request.text)
-    text_tfidf_features = tfidf_vectorizer.transform([processed_text])
+    prediction = await get_micro_batcher(request.model).submit(request.text)
 
-    if is_pytorch_model:
-        # Convert TF-IDF features to a PyTorch tensor
-        text_tensor = torch.FloatTensor(text_tfidf_features.toarray())
-        # Disable gradient calculation for inference
-        with torch.no_grad():
-            # Get the model's output
-            model_outputs = ml_model(text_tensor)
-            # Get the predicted class (emotion number)
-            _, predicted_class = torch.max(model_outputs, 1)
-        emotion_number = predicted_class.item()
+    # Name the most probable class with the labels of the model
+    response = build_emotion_response(*prediction, top_k=request.top_k)
+    record_predictions([response.emotion], response.model_version)
+    return response
+
+
+# Define the API endpoint for batch emotion prediction
+@app.post("/predict_emotion_batch", response_model=EmotionBatchResponse, response_model_exclude_none=True)
+async def predict_emotion_batch(request: EmotionBatchRequest):
+    """
+    Predicts the emotions of a list of texts with one vectorization and one model call.
+
+    Args:
+        request (EmotionBatchRequest): The request containing the texts to analyze.
+
+    Returns:
+        EmotionBatchResponse: The predicted emotions, in the same order as the input texts, with the `top_k`
+            most probable emotions of every text when requested.
+    """
+    if len(request.texts) > max_batch_size:
+        raise HTTPException(status_code=413,
+                            detail=f"Batch size {len(request.texts)} exceeds the maximum of {max_batch_size}")
+
+    # The whole batch is predicted by the same model version
+    if request.model is not None:
+        check_pool_model(request.model)
+    predictions = await inference_executor.run(run_prediction_batch, request.texts, request.model)
+    results = [build_emotion_response(*prediction, top_k=request.top_k) for prediction in predictions]
+    if results:
+        record_predictions([result.emotion for result in results], results[0].model_version)
+    return EmotionBatchResponse(results=results)
+
+
+# Define the WebSocket endpoint for streams of texts
+@app.websocket("/predict_emotion_stream")
+async def predict_emotion_stream(websocket: WebSocket):
+    """
+    Predicts the emotions of a stream of texts over a single WebSocket connection.
+
+    Clients send JSON messages {"id": ..., "text": ...}, or lists of them, and receive one
+    {"id": ..., "emotion": ..., "number": ..., "model_version": ...} message per text as soon as it is predicted, so
+    possibly out of order. Messages with a "top_k" also get the "top_k" most probable emotions with their
+    probability, and messages with a "model" are predicted by that model of the pool. Invalid messages get
+    {"id": ..., "error": ...} back.
+
+    Texts go through the micro-batcher, so the texts of a stream arriving together are predicted
+    in one batch. At most `stream_max_in_flight` texts of a stream are pending, results not sent
+    yet included: beyond that the stream isn't read until results are sent, pushing back on the client.
+
+    Args:
+        websocket (WebSocket): The client connection.
+    """
+    await websocket.accept()
+    in_flight = asyncio.Semaphore(stream_max_in_flight)
+    results = asyncio.Queue()
+    predictions = set()
+
+    async def predict(message_id, text, top_k, model_name):
+        try:
+            prediction = await get_micro_batcher(model_name).submit(text)
+        except HTTPException as error:
+            await results.put({"id": message_id, "error": error.detail})
+            return
+        except Exception as error:
+            logger.exception('stream prediction failed')
+            await results.put({"id": message_id, "error": f"Prediction failed: {type(error).__name__}"})
+            return
+        response = build_emotion_response(*prediction, top_k=top_k)
+        record_predictions([response.emotion], response.model_version)
+        await results.put({"id": message_id, **response.model_dump(exclude_none=True)})
+
+    async def send_results():
+        while True:
+            result = await results.get()
+            await websocket.send_json(result)
+            # The text is no longer pending once its result is sent
+            in_flight.release()
+
+    sender = asyncio.create_task(send_results())
+    try:
+        while True:
+            try:
+                payload = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError as error:
+                await in_flight.acquire()
+                await results.put({"id": None, "error": f"Invalid JSON: {error}"})
+                continue
+            for item in payload if isinstance(payload, list) else [payload]:
+                # Wait for a slot before reading on, which is what applies the backpressure
+                await in_flight.acquire()
+                try:
+                    message = EmotionStreamRequest.model_validate(item)
+                except ValidationError as error:
+                    message_id = item.get("id") if isinstance(item, dict) else None
+                    await results.put({"id": message_id, "error": f"Invalid message: {error.errors()[0]['msg']}"})
+                    continue
+                task = asyncio.create_task(predict(message.id, message.text, message.top_k, message.model))
+                # Keep a reference to the task so it isn't garbage collected while running
+                predictions.add(task)
+                task.add_done_callback(predictions.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        for task in list(predictions):
+            task.cancel()
+
+
+# Define the endpoint exposing runtime statistics
+@app.get("/stats")
+async def stats():
+    """
+    Returns runtime statistics of the API, such as the micro-batching queue depth and batch sizes.
+    """
+    # With the process backend, every worker keeps its own cache that isn't reported here
+    return {
+        "inference_backend": inference_executor.backend,
+        "model_version": model_registry.current['version'],
+        "model": model_registry.status(),
+        "torch_backend": torch_backend if model_registry.current['is_pytorch_model'] else None,
+        "cascade": ({"threshold": model_registry.current['cascade']['threshold'],
+                     "models": model_registry.current['cascade']['models'],
+                     "escalation_rate": cascade_escalation_rate()}
+                    if 'cascade' in model_registry.current else None),
+        "pool": ({"primary": model_registry.current['model_name'],
+                  "models": {name: {"name": model['display_name'], "version": model['version']}
+                             for name, model in model_registry.current['pool'].items()},
+                  "shadow": shadow_stats(model_registry.current),
+                  "shadow_dropped_batches": shadow_dropped_counter.value()}
+                 if 'pool' in model_registry.current else None),
+        "startup_seconds": startup_timings,
+        "batching": micro_batcher.stats(),
+        "cache": prediction_cache.stats() if prediction_cache is not None else None,
+    }
+
+
+# Define the endpoint exposing the metrics to Prometheus
+@app.get("/metrics")
+async def metrics():
+    """
+    Returns the request, latency, batch size and prediction metrics in the Prometheus text format.
+    """
+    # With the process backend, the stage and batch size metrics are recorded in the workers and aren't reported here
+    return Response(metrics_registry.render(), media_type=MetricsRegistry.content_type)
+
+
+# Define the endpoint switching the request profiler on and off, only when enabled by the configuration
+@app.post("/debug/profiling", include_in_schema=False)
+async def configure_profiling(request: ProfilingRequest):
+    """
+    Enables profiling of sampled prediction batches with the given mode ("cprofile" or "torch"),
+    or disables it without a mode, and returns the profiler status with the captured profile paths.
+    """
+    if not profiling_endpoint_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if request.mode is None:
+        request_profiler.disable()
     else:
-        # For non-PyTorch models, use the predict method
-        predicted_class = ml_model.predict(text_tfidf_features)
-        emotion_number = predicted_class[0]
-
-    # Map the emotion number to its corresponding label
-    emotion_label = emotion_mapping.get(emotion_number, "unknown")
-    print(f'Emotion: {emotion_label}, Number: {emotion_number}')
-    return EmotionResponse(emotion=emotion_label, number=emotion_number)
+        try:
+            request_profiler.enable(request.mode, request.sample_rate, request.max_profiles)
+        except ValueError as error:
+            raise HTTPException(status_code=422, detail=str(error))
+    logger.info('profiling configured', extra=request_profiler.status())
+    return request_profiler.status()
+
+
+# Define the endpoint reloading the model, only when enabled by the configuration
+@app.post("/admin/reload_model", include_in_schema=False)
+async def reload_model(force: bool = False):
+    """
+    Loads the model saved in the model directory, warms it up and swaps it in without interrupting the
+    requests, unless it is the version already served (or `force` is set). Returns the model status.
+    """
+    if not model_reload_endpoint_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    try:
+        reloaded = await model_registry.reload_async(force)
+    except Exception as error:
+        logger.exception('model reload failed')
+        # The previous version is still served
+        raise HTTPException(status_code=500, detail=f"Model reload failed: {type(error).__name__}: {error}")
+    return {"reloaded": reloaded, **model_registry.status()}
 
 
 # Define the root endpoint
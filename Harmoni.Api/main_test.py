@@ -7,6 +7,7 @@ from sklearn.feature_extraction.text import TfidfVectorizer  # For converting te
 from sklearn.preprocessing import LabelEncoder  # For encoding categorical labels
 from torch import nn  # Neural network module in PyTorch
 
+import main  # The API module, to inspect the model served
 from main import app, preprocess_text_data  # Import the FastAPI app and the preprocess_text function from the main application file
 
 
@@ -141,4 +142,307 @@ def test_predict_emotion_empty_text(mock_torch_load, mock_joblib_load, mock_jobl
     response = client.post("/predict_emotion", json={"text": ""})
     assert response.status_code == 200  # Assert that the response status code is 200 (OK)
     assert "emotion" in response.json()  # Assert that the "emotion" key exists in the JSON response
-    assert "number" in response.json()  # Assert that the "number" key exists in the JSON response
\ No newline at end of file
+    assert "number" in response.json()  # Assert that the "number" key exists in the JSON response
+
+def test_predict_emotion_batch_matches_single_predictions():
+    """
+    Tests the /predict_emotion_batch endpoint.
+    Ensures it returns one result per input text, in the same order as the single-text endpoint would.
+    """
+    client = TestClient(app)  # Create a test client
+    texts = ["I am so angry", "I am feeling excited", ""]
+    # Send a POST request to the /predict_emotion_batch endpoint with several texts
+    response = client.post("/predict_emotion_batch", json={"texts": texts})
+    assert response.status_code == 200  # Assert that the response status code is 200 (OK)
+    results = response.json()["results"]
+    assert len(results) == len(texts)  # Assert that every text got a result
+    # Assert that every batch result matches the result of the single-text endpoint
+    for text, result in zip(texts, results):
+        single_response = client.post("/predict_emotion", json={"text": text})
+        assert result == single_response.json()
+
+
+def test_predict_emotion_batch_too_large():
+    """
+    Tests that the /predict_emotion_batch endpoint rejects batches above the configured maximum size.
+    """
+    client = TestClient(app)  # Create a test client
+    # Temporarily lower the maximum batch size so the test stays small
+    with patch('main.max_batch_size', 2):
+        response = client.post("/predict_emotion_batch", json={"texts": ["one", "two", "three"]})
+    assert response.status_code == 413  # Assert that the response status code is 413 (Payload Too Large)
+
+
+def test_stats_endpoint_reports_batching():
+    """
+    Tests that the /stats endpoint reports the micro-batching metrics after a prediction.
+    """
+    client = TestClient(app)  # Create a test client
+    client.post("/predict_emotion", json={"text": "I am so happy"})
+    response = client.get("/stats")
+    assert response.status_code == 200  # Assert that the response status code is 200 (OK)
+    batching_stats = response.json()["batching"]
+    assert batching_stats["batch_count"] >= 1  # Assert that at least one batch was run
+    assert batching_stats["queue_depth"] == 0  # Assert that nothing is left waiting in the queue
+
+
+def test_cache_hit_skips_vectorization():
+    """
+    Tests that a text whose preprocessed form is already cached is answered without
+    computing its TF-IDF features again.
+    """
+    client = TestClient(app)  # Create a test client
+    first_response = client.post("/predict_emotion", json={"text": "Thanks a lot!!"})
+    # Fail the test if the text is featurized again for a text with the same preprocessed form
+    with patch('main.featurize_tokens', side_effect=AssertionError("cache miss")):
+        second_response = client.post("/predict_emotion", json={"text": "thanks a lot"})
+    assert second_response.status_code == 200  # Assert that the response status code is 200 (OK)
+    assert second_response.json() == first_response.json()  # Assert that the cached prediction was returned
+
+
+def test_metrics_endpoint_reports_requests_stages_and_predictions():
+    """
+    Tests that the /metrics endpoint exposes the request counters, the stage latency histograms
+    and the predicted emotion counts in the Prometheus text format.
+    """
+    client = TestClient(app)  # Create a test client
+    emotion = client.post("/predict_emotion", json={"text": "What a wonderful day"}).json()["emotion"]
+    response = client.get("/metrics")
+    assert response.status_code == 200  # Assert that the response status code is 200 (OK)
+    assert response.headers["content-type"].startswith("text/plain")
+    metrics_text = response.text
+    assert 'harmoni_requests_total{path="/predict_emotion",status="200"}' in metrics_text
+    assert f'harmoni_predictions_total{{emotion="{emotion}"}}' in metrics_text
+    for stage in ("preprocess", "vectorize", "infer"):
+        assert f'harmoni_stage_duration_seconds_count{{stage="{stage}"}}' in metrics_text
+    assert "harmoni_model_load_seconds" in metrics_text
+
+
+def test_profiling_endpoint_disabled_by_default():
+    """
+    Tests that the profiling endpoint isn't available unless enabled by the configuration.
+    """
+    client = TestClient(app)  # Create a test client
+    response = client.post("/debug/profiling", json={"mode": "cprofile"})
+    assert response.status_code == 404  # Assert that the endpoint is hidden
+
+
+def test_stream_endpoint_returns_one_result_per_message():
+    """
+    Tests that the WebSocket stream returns a result for every text sent, single or in a list,
+    matching the single-text endpoint, and an error for invalid messages.
+    """
+    client = TestClient(app)  # Create a test client
+    texts = {1: "I am so angry", "b": "I am feeling excited", 3: ""}
+    with client.websocket_connect("/predict_emotion_stream") as websocket:
+        websocket.send_json({"id": 1, "text": texts[1]})
+        websocket.send_json([{"id": "b", "text": texts["b"]}, {"id": 3, "text": texts[3]}])
+        websocket.send_json({"id": 4})  # Missing text
+        results = {}
+        for _ in range(4):
+            result = websocket.receive_json()
+            results[result["id"]] = result
+    assert "error" in results[4]  # Assert that the invalid message got an error
+    # Assert that every text got the same result as from the single-text endpoint
+    for message_id, text in texts.items():
+        single_response = client.post("/predict_emotion", json={"text": text}).json()
+        assert {key: value for key, value in results[message_id].items() if key != "id"} == single_response
+
+
+def test_stream_endpoint_applies_backpressure():
+    """
+    Tests that the stream keeps working when more texts are sent than can be in flight at once.
+    """
+    client = TestClient(app)  # Create a test client
+    # Allow a single pending text, so every text waits for the result of the previous one to be sent
+    with patch('main.stream_max_in_flight', 1):
+        with client.websocket_connect("/predict_emotion_stream") as websocket:
+            websocket.send_json([{"id": index, "text": f"message number {index}"} for index in range(5)])
+            result_ids = {websocket.receive_json()["id"] for _ in range(5)}
+    assert result_ids == set(range(5))  # Assert that every text got its result
+
+
+def test_responses_report_the_model_version():
+    """
+    Tests that the single and batch endpoints report the version of the model that predicted.
+    """
+    client = TestClient(app)  # Create a test client
+    model_version = client.get("/stats").json()["model_version"]
+    single_response = client.post("/predict_emotion", json={"text": "I am so happy"})
+    batch_response = client.post("/predict_emotion_batch", json={"texts": ["I am so happy", "I am sad"]})
+    assert single_response.json()["model_version"] == model_version
+    assert [result["model_version"] for result in batch_response.json()["results"]] == [model_version] * 2
+
+
+def test_model_reload_endpoint():
+    """
+    Tests that the model reload endpoint is hidden by default, and that when enabled it swaps in a
+    freshly loaded model while predictions keep working.
+    """
+    client = TestClient(app)  # Create a test client
+    assert client.post("/admin/reload_model").status_code == 404  # Assert that the endpoint is hidden
+    previous_model = main.model_registry.current
+    with patch('main.model_reload_endpoint_enabled', True):
+        # The model on disk is the one served, so nothing is reloaded unless forced
+        assert client.post("/admin/reload_model").json()["reloaded"] is False
+        response = client.post("/admin/reload_model", params={"force": True})
+    assert response.status_code == 200  # Assert that the response status code is 200 (OK)
+    assert response.json()["reloaded"] is True
+    assert main.model_registry.current is not previous_model  # Assert that a new model was swapped in
+    assert response.json()["model_version"] == previous_model['version']  # Assert that it is the same version
+    assert client.post("/predict_emotion", json={"text": "I am so happy"}).status_code == 200
+    # Assert that the load time exported is the one of the reloaded model
+    load_seconds = main.model_registry.load_seconds
+    assert f"harmoni_model_load_seconds {load_seconds!r}" in client.get("/metrics").text
+
+
+
+def test_top_k_returns_the_most_probable_emotions():
+    """
+    Tests that the single and batch endpoints return the top_k most probable emotions with their probability
+    when requested, consistent with the predicted emotion, and leave them out otherwise.
+    """
+    client = TestClient(app)  # Create a test client
+    num_classes = len(main.model_registry.current['class_labels'])
+    response = client.post("/predict_emotion", json={"text": "I am so happy", "top_k": 3}).json()
+    top_emotions = response["top_k"]
+    assert len(top_emotions) == min(3, num_classes)  # Assert that top_k emotions were returned
+    probabilities = [entry["probability"] for entry in top_emotions]
+    assert probabilities == sorted(probabilities, reverse=True)  # Assert that they are sorted by probability
+    # Assert that the most probable emotion is the predicted one
+    assert (top_emotions[0]["emotion"], top_emotions[0]["number"]) == (response["emotion"], response["number"])
+
+    # Asking for more emotions than the model has returns them all, with probabilities summing to 1
+    all_emotions = client.post("/predict_emotion", json={"text": "I am so happy", "top_k": 100}).json()["top_k"]
+    assert len(all_emotions) == num_classes  # Assert that every class was returned once
+    assert sum(entry["probability"] for entry in all_emotions) == pytest.approx(1.0, abs=1e-5)
+
+    batch_response = client.post("/predict_emotion_batch", json={"texts": ["I am so happy", "I am sad"], "top_k": 1})
+    assert all(len(result["top_k"]) == 1 for result in batch_response.json()["results"])
+    # Assert that the default response has no probabilities
+    assert "top_k" not in client.post("/predict_emotion", json={"text": "I am so happy"}).json()
+    # Assert that top_k must be positive
+    assert client.post("/predict_emotion", json={"text": "I am so happy", "top_k": 0}).status_code == 422
+
+
+def test_class_labels_come_from_the_label_encoder():
+    """
+    Tests that the emotions are named from the labels saved with the model rather than a fixed mapping.
+    """
+    from model_loader import get_class_labels  # Function naming the classes of a model
+
+    # Numeric labels are the emotion numbers of the dataset
+    assert get_class_labels({'labels': [0, 3]}) == [("sadness", 0), ("anger", 3)]
+    # Text labels keep their name, numbered like the dataset when it knows them and by class index otherwise
+    assert get_class_labels({'labels': ['boredom', 'joy']}) == [("boredom", 0), ("joy", 1)]
+
+
+def test_cascade_escalates_the_texts_the_cheap_model_is_unsure_about():
+    """
+    Tests that a cascade answers confident texts with its cheap model, escalates the others to the
+    expensive model, and reports its escalation rate on /metrics.
+    """
+    import numpy as np  # For comparing probabilities
+    from sklearn.linear_model import LogisticRegression  # The expensive stage of the test cascade
+    from sklearn.naive_bayes import ComplementNB  # The cheap stage of the test cascade
+
+    vectorizer = TfidfVectorizer()
+    features = vectorizer.fit_transform(["happy happy day", "sad night", "happy but sad", "sad sad day"])
+    labels = [1, 0, 1, 0]
+    cheap_model = {'model': ComplementNB().fit(features, labels), 'is_pytorch_model': False, 'labels': [0, 1]}
+    expensive_model = LogisticRegression().fit(features, labels)
+    cheap_probabilities = cheap_model['model'].predict_proba(features)
+    # Escalate the texts below the mean confidence of the cheap model
+    threshold = float(cheap_probabilities.max(axis=1).mean())
+    escalated = cheap_probabilities.max(axis=1) < threshold
+    assert 0 < escalated.sum() < len(labels)  # Assert that both stages answer texts
+    serving_model = {'model': expensive_model, 'is_pytorch_model': False, 'labels': [0, 1],
+                     'cascade': {'threshold': threshold, 'cheap_model': cheap_model}}
+
+    escalated_before = main.cascade_predictions_counter.value(stage='expensive')
+    probabilities = main.predict_feature_probabilities(features, serving_model)
+    # Assert that every text was answered by the stage it belongs to
+    assert np.allclose(probabilities[~escalated], cheap_probabilities[~escalated])
+    assert np.allclose(probabilities[escalated], expensive_model.predict_proba(features[escalated]))
+    # Assert that the escalations were counted and the rate is exposed
+    assert main.cascade_predictions_counter.value(stage='expensive') - escalated_before == escalated.sum()
+    assert "harmoni_cascade_escalation_rate" in TestClient(app).get("/metrics").text
+
+
+def test_model_pool_serves_the_chosen_model_and_shadows_the_primary_one(tmp_path):
+    """
+    Tests that with a pool of models, requests can choose their model, unknown models are rejected,
+    and the shadow models record their agreement with the primary model.
+    """
+    from sklearn.linear_model import LogisticRegression  # Models of the test pool
+    from sklearn.naive_bayes import ComplementNB
+
+    from model_pool import export_model_pool  # For exporting the test pool
+
+    vectorizer = TfidfVectorizer()
+    features = vectorizer.fit_transform(["happy happy day", "so sad today", "i love you", "angry at you"])
+    labels = [1, 0, 2, 3]
+    models = {"Logistic Regression": LogisticRegression(max_iter=200).fit(features, labels),
+              "Complement Naive Bayes": ComplementNB().fit(features, labels)}
+    export_model_pool(str(tmp_path / 'candidate_models'), models, "Logistic Regression", vectorizer,
+                      LabelEncoder().fit(labels))
+    with patch('main.serve_pool', True), patch('main.model_directory', str(tmp_path)), \
+            patch('main.shadow_model_names', ['complement_naive_bayes']):
+        pool_model = main.load_serving_model()
+    assert pool_model['pool']['logistic_regression']['featurizer'] is pool_model['featurizer']  # Shared featurizer
+
+    client = TestClient(app)  # Create a test client
+    with patch.object(main.model_registry, 'current', pool_model), patch('main.prediction_cache', None):
+        primary_response = client.post("/predict_emotion", json={"text": "a happy day"}).json()
+        chosen_response = client.post("/predict_emotion", json={"text": "a happy day",
+                                                                "model": "complement_naive_bayes"}).json()
+        unknown_response = client.post("/predict_emotion", json={"text": "a happy day", "model": "unknown"})
+        batch_response = client.post("/predict_emotion_batch", json={"texts": ["a happy day"],
+                                                                      "model": "logistic_regression"})
+        unknown_batch_response = client.post("/predict_emotion_batch", json={"texts": ["a happy day"],
+                                                                              "model": "unknown"})
+        # Wait for the shadow predictions queued so far
+        main.shadow_executor.submit(lambda: None).result()
+        pool_stats = client.get("/stats").json()["pool"]
+    assert primary_response["model"] == "logistic_regression"  # Assert that the primary model answers by default
+    assert chosen_response["model"] == "complement_naive_bayes"  # Assert that the chosen model answered
+    # Assert that every model of the pool reports the pool version followed by its name
+    assert primary_response["model_version"] == f"{pool_model['version']}/logistic_regression"
+    assert chosen_response["model_version"] == f"{pool_model['version']}/complement_naive_bayes"
+    assert unknown_response.status_code == 422  # Assert that unknown models are rejected
+    assert unknown_batch_response.status_code == 422
+    assert batch_response.json()["results"][0]["model"] == "logistic_regression"
+    # Assert that batches don't create the micro-batcher of their model, which they don't use
+    assert "logistic_regression" not in main.model_micro_batchers
+    assert pool_stats["primary"] == "logistic_regression"
+    # Assert that the shadow model predicted the text sent to the primary model
+    assert pool_stats["shadow"]["complement_naive_bayes"]["predictions"] >= 1
+    assert 0 <= pool_stats["shadow"]["complement_naive_bayes"]["agreement_rate"] <= 1
+
+
+def test_featurization_check_refuses_models_served_with_other_preprocessing(tmp_path):
+    """
+    Tests that in strict mode a model is only loaded when it is served with the featurization stamped into it.
+    """
+    from sklearn.naive_bayes import ComplementNB  # Model of the test artifact
+
+    from featurization_spec import load_featurization_spec, resolve_featurization_spec  # For stamping the spec
+    from model_artifact import export_artifact  # For exporting the test model
+
+    vectorizer = TfidfVectorizer(ngram_range=(1, 2))  # The n-grams of the default spec
+    features = vectorizer.fit_transform(["happy happy day", "so sad today"])
+    model = ComplementNB().fit(features, [1, 0])
+    stop_words = {'the', 'a'}
+    with patch('main.model_directory', str(tmp_path)), patch('main.featurization_check', 'strict'):
+        # Without a spec, the training preprocessing is unknown
+        export_artifact(str(tmp_path / 'best_emotion_model'), model, vectorizer, LabelEncoder().fit([1, 0]),
+                        preprocessing_stop_words=stop_words)
+        with pytest.raises(ValueError, match="featurization"):
+            main.load_serving_model()
+
+        spec = resolve_featurization_spec(load_featurization_spec(), stop_words)
+        export_artifact(str(tmp_path / 'best_emotion_model'), model, vectorizer, LabelEncoder().fit([1, 0]),
+                        preprocessing_stop_words=stop_words, featurization_spec=spec)
+        serving_model = main.load_serving_model()
+    assert serving_model['featurization_spec']['id'] == spec['id']  # Assert that the stamped spec was loaded
+    assert serving_model['text_preprocessor'].stop_words == stop_words
@@ -0,0 +1,319 @@
+"""
+Compact model artifact holding only what inference needs.
+
+An artifact is a directory with a `manifest.json` file and flat `.npy` arrays: the model weights,
+the vocabulary (one term per feature column), the idf vector, the labels and optionally the
+preprocessing stop words and lemma table of the training vocabulary. The manifest also records the
+featurization spec of the training (see featurization_spec). Everything loads with
+`np.load(allow_pickle=False)`, without sklearn, and torch is only imported for neural network artifacts.
+Hashed features (see `make_hashing_vectorizer`) store no vocabulary, only their number of columns,
+but need sklearn's MurmurHash3 to look up the terms.
+
+The arrays can also be memory-mapped read-only, so that every worker process of a deployment
+shares the same pages instead of holding its own copy: the vocabulary is then looked up in a
+sorted terms table instead of a dictionary, and the model weights are used in place.
+
+Supported models:
+    - "emotion_classifier": an EmotionClassifier, stored as its state dict.
+    - "linear": a model whose decision is argmax(X @ coef.T + intercept), i.e. LogisticRegression,
+      LinearSVC, MultinomialNB and ComplementNB.
+
+Usage to convert an existing bundle:
+    python model_artifact.py best_emotion_model.pth best_emotion_model
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import warnings
+
+import numpy as np
+
+from TfidfFeaturizer import HashedVocabulary, SortedVocabulary, TfidfFeaturizer
+
+# Version of the artifact layout, increased on incompatible changes
+artifact_format_version = 1
+
+
+class LinearModel:
+    """
+    Numpy implementation of the prediction of linear sklearn classifiers.
+    """
+
+    def __init__(self, coef, intercept, classes):
+        """
+        Args:
+            coef (np.ndarray): The (num_classes, num_features) weights, or (1, num_features) for binary models.
+            intercept (np.ndarray): The bias of every row of coef.
+            classes (np.ndarray): The class of every output.
+        """
+        self.coef = coef
+        self.intercept = intercept
+        self.classes = classes
+
+    def decision_function(self, features):
+        """
+        Returns the score of every class for each row of features.
+        """
+        return np.asarray(features @ self.coef.T) + self.intercept
+
+    def predict(self, features):
+        """
+        Returns the predicted class of each row of features.
+        """
+        scores = self.decision_function(features)
+        if scores.shape[1] == 1:
+            # Binary models have a single score, positive for the second class
+            return self.classes[(scores[:, 0] > 0).astype(int)]
+        return self.classes[scores.argmax(axis=1)]
+
+
+def replace_directory(temporary_path, path):
+    """
+    Replaces a directory with a fully written one. The previous directory is renamed aside before the new one is
+    renamed in, and only deleted after, so `path` is only missing between the two renames instead of while the
+    previous directory is deleted. This isn't atomic: a load in between can still find no directory.
+
+    Args:
+        temporary_path (str): The fully written directory.
+        path (str): The directory to replace, which may not exist yet.
+    """
+    previous_path = f'{path}.old'
+    shutil.rmtree(previous_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, previous_path)
+    os.replace(temporary_path, path)
+    shutil.rmtree(previous_path, ignore_errors=True)
+
+
+def export_artifact(path, model, tfidf_vectorizer, label_encoder, lemma_table=None, preprocessing_stop_words=None,
+                    featurization_spec=None):
+    """
+    Exports a trained model and its TF-IDF vectorizer as a compact artifact.
+
+    Args:
+        path (str): The directory to write. An existing artifact there is replaced.
+        model: The trained EmotionClassifier or linear sklearn classifier.
+        tfidf_vectorizer (TfidfVectorizer | Pipeline): The fitted vectorizer, or hashing pipeline returned by
+            `make_hashing_vectorizer`.
+        label_encoder (LabelEncoder): The fitted label encoder.
+        lemma_table (dict[str, str]): Optional precomputed lemmas of the training vocabulary.
+        preprocessing_stop_words (iterable[str]): Optional stop words removed by the training preprocessing.
+        featurization_spec (dict): Optional resolved featurization spec of the training.
+
+    Raises:
+        ValueError: If the model type or vectorizer options aren't supported.
+    """
+    # Check that the featurizer reproduces the vectorizer before writing anything
+    featurizer = TfidfFeaturizer.from_vectorizer(tfidf_vectorizer)
+
+    if hasattr(model, 'state_dict'):
+        model_type = 'emotion_classifier'
+        arrays = {f'model.{name}': value.detach().cpu().numpy() for name, value in model.state_dict().items()}
+        model_config = {'input_size': model.fc1.in_features, 'num_classes': model.fc3.out_features}
+        # Layout of fc1 used by EmotionClassifier.forward_sparse, stored so it can be shared too
+        arrays['inference.fc1_columns'] = arrays['model.fc1.weight'].T
+    elif hasattr(model, 'feature_log_prob_'):
+        # Naive Bayes joint log likelihood: X @ feature_log_prob_.T (+ class_log_prior_ for MultinomialNB)
+        model_type = 'linear'
+        uses_prior = type(model).__name__ != 'ComplementNB' or len(model.classes_) == 1
+        arrays = {
+            'model.coef': model.feature_log_prob_,
+            'model.intercept': model.class_log_prior_ if uses_prior else np.zeros(len(model.classes_)),
+            'model.classes': model.classes_,
+        }
+        model_config = {}
+    elif hasattr(model, 'coef_') and hasattr(model, 'intercept_'):
+        model_type = 'linear'
+        arrays = {'model.coef': model.coef_, 'model.intercept': np.atleast_1d(model.intercept_),
+                  'model.classes': model.classes_}
+        model_config = {}
+    else:
+        raise ValueError(f"Models of type {type(model).__name__} can't be exported as a compact artifact")
+
+    featurizer_config = {
+        'stop_words': sorted(featurizer.stop_words),
+        'ngram_range': list(featurizer.ngram_range),
+        'token_pattern': featurizer.token_pattern.pattern,
+        'lowercase': featurizer.lowercase,
+        'binary': featurizer.binary,
+        'sublinear_tf': featurizer.sublinear_tf,
+        'norm': featurizer.norm,
+        'dtype': np.dtype(featurizer.dtype).name,
+    }
+    if isinstance(featurizer.vocabulary, HashedVocabulary):
+        # Hashed features have no vocabulary to store, only their number of columns
+        featurizer_config['hashing'] = {'num_features': featurizer.num_features}
+    else:
+        vocabulary = sorted(featurizer.vocabulary.items(), key=lambda item: item[1])
+        arrays['featurizer.vocabulary'] = np.array([term for term, _ in vocabulary])
+        sorted_vocabulary = SortedVocabulary.from_terms([term for term, _ in vocabulary])
+        arrays['featurizer.sorted_terms'] = sorted_vocabulary.sorted_terms
+        arrays['featurizer.sorted_columns'] = sorted_vocabulary.columns
+    if featurizer.idf is not None:
+        arrays['featurizer.idf'] = featurizer.idf
+    if lemma_table:
+        arrays['preprocessing.lemma_words'] = np.array(list(lemma_table.keys()))
+        arrays['preprocessing.lemmas'] = np.array(list(lemma_table.values()))
+
+    manifest = {
+        'format_version': artifact_format_version,
+        'model_type': model_type,
+        'model_config': model_config,
+        'labels': np.asarray(label_encoder.classes_).tolist(),
+        'preprocessing': {
+            'stop_words': sorted(preprocessing_stop_words) if preprocessing_stop_words is not None else None,
+        },
+        'featurizer': featurizer_config,
+        'arrays': sorted(arrays),
+        **({'featurization_spec': featurization_spec} if featurization_spec is not None else {}),
+    }
+    # Artifacts exported from the same vectorizer share this version, so they can share their features
+    featurizer_hash = hashlib.sha256(json.dumps(manifest['featurizer'], sort_keys=True).encode())
+    for name in manifest['arrays']:
+        if name.startswith('featurizer.'):
+            featurizer_hash.update(name.encode())
+            featurizer_hash.update(np.ascontiguousarray(arrays[name]).tobytes())
+    manifest['featurizer_version'] = featurizer_hash.hexdigest()[:16]
+
+    # Write into a temporary directory first so a half-written artifact is never loaded
+    temporary_path = f'{path}.tmp'
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+    # The version is a hash of the whole content, so re-exporting the same model gives the same version
+    version_hash = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode())
+    for name in manifest['arrays']:
+        array = np.ascontiguousarray(arrays[name])
+        np.save(os.path.join(temporary_path, f'{name}.npy'), array, allow_pickle=False)
+        version_hash.update(name.encode())
+        version_hash.update(array.tobytes())
+    manifest['version'] = version_hash.hexdigest()[:16]
+    with open(os.path.join(temporary_path, 'manifest.json'), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+    replace_directory(temporary_path, path)
+
+
+def load_artifact(path, mmap=False):
+    """
+    Loads a compact artifact.
+
+    Args:
+        path (str): The artifact directory.
+        mmap (bool): Whether to memory-map the arrays read-only instead of reading them into memory.
+
+    Returns:
+        dict: The artifact, with keys:
+            - 'model': the EmotionClassifier (in evaluation mode) or LinearModel.
+            - 'is_pytorch_model': whether the model is a PyTorch module.
+            - 'featurizer': the TfidfFeaturizer reproducing the training vectorizer. Hashed features need sklearn
+              for its MurmurHash3.
+            - 'featurizer_version': the identifier of the featurizer, None for artifacts exported without it.
+            - 'labels': the label of every class.
+            - 'lemma_table': the precomputed lemmas, or None.
+            - 'stop_words': the stop words removed by the training preprocessing, or None.
+            - 'featurization_spec': the featurization spec of the training, or None.
+            - 'version': the content hash identifying the artifact.
+    """
+    with open(os.path.join(path, 'manifest.json')) as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest['format_version'] != artifact_format_version:
+        raise ValueError(f"Unsupported artifact format version {manifest['format_version']}")
+    arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r' if mmap else None, allow_pickle=False)
+              for name in manifest['arrays']}
+
+    if manifest['model_type'] == 'emotion_classifier':
+        # Only neural network artifacts need torch
+        import torch
+        from EmotionClassifier import EmotionClassifier
+
+        # Create the model without allocating weights, the loaded ones are assigned in place
+        with torch.device('meta'):
+            model = EmotionClassifier(manifest['model_config']['input_size'], manifest['model_config']['num_classes'])
+        with warnings.catch_warnings():
+            # Memory-mapped arrays are read-only, which torch warns about; inference never writes to them
+            warnings.filterwarnings('ignore', message='The given NumPy array is not writable')
+            model.load_state_dict({name[len('model.'):]: torch.from_numpy(array)
+                                   for name, array in arrays.items() if name.startswith('model.')}, assign=True)
+            if 'inference.fc1_columns' in arrays:
+                model.set_fc1_columns(torch.from_numpy(arrays['inference.fc1_columns']))
+        # Inference only: no gradients, and no dropout
+        model.requires_grad_(False)
+        model.eval()
+        is_pytorch_model = True
+    elif manifest['model_type'] == 'linear':
+        model = LinearModel(arrays['model.coef'], arrays['model.intercept'], arrays['model.classes'])
+        is_pytorch_model = False
+    else:
+        raise ValueError(f"Unsupported model type '{manifest['model_type']}'")
+
+    featurizer_config = manifest['featurizer']
+    if 'hashing' in featurizer_config:
+        vocabulary = HashedVocabulary(featurizer_config['hashing']['num_features'])
+    elif not mmap:
+        vocabulary = {term: column for column, term in enumerate(arrays['featurizer.vocabulary'].tolist())}
+    elif 'featurizer.sorted_terms' in arrays:
+        vocabulary = SortedVocabulary(arrays['featurizer.sorted_terms'], arrays['featurizer.sorted_columns'])
+    else:
+        # Artifacts exported before the sorted table existed
+        vocabulary = SortedVocabulary.from_terms(arrays['featurizer.vocabulary'].tolist())
+    featurizer = TfidfFeaturizer(
+        vocabulary,
+        idf=arrays.get('featurizer.idf'),
+        stop_words=featurizer_config['stop_words'],
+        ngram_range=tuple(featurizer_config['ngram_range']),
+        token_pattern=featurizer_config['token_pattern'],
+        lowercase=featurizer_config['lowercase'],
+        binary=featurizer_config['binary'],
+        sublinear_tf=featurizer_config['sublinear_tf'],
+        norm=featurizer_config['norm'],
+        dtype=np.dtype(featurizer_config['dtype']),
+    )
+
+    lemma_table = None
+    if 'preprocessing.lemma_words' in arrays:
+        lemma_table = dict(zip(arrays['preprocessing.lemma_words'].tolist(), arrays['preprocessing.lemmas'].tolist()))
+
+    return {
+        'model': model,
+        'is_pytorch_model': is_pytorch_model,
+        'featurizer': featurizer,
+        'featurizer_version': manifest.get('featurizer_version'),
+        'labels': manifest['labels'],
+        'lemma_table': lemma_table,
+        'stop_words': manifest['preprocessing']['stop_words'],
+        'featurization_spec': manifest.get('featurization_spec'),
+        'version': manifest['version'],
+    }
+
+
+def main():
+    """
+    Converts a `.joblib` or `.pth` model bundle saved by the training script into a compact artifact.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('bundle', help='the .joblib or .pth bundle to convert')
+    parser.add_argument('artifact', help='the artifact directory to write')
+    args = parser.parse_args()
+
+    if args.bundle.endswith('.pth'):
+        import torch
+        from EmotionClassifier import EmotionClassifier
+
+        bundle = torch.load(args.bundle, map_location=torch.device('cpu'), weights_only=False)
+        model = EmotionClassifier(bundle['input_size'], bundle['num_classes'])
+        model.load_state_dict(bundle['model_state_dict'])
+    else:
+        import joblib
+
+        bundle = joblib.load(args.bundle)
+        model = bundle['model']
+    export_artifact(args.artifact, model, bundle['tfidf_vectorizer'], bundle['label_encoder'],
+                    lemma_table=bundle.get('lemma_table'), preprocessing_stop_words=bundle.get('stop_words'),
+                    featurization_spec=bundle.get('featurization_spec'))
+    print(f"Exported {args.bundle} to {args.artifact}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import numpy as np  # For comparing predictions
+import pytest  # Python testing framework
+import torch  # PyTorch library for tensor computations and neural networks
+from sklearn.feature_extraction.text import TfidfVectorizer  # For converting text to numerical vectors
+from sklearn.linear_model import LogisticRegression  # Linear models exported as compact artifacts
+from sklearn.naive_bayes import ComplementNB, MultinomialNB
+from sklearn.preprocessing import LabelEncoder  # For encoding categorical labels
+from sklearn.svm import LinearSVC
+from sklearn.tree import DecisionTreeClassifier  # A model that can't be exported
+
+from EmotionClassifier import EmotionClassifier  # Import the emotion classifier model
+from model_artifact import export_artifact, load_artifact  # Import the compact artifact functions
+from TfidfFeaturizer import make_hashing_vectorizer  # For exporting hashed features
+
+
+@pytest.fixture
+def fitted_vectorizer(sample_texts):
+    """
+    Pytest fixture providing a TF-IDF vectorizer with n-grams and stop words fitted on the sample texts, and their
+    features.
+    """
+    vectorizer = TfidfVectorizer(ngram_range=(1, 2), stop_words=['the', 'and'])
+    features = vectorizer.fit_transform(sample_texts)
+    return vectorizer, features
+
+
+def test_emotion_classifier_round_trip(tmp_path, fitted_vectorizer, sample_texts, sample_labels):
+    """
+    Tests that an exported EmotionClassifier loads back with the same features and logits.
+    """
+    vectorizer, features = fitted_vectorizer
+    model = EmotionClassifier(features.shape[1], 6).eval()
+    label_encoder = LabelEncoder().fit(sample_labels)
+    export_artifact(str(tmp_path / 'artifact'), model, vectorizer, label_encoder,
+                    lemma_table={'feelings': 'feeling'}, preprocessing_stop_words=['i', 'so'])
+
+    artifact = load_artifact(str(tmp_path / 'artifact'))
+    loaded_features = artifact['featurizer'].transform([text.split() for text in sample_texts])
+    assert np.allclose(loaded_features.toarray(), features.toarray())
+    with torch.no_grad():
+        assert torch.equal(artifact['model'](torch.FloatTensor(features.toarray())),
+                           model(torch.FloatTensor(features.toarray())))
+    assert artifact['is_pytorch_model']
+    assert artifact['labels'] == [0, 1, 2, 3, 4, 5]
+    assert artifact['lemma_table'] == {'feelings': 'feeling'}
+    assert artifact['stop_words'] == ['i', 'so']
+
+
+def test_memory_mapped_round_trip(tmp_path, fitted_vectorizer, sample_texts, sample_labels):
+    """
+    Tests that a memory-mapped artifact gives the same features and logits, including on the sparse path.
+    """
+    vectorizer, features = fitted_vectorizer
+    model = EmotionClassifier(features.shape[1], 6).eval()
+    export_artifact(str(tmp_path / 'artifact'), model, vectorizer, LabelEncoder().fit(sample_labels))
+
+    artifact = load_artifact(str(tmp_path / 'artifact'), mmap=True)
+    loaded_features = artifact['featurizer'].transform([text.split() for text in sample_texts])
+    assert np.allclose(loaded_features.toarray(), features.toarray())
+    with torch.no_grad():
+        expected_logits = model(torch.FloatTensor(features.toarray()))
+        assert torch.allclose(artifact['model'].forward_sparse(loaded_features), expected_logits, atol=1e-6)
+    # Assert that the vocabulary is looked up in the memory-mapped file rather than a dictionary
+    assert isinstance(artifact['featurizer'].vocabulary.sorted_terms, np.memmap)
+
+
+@pytest.mark.parametrize("model", [LogisticRegression(max_iter=200), MultinomialNB(), ComplementNB(),
+                                   LinearSVC(random_state=42, dual=False)])
+def test_linear_model_round_trip(tmp_path, fitted_vectorizer, sample_labels, model):
+    """
+    Tests that exported linear sklearn models make the same predictions as the original ones.
+    """
+    vectorizer, features = fitted_vectorizer
+    model.fit(features, sample_labels)
+    export_artifact(str(tmp_path / 'artifact'), model, vectorizer, LabelEncoder().fit(sample_labels))
+
+    artifact = load_artifact(str(tmp_path / 'artifact'))
+    assert not artifact['is_pytorch_model']
+    assert np.array_equal(artifact['model'].predict(features), model.predict(features))
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_hashed_features_round_trip(tmp_path, sample_texts, sample_labels, mmap):
+    """
+    Tests that an artifact of hashed features stores no vocabulary and computes the same features and predictions.
+    """
+    vectorizer = make_hashing_vectorizer(128, ngram_range=(1, 2), stop_words=['the', 'and'])
+    features = vectorizer.fit_transform(sample_texts)
+    model = ComplementNB().fit(features, sample_labels)
+    export_artifact(str(tmp_path / 'artifact'), model, vectorizer, LabelEncoder().fit(sample_labels))
+
+    assert not list(tmp_path.glob('artifact/featurizer.*vocabulary*'))  # Assert that no terms were written
+    assert not list(tmp_path.glob('artifact/featurizer.sorted_*'))
+    artifact = load_artifact(str(tmp_path / 'artifact'), mmap=mmap)
+    loaded_features = artifact['featurizer'].transform([text.split() for text in sample_texts])
+    assert np.allclose(loaded_features.toarray(), features.toarray())
+    assert np.array_equal(artifact['model'].predict(loaded_features), model.predict(features))
+
+
+def test_unsupported_model_is_rejected(tmp_path, fitted_vectorizer, sample_labels):
+    """
+    Tests that exporting a model without a compact representation raises a ValueError and writes nothing.
+    """
+    vectorizer, features = fitted_vectorizer
+    model = DecisionTreeClassifier().fit(features, sample_labels)
+    with pytest.raises(ValueError):
+        export_artifact(str(tmp_path / 'artifact'), model, vectorizer, LabelEncoder().fit(sample_labels))
+    assert not (tmp_path / 'artifact').exists()
+
+
+def test_export_replaces_the_previous_artifact(tmp_path, fitted_vectorizer, sample_labels):
+    """
+    Tests that exporting over an existing artifact replaces it, leaving neither the previous nor the temporary one.
+    """
+    vectorizer, features = fitted_vectorizer
+    label_encoder = LabelEncoder().fit(sample_labels)
+    export_artifact(str(tmp_path / 'artifact'), MultinomialNB().fit(features, sample_labels), vectorizer, label_encoder)
+    model = LogisticRegression(max_iter=200).fit(features, sample_labels)
+    export_artifact(str(tmp_path / 'artifact'), model, vectorizer, label_encoder)
+
+    artifact = load_artifact(str(tmp_path / 'artifact'))
+    assert np.allclose(artifact['model'].coef, model.coef_)  # Assert that the new model was loaded
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['artifact']
@@ -0,0 +1,147 @@
+"""
+Cheap-first cascade of two emotion models sharing the same TF-IDF features.
+
+A cheap model (Complement Naive Bayes or a linear model) answers every text it is confident about,
+and only the texts whose top probability is below the threshold of the cascade are escalated to the
+expensive model (the EmotionClassifier network). The threshold is tuned by the training script on
+the test split, as the lowest one whose cascade accuracy reaches a target accuracy.
+
+A cascade is a directory holding the compact artifact of each stage and a `cascade.json` file:
+
+    best_emotion_cascade/
+        cascade.json
+        cheap/        the compact artifact of the cheap model
+        expensive/    the compact artifact of the expensive model
+
+Both artifacts are exported from the same vectorizer and label encoder, so the texts are featurized
+once and the probability columns of both stages are in the same class order.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+from model_artifact import export_artifact, load_artifact, replace_directory
+
+
+def escalated_rows(probabilities, threshold):
+    """
+    Returns which texts the cheap model isn't confident enough about and go on to the expensive model.
+
+    Args:
+        probabilities (np.ndarray): The (num_texts, num_classes) probabilities of the cheap model.
+        threshold (float): The lowest top probability answered by the cheap model, or None to escalate every text.
+
+    Returns:
+        np.ndarray: The boolean mask of the escalated texts.
+    """
+    if threshold is None:
+        return np.ones(len(probabilities), dtype=bool)
+    return probabilities.max(axis=1) < threshold
+
+
+def tune_threshold(cheap_probabilities, expensive_predictions, labels, target_accuracy):
+    """
+    Finds the lowest confidence threshold whose cascade accuracy reaches a target accuracy, so that
+    the cheap model answers as many texts as possible.
+
+    Args:
+        cheap_probabilities (np.ndarray): The (num_texts, num_classes) probabilities of the cheap model.
+        expensive_predictions (np.ndarray): The class numbers predicted by the expensive model.
+        labels (np.ndarray): The true class numbers.
+        target_accuracy (float): The accuracy the cascade must reach.
+
+    Returns:
+        dict: The 'threshold' (None to escalate every text), the cascade 'accuracy' and the 'escalation_rate'
+            on the given texts. Without a threshold reaching the target, the most accurate one is returned.
+    """
+    labels = np.asarray(labels)
+    confidences = cheap_probabilities.max(axis=1)
+    cheap_correct = cheap_probabilities.argmax(axis=1) == labels
+    expensive_correct = np.asarray(expensive_predictions) == labels
+
+    # Answer the k most confident texts with the cheap model and escalate the others, for every k
+    order = np.argsort(-confidences, kind='stable')
+    cheap_correct_answered = np.concatenate([[0], np.cumsum(cheap_correct[order])])
+    expensive_correct_escalated = expensive_correct.sum() - np.concatenate([[0], np.cumsum(expensive_correct[order])])
+    accuracies = (cheap_correct_answered + expensive_correct_escalated) / max(len(labels), 1)
+    # A threshold answers every text of the same confidence, so only k ending a run of equal confidences works
+    sorted_confidences = confidences[order]
+    valid = np.concatenate([[True], np.append(sorted_confidences[1:] < sorted_confidences[:-1], True)])
+
+    reaching = np.flatnonzero(valid & (accuracies >= target_accuracy))
+    answered = reaching[-1] if len(reaching) else np.flatnonzero(valid)[np.argmax(accuracies[valid])]
+    return {
+        'threshold': float(sorted_confidences[answered - 1]) if answered > 0 else None,
+        'accuracy': float(accuracies[answered]),
+        'escalation_rate': float(1 - answered / max(len(labels), 1)),
+    }
+
+
+def export_cascade(path, cheap_model, expensive_model, tfidf_vectorizer, label_encoder, tuning, model_names=None,
+                   lemma_table=None, preprocessing_stop_words=None, featurization_spec=None):
+    """
+    Exports the two stages of a cascade and their threshold.
+
+    Args:
+        path (str): The directory to write. An existing cascade there is replaced.
+        cheap_model: The trained linear sklearn classifier answering the confident texts.
+        expensive_model: The trained EmotionClassifier (or linear classifier) the other texts are escalated to.
+        tfidf_vectorizer (TfidfVectorizer): The fitted vectorizer both models were trained with.
+        label_encoder (LabelEncoder): The fitted label encoder.
+        tuning (dict): The tuning returned by `tune_threshold`, with the 'target_accuracy' it was tuned for.
+        model_names (dict): The names of the 'cheap' and 'expensive' models, recorded in `cascade.json`.
+        lemma_table (dict[str, str]): Optional precomputed lemmas of the training vocabulary.
+        preprocessing_stop_words (iterable[str]): Optional stop words removed by the training preprocessing.
+        featurization_spec (dict): Optional resolved featurization spec of the training.
+
+    Raises:
+        ValueError: If a model type or the vectorizer options aren't supported.
+    """
+    # Write into a temporary directory first so a half-written cascade is never loaded
+    temporary_path = f'{path}.tmp'
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+    versions = {}
+    for stage, model in (('cheap', cheap_model), ('expensive', expensive_model)):
+        export_artifact(os.path.join(temporary_path, stage), model, tfidf_vectorizer, label_encoder,
+                        lemma_table=lemma_table, preprocessing_stop_words=preprocessing_stop_words,
+                        featurization_spec=featurization_spec)
+        with open(os.path.join(temporary_path, stage, 'manifest.json')) as manifest_file:
+            versions[stage] = json.load(manifest_file)['version']
+
+    cascade = {
+        'threshold': tuning['threshold'],
+        'target_accuracy': tuning.get('target_accuracy'),
+        'accuracy': tuning['accuracy'],
+        'escalation_rate': tuning['escalation_rate'],
+        'models': model_names or {},
+        # The version changes with either stage or the threshold
+        'version': f"{versions['cheap'][:8]}{versions['expensive'][:8]}-{tuning['threshold']}",
+    }
+    with open(os.path.join(temporary_path, 'cascade.json'), 'w') as cascade_file:
+        json.dump(cascade, cascade_file, indent=2)
+
+    replace_directory(temporary_path, path)
+
+
+def load_cascade(path, mmap=False):
+    """
+    Loads a cascade.
+
+    Args:
+        path (str): The cascade directory.
+        mmap (bool): Whether to memory-map the arrays of the artifacts read-only.
+
+    Returns:
+        dict: The 'cheap' and 'expensive' artifacts returned by `load_artifact`, and the 'threshold', 'version'
+            and other settings of `cascade.json`.
+    """
+    with open(os.path.join(path, 'cascade.json')) as cascade_file:
+        cascade = json.load(cascade_file)
+    return {
+        **cascade,
+        'cheap': load_artifact(os.path.join(path, 'cheap'), mmap=mmap),
+        'expensive': load_artifact(os.path.join(path, 'expensive'), mmap=mmap),
+    }
@@ -0,0 +1,62 @@
+import numpy as np  # For building probabilities and comparing predictions
+
+from model_cascade import escalated_rows, export_cascade, load_cascade, tune_threshold  # Functions under test
+from model_loader import find_model_version, load_cascade_model  # Loading of a cascade by the API
+
+
+def test_escalated_rows():
+    """
+    Tests that the texts below the threshold are escalated, and every text without a threshold.
+    """
+    probabilities = np.array([[0.9, 0.1], [0.6, 0.4], [0.5, 0.5]])
+    assert escalated_rows(probabilities, 0.6).tolist() == [False, False, True]
+    assert escalated_rows(probabilities, None).tolist() == [True, True, True]
+
+
+def test_tune_threshold_answers_as_many_texts_as_the_target_allows():
+    """
+    Tests that the tuned threshold is the lowest one reaching the target accuracy.
+    """
+    true_labels = np.array([0, 1, 0, 1])
+    # The cheap model is right on its two most confident texts only, the expensive model is always right
+    cheap_probabilities = np.array([[0.95, 0.05], [0.1, 0.9], [0.4, 0.6], [0.7, 0.3]])
+    expensive_predictions = true_labels
+
+    tuning = tune_threshold(cheap_probabilities, expensive_predictions, true_labels, target_accuracy=1.0)
+    assert tuning['threshold'] == 0.9  # Assert that the two texts the cheap model gets right are answered by it
+    assert tuning['accuracy'] == 1.0
+    assert tuning['escalation_rate'] == 0.5
+    # Assert that a lower target lets the cheap model answer more texts
+    assert tune_threshold(cheap_probabilities, expensive_predictions, true_labels, 0.5)['escalation_rate'] == 0.0
+
+
+def test_tune_threshold_escalates_everything_when_the_cheap_model_never_helps():
+    """
+    Tests that every text is escalated when the cheap model only lowers the accuracy.
+    """
+    true_labels = np.array([0, 1])
+    tuning = tune_threshold(np.array([[0.2, 0.8], [0.9, 0.1]]), true_labels, true_labels, target_accuracy=1.0)
+    assert tuning['threshold'] is None  # Assert that no text is answered by the cheap model
+    assert tuning['escalation_rate'] == 1.0
+
+
+def test_cascade_round_trip(tmp_path, sample_features, trained_models):
+    """
+    Tests that an exported cascade loads back with both stages, its threshold and a version.
+    """
+    vectorizer, features, label_encoder = sample_features
+    cheap_model = trained_models["Complement Naive Bayes"]
+    expensive_model = trained_models["Logistic Regression"]
+    tuning = {'threshold': 0.3, 'accuracy': 0.9, 'escalation_rate': 0.25, 'target_accuracy': 0.9}
+    export_cascade(str(tmp_path / 'best_emotion_cascade'), cheap_model, expensive_model, vectorizer,
+                   label_encoder, tuning, model_names={'cheap': 'CNB', 'expensive': 'LR'})
+
+    cascade = load_cascade(str(tmp_path / 'best_emotion_cascade'))
+    assert cascade['threshold'] == 0.3  # Assert that the threshold was saved
+    assert cascade['models'] == {'cheap': 'CNB', 'expensive': 'LR'}
+    # Assert that the cheap stage predicts like the exported model
+    assert np.array_equal(cascade['cheap']['model'].predict(features), cheap_model.predict(features))
+
+    model_data = load_cascade_model(str(tmp_path), mmap=False)
+    assert model_data['cascade']['threshold'] == 0.3  # Assert that the API gets the threshold
+    assert model_data['version'] == find_model_version(str(tmp_path), cascade=True)  # Assert a consistent version
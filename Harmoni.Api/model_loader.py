@@ -0,0 +1,368 @@
+"""
+Loading of the trained emotion model and the batched preprocess, featurize and predict steps around it,
+shared by the API and the offline tools so they all score texts the same way.
+
+The best model of a directory is the compact artifact `best_emotion_model/` when it exists, else the
+`best_emotion_model.joblib` bundle, else the `best_emotion_model.pth` bundle saved by the training script.
+The training script also exports the cheap-first cascade `best_emotion_cascade/`, see model_cascade,
+and the pool of candidate models `candidate_models/`, see model_pool.
+"""
+import os
+
+import numpy as np
+
+from TextPreprocessor import TextPreprocessor
+from TfidfFeaturizer import TfidfFeaturizer
+from featurization_spec import load_featurization_spec, spec_stop_words
+from model_artifact import load_artifact
+
+# Label of every emotion number predicted by the model
+emotion_mapping = {
+    0: "sadness",
+    1: "joy",
+    2: "love",
+    3: "anger",
+    4: "fear",
+    5: "surprise",
+}
+
+
+def get_class_labels(model_data):
+    """
+    Names the output classes of a model from the labels saved with it by its label encoder.
+
+    Numeric labels (the emotion numbers of the training dataset) are named after `emotion_mapping`;
+    text labels keep their name and get their number from it, or their class index when it doesn't know them.
+
+    Args:
+        model_data (dict): The model returned by `load_model`.
+
+    Returns:
+        list[tuple[str, int]]: The emotion and the emotion number of every output class, in output order.
+    """
+    emotion_numbers = {emotion: number for number, emotion in emotion_mapping.items()}
+    class_labels = []
+    for class_index, label in enumerate(model_data['labels']):
+        if isinstance(label, (int, np.integer)) or str(label).isdigit():
+            class_labels.append((emotion_mapping.get(int(label), "unknown"), int(label)))
+        else:
+            class_labels.append((str(label), emotion_numbers.get(str(label), class_index)))
+    return class_labels
+
+
+def get_model_version(model_path):
+    """
+    Identifies the version of a model artifact from its file name, size and modification time,
+    so that retraining the model in place produces a new version.
+
+    Args:
+        model_path (str): The path of the model artifact.
+
+    Returns:
+        str: The model version.
+    """
+    model_stat = os.stat(model_path)
+    return f"{os.path.basename(model_path)}-{model_stat.st_size}-{model_stat.st_mtime_ns}"
+
+
+def find_model_version(model_directory, cascade=False, pool=False):
+    """
+    Returns the version of the model `load_model` (or `load_cascade_model`, or `load_pool_model`) would load
+    from a directory, without loading it, e.g. to detect that a new model was saved there.
+
+    Args:
+        model_directory (str): The directory containing the model.
+        cascade (bool): Whether to return the version of the cascade.
+        pool (bool): Whether to return the version of the pool of candidate models.
+
+    Returns:
+        str: The model version, or None if the directory contains no model.
+    """
+    import json
+
+    if cascade or pool:
+        description_path = (os.path.join(model_directory, 'best_emotion_cascade', 'cascade.json') if cascade
+                            else os.path.join(model_directory, 'candidate_models', 'pool.json'))
+        try:
+            with open(description_path) as description_file:
+                return json.load(description_file)['version']
+        except FileNotFoundError:
+            # The cascade or pool is being written
+            return None
+    artifact_path = os.path.join(model_directory, 'best_emotion_model')
+    if os.path.isdir(artifact_path):
+        try:
+            with open(os.path.join(artifact_path, 'manifest.json')) as manifest_file:
+                return json.load(manifest_file)['version']
+        except FileNotFoundError:
+            # The artifact is being written
+            return None
+    for file_name in ('best_emotion_model.joblib', 'best_emotion_model.pth'):
+        model_path = os.path.join(model_directory, file_name)
+        if os.path.exists(model_path):
+            return get_model_version(model_path)
+    return None
+
+
+def load_model(model_directory, mmap=True, compact=True):
+    """
+    Loads the best model of a directory, preferring the compact artifact over the pickled bundles.
+
+    Args:
+        model_directory (str): The directory containing the model.
+        mmap (bool): Whether to memory-map a compact artifact, so that all the processes of a host share its pages.
+        compact (bool): Whether to load the compact artifact. Without it, the bundle is loaded, e.g. to keep
+            training its model.
+
+    Returns:
+        dict: The model, with keys:
+            - 'model': the model, in evaluation mode for PyTorch models.
+            - 'is_pytorch_model': whether the model is a PyTorch module.
+            - 'featurizer': the TfidfFeaturizer of a compact artifact, or None.
+            - 'tfidf_vectorizer': the TfidfVectorizer of a bundle, or None.
+            - 'label_encoder': the LabelEncoder of a bundle, or None.
+            - 'labels': the label of every class.
+            - 'lemma_table': the precomputed lemmas of the training vocabulary, or None.
+            - 'stop_words': the stop words removed by the training preprocessing, or None.
+            - 'featurization_spec': the featurization spec of the training, or None for models saved without it.
+            - 'display_name': the name of the model in the training script, for bundles saved with it, or None.
+            - 'version': the identifier of the model.
+            - 'path': the path the model was loaded from.
+
+    Raises:
+        FileNotFoundError: If the directory contains no model.
+    """
+    model_path = os.path.join(model_directory, 'best_emotion_model')
+    if compact and os.path.isdir(model_path):
+        return artifact_model_data(load_artifact(model_path, mmap=mmap), model_path)
+
+    import joblib
+
+    try:
+        model_path = os.path.join(model_directory, 'best_emotion_model.joblib')
+        bundle = joblib.load(model_path)
+        ml_model = bundle['model']
+        is_pytorch_model = False
+    except FileNotFoundError:
+        import torch
+        import torch.nn as nn
+        # Import the EmotionClassifier class
+        from EmotionClassifier import EmotionClassifier
+
+        model_path = os.path.join(model_directory, 'best_emotion_model.pth')
+        bundle = torch.load(model_path, map_location=torch.device('cpu'),
+                            weights_only=False)
+        # Check if the loaded model is a simple nn.Sequential
+        if isinstance(bundle, nn.Sequential):
+            ml_model = bundle
+        else:
+            # If it's a custom model, extract parameters and create an instance
+            ml_model = EmotionClassifier(bundle['input_size'], bundle['num_classes'])
+            ml_model.load_state_dict(bundle['model_state_dict'])
+        # Switch to evaluation mode so dropout doesn't make predictions random
+        ml_model.eval()
+        is_pytorch_model = True
+
+    return {
+        'model': ml_model,
+        'is_pytorch_model': is_pytorch_model,
+        'featurizer': None,
+        'tfidf_vectorizer': bundle['tfidf_vectorizer'],
+        'label_encoder': bundle['label_encoder'],
+        'labels': list(bundle['label_encoder'].classes_),
+        'lemma_table': bundle.get('lemma_table'),
+        'stop_words': bundle.get('stop_words'),
+        'featurization_spec': bundle.get('featurization_spec'),
+        'display_name': bundle.get('model_name'),
+        'version': get_model_version(model_path),
+        'path': model_path,
+    }
+
+
+def load_cascade_model(model_directory, mmap=True):
+    """
+    Loads the cheap-first cascade of a directory.
+
+    Args:
+        model_directory (str): The directory containing the cascade.
+        mmap (bool): Whether to memory-map the artifacts of the cascade.
+
+    Returns:
+        dict: The expensive model of the cascade, with the keys of `load_model`, and its 'cascade': a dict with
+            the 'threshold' below which texts are escalated to it and the 'cheap_model' in the format of
+            `load_model`. The 'version' and 'path' are those of the cascade.
+
+    Raises:
+        FileNotFoundError: If the directory contains no cascade.
+    """
+    from model_cascade import load_cascade
+
+    cascade_path = os.path.join(model_directory, 'best_emotion_cascade')
+    cascade = load_cascade(cascade_path, mmap=mmap)
+    cheap_model, expensive_model = [artifact_model_data(cascade[stage], os.path.join(cascade_path, stage))
+                                    for stage in ('cheap', 'expensive')]
+    return {
+        **expensive_model,
+        'cascade': {'threshold': cascade['threshold'], 'cheap_model': cheap_model, 'models': cascade['models']},
+        'version': cascade['version'],
+        'path': cascade_path,
+    }
+
+
+def load_pool_model(model_directory, mmap=True, primary=None):
+    """
+    Loads the pool of candidate models of a directory.
+
+    Args:
+        model_directory (str): The directory containing the pool.
+        mmap (bool): Whether to memory-map the artifacts of the pool.
+        primary (str): The name of the model served by default. Defaults to the primary model of the pool.
+
+    Returns:
+        dict: The primary model, with the keys of `load_model`, its pool 'model_name', and the 'pool': a dict of
+            every model of the pool by name, including the primary one, in the format of `load_model` with their
+            'model_name' and 'display_name'. The 'version' and 'path' are those of the pool.
+
+    Raises:
+        FileNotFoundError: If the directory contains no pool.
+        ValueError: If the primary model isn't in the pool, or its models don't share the same featurizer.
+    """
+    from model_pool import load_model_pool
+
+    pool_path = os.path.join(model_directory, 'candidate_models')
+    pool = load_model_pool(pool_path, mmap=mmap)
+    primary = primary or pool['primary']
+    if primary not in pool['artifacts']:
+        raise ValueError(f"Model '{primary}' isn't in the pool, expected one of {', '.join(pool['artifacts'])}")
+    models = {name: {**artifact_model_data(artifact, os.path.join(pool_path, name)), 'model_name': name,
+                     'display_name': pool['names'][name]}
+              for name, artifact in pool['artifacts'].items()}
+    return {**models[primary], 'pool': models, 'version': pool['version'], 'path': pool_path}
+
+
+def artifact_model_data(artifact, path):
+    """
+    Returns a compact artifact returned by `load_artifact` in the format of `load_model`.
+    """
+    return {
+        'model': artifact['model'],
+        'is_pytorch_model': artifact['is_pytorch_model'],
+        'featurizer': artifact['featurizer'],
+        'tfidf_vectorizer': None,
+        'label_encoder': None,
+        'labels': artifact['labels'],
+        'lemma_table': artifact['lemma_table'],
+        'stop_words': artifact['stop_words'],
+        'featurization_spec': artifact['featurization_spec'],
+        'display_name': None,
+        'version': artifact['version'],
+        'path': path,
+    }
+
+
+def create_text_preprocessor(model_data, **kwargs):
+    """
+    Creates the preprocessing pipeline of a model, with the stop words and lemmas of its training
+    vocabulary if they were saved with it. Models saved without their stop words get those of their
+    featurization spec, or of the spec shipped with the code, rather than every NLTK stop word.
+
+    Args:
+        model_data (dict): The model returned by `load_model`.
+        **kwargs: Other arguments of TextPreprocessor.from_nltk.
+
+    Returns:
+        TextPreprocessor: The preprocessor.
+    """
+    stop_words = model_data['stop_words']
+    if stop_words is None:
+        stop_words = spec_stop_words(model_data.get('featurization_spec') or load_featurization_spec())
+    return TextPreprocessor.from_nltk(stop_words=stop_words, lemma_table=model_data['lemma_table'], **kwargs)
+
+
+def create_featurizer(model_data, fused=True):
+    """
+    Returns the featurizer going from preprocessed tokens to TF-IDF features in one pass, without
+    joining and re-tokenizing them. Compact artifacts come with theirs; for bundles it is created
+    from the vectorizer, unless it uses options the featurizer doesn't reproduce.
+
+    Args:
+        model_data (dict): The model returned by `load_model`.
+        fused (bool): Whether to create a featurizer for bundles.
+
+    Returns:
+        TfidfFeaturizer: The featurizer, or None to use the vectorizer.
+    """
+    if model_data['featurizer'] is not None:
+        return model_data['featurizer']
+    if not fused:
+        return None
+    try:
+        return TfidfFeaturizer.from_vectorizer(model_data['tfidf_vectorizer'])
+    except ValueError:
+        return None
+
+
+def featurize(model_data, featurizer, token_lists):
+    """
+    Computes the TF-IDF features of preprocessed texts.
+
+    Args:
+        model_data (dict): The model returned by `load_model`.
+        featurizer (TfidfFeaturizer): The featurizer returned by `create_featurizer`, or None.
+        token_lists (list[list[str]]): The tokens of every preprocessed text.
+
+    Returns:
+        scipy.sparse.csr_matrix: The TF-IDF features, one row per text.
+    """
+    if featurizer is not None:
+        return featurizer.transform(token_lists)
+    return model_data['tfidf_vectorizer'].transform([' '.join(tokens) for tokens in token_lists])
+
+
+def softmax(scores):
+    """
+    Turns the scores of every row into probabilities summing to 1.
+    """
+    scores = scores - scores.max(axis=1, keepdims=True)
+    exponentials = np.exp(scores)
+    return exponentials / exponentials.sum(axis=1, keepdims=True)
+
+
+def predict_probabilities(model_data, features):
+    """
+    Predicts the probability of every class for TF-IDF features.
+
+    PyTorch models give the softmax of their logits and sklearn models with `predict_proba` their
+    probabilities. Models that only have decision scores (linear SVMs, compact linear artifacts)
+    give the softmax of their scores, which ranks the classes like the model but isn't calibrated.
+
+    Args:
+        model_data (dict): The model returned by `load_model`.
+        features (scipy.sparse.csr_matrix): The TF-IDF features, one row per text.
+
+    Returns:
+        np.ndarray: The (num_texts, num_classes) probabilities, columns in the order of `model_data['labels']`.
+    """
+    ml_model = model_data['model']
+    if model_data['is_pytorch_model']:
+        import torch
+        from EmotionClassifier import EmotionClassifier
+
+        with torch.no_grad():
+            if isinstance(ml_model, EmotionClassifier):
+                logits = ml_model.forward_sparse(features)
+            else:
+                logits = ml_model(torch.FloatTensor(features.toarray()))
+        return torch.softmax(logits, dim=1).numpy()
+    if hasattr(ml_model, 'predict_proba'):
+        return np.asarray(ml_model.predict_proba(features))
+    if hasattr(ml_model, 'decision_function'):
+        scores = np.asarray(ml_model.decision_function(features), dtype=np.float64)
+        if scores.ndim == 1 or scores.shape[1] == 1:
+            # Binary models have a single score, positive for the second class
+            scores = scores.reshape(-1, 1)
+            scores = np.hstack([np.zeros_like(scores), scores])
+        return softmax(scores)
+    # Models without scores get all the probability on their predicted class, the model predicting class numbers
+    predictions = np.asarray(ml_model.predict(features))
+    return (predictions[:, None] == np.arange(len(model_data['labels']))[None, :]).astype(np.float64)
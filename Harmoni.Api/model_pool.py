@@ -0,0 +1,179 @@
+"""
+Pool of candidate emotion models sharing one TF-IDF featurizer, to A/B test and shadow-run them.
+
+The training script exports every candidate it can export as a compact artifact, all from the same
+fitted vectorizer and label encoder, so a text is featurized once and its features can be fed to any
+model of the pool, whose probability columns are all in the same class order.
+
+A pool is a directory holding the compact artifact of every model and a `pool.json` file:
+
+    candidate_models/
+        pool.json
+        logistic_regression/
+        artificial_neural_network/
+        ...
+
+`pool.json` records the 'primary' model (the best one exported), the display name of every model,
+and a 'version' changing with any of them. A model updated after the training (see incremental_update)
+replaces its artifact in the pool with `update_model_pool` and becomes its primary model.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+
+from model_artifact import export_artifact, load_artifact, replace_directory
+
+
+def model_slug(model_name):
+    """
+    Returns the name of a model in a pool, e.g. 'complement_naive_bayes' for 'Complement Naive Bayes'.
+    """
+    return re.sub(r'[^a-z0-9]+', '_', model_name.lower()).strip('_')
+
+
+def pool_version(path, models, primary):
+    """
+    Computes the version of a pool from the versions of its artifacts and its primary model.
+
+    Args:
+        path (str): The directory holding the artifacts.
+        models (iterable[str]): The pool names of the models, in the order of `pool.json`.
+        primary (str): The pool name of the primary model.
+
+    Returns:
+        str: The version.
+    """
+    version_hash = hashlib.sha256()
+    for slug in models:
+        with open(os.path.join(path, slug, 'manifest.json')) as manifest_file:
+            version_hash.update(f"{slug}={json.load(manifest_file)['version']};".encode())
+    version_hash.update(primary.encode())
+    return version_hash.hexdigest()[:16]
+
+
+def export_model_pool(path, models, primary, tfidf_vectorizer, label_encoder, lemma_table=None,
+                      preprocessing_stop_words=None, featurization_spec=None):
+    """
+    Exports the models that can be exported as compact artifacts into a pool.
+
+    Args:
+        path (str): The directory to write. An existing pool there is replaced.
+        models (dict[str, object]): The trained models by display name, best first.
+        primary (str): The display name of the model served by default. If it can't be exported,
+            the first model exported is the primary model.
+        tfidf_vectorizer (TfidfVectorizer): The fitted vectorizer all the models were trained with.
+        label_encoder (LabelEncoder): The fitted label encoder.
+        lemma_table (dict[str, str]): Optional precomputed lemmas of the training vocabulary.
+        preprocessing_stop_words (iterable[str]): Optional stop words removed by the training preprocessing.
+        featurization_spec (dict): Optional resolved featurization spec of the training.
+
+    Returns:
+        dict: The 'primary' model, the 'models' exported by pool name and the 'skipped' models with the reason.
+
+    Raises:
+        ValueError: If no model can be exported.
+    """
+    # Write into a temporary directory first so a half-written pool is never loaded
+    temporary_path = f'{path}.tmp'
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+    exported = {}
+    skipped = {}
+    for model_name, model in models.items():
+        slug = model_slug(model_name)
+        try:
+            export_artifact(os.path.join(temporary_path, slug), model, tfidf_vectorizer, label_encoder,
+                            lemma_table=lemma_table, preprocessing_stop_words=preprocessing_stop_words,
+                            featurization_spec=featurization_spec)
+        except ValueError as error:
+            skipped[model_name] = str(error)
+            continue
+        exported[slug] = model_name
+    if not exported:
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        raise ValueError(f"None of the models can be exported: {skipped}")
+
+    primary_slug = model_slug(primary) if model_slug(primary) in exported else next(iter(exported))
+    pool = {'primary': primary_slug, 'models': exported,
+            'version': pool_version(temporary_path, exported, primary_slug)}
+    with open(os.path.join(temporary_path, 'pool.json'), 'w') as pool_file:
+        json.dump(pool, pool_file, indent=2)
+
+    replace_directory(temporary_path, path)
+    return {**pool, 'skipped': skipped}
+
+
+def update_model_pool(path, model_name, model, tfidf_vectorizer, label_encoder, lemma_table=None,
+                      preprocessing_stop_words=None, featurization_spec=None, output_path=None):
+    """
+    Replaces a model of a pool with an updated version of it, or adds it, and makes it the primary model.
+    The other models of the pool are kept as they are.
+
+    Args:
+        path (str): The pool directory.
+        model_name (str): The display name of the model.
+        model: The updated model.
+        tfidf_vectorizer (TfidfVectorizer): The fitted vectorizer of the pool, which the model was updated with.
+        label_encoder (LabelEncoder): The fitted label encoder.
+        lemma_table (dict[str, str]): Optional precomputed lemmas of the training vocabulary.
+        preprocessing_stop_words (iterable[str]): Optional stop words removed by the training preprocessing.
+        featurization_spec (dict): Optional resolved featurization spec of the training.
+        output_path (str): The directory to write the updated pool to. Defaults to `path`, replaced by
+            `replace_directory`.
+
+    Returns:
+        dict: The 'primary' model, the 'models' of the pool by pool name and its new 'version'.
+
+    Raises:
+        ValueError: If the model can't be exported.
+    """
+    output_path = output_path or path
+    with open(os.path.join(path, 'pool.json')) as pool_file:
+        pool = json.load(pool_file)
+    # Write into a temporary directory first so a half-written pool is never loaded
+    temporary_path = f'{output_path}.tmp'
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    shutil.copytree(path, temporary_path)
+    slug = model_slug(model_name)
+    try:
+        export_artifact(os.path.join(temporary_path, slug), model, tfidf_vectorizer, label_encoder,
+                        lemma_table=lemma_table, preprocessing_stop_words=preprocessing_stop_words,
+                        featurization_spec=featurization_spec)
+    except ValueError:
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        raise
+    # The primary model comes first, like the best model of the training
+    models = {slug: model_name, **{name: display_name for name, display_name in pool['models'].items()
+                                   if name != slug}}
+    pool = {'primary': slug, 'models': models, 'version': pool_version(temporary_path, models, slug)}
+    with open(os.path.join(temporary_path, 'pool.json'), 'w') as pool_file:
+        json.dump(pool, pool_file, indent=2)
+
+    replace_directory(temporary_path, output_path)
+    return pool
+
+
+def load_model_pool(path, mmap=False):
+    """
+    Loads a pool and checks that all its models share the same featurizer.
+
+    Args:
+        path (str): The pool directory.
+        mmap (bool): Whether to memory-map the arrays of the artifacts read-only.
+
+    Returns:
+        dict: The 'primary' model name, the 'artifacts' returned by `load_artifact` and the display 'names'
+            of the models by pool name, and the 'version' of the pool.
+
+    Raises:
+        ValueError: If the models don't share the same featurizer.
+    """
+    with open(os.path.join(path, 'pool.json')) as pool_file:
+        pool = json.load(pool_file)
+    artifacts = {slug: load_artifact(os.path.join(path, slug), mmap=mmap) for slug in pool['models']}
+    featurizer_versions = {artifact['featurizer_version'] for artifact in artifacts.values()}
+    if len(featurizer_versions) != 1 or None in featurizer_versions:
+        raise ValueError(f"The models of the pool {path} weren't exported with the same vectorizer")
+    return {'primary': pool['primary'], 'artifacts': artifacts, 'names': pool['models'], 'version': pool['version']}
@@ -0,0 +1,92 @@
+import json  # For editing the description of a pool
+
+import numpy as np  # For comparing predictions
+import pytest  # Python testing framework
+from sklearn.feature_extraction.text import TfidfVectorizer  # For a vectorizer other than the pool's
+from sklearn.naive_bayes import ComplementNB  # Model updated in or added to the pool
+
+from model_artifact import export_artifact  # For adding a model exported from another vectorizer
+from model_loader import find_model_version, load_pool_model  # Loading of a pool by the API
+from model_pool import export_model_pool, load_model_pool, model_slug, update_model_pool  # Functions under test
+
+
+@pytest.fixture
+def exported_pool(tmp_path, sample_features, trained_models):
+    """
+    Pytest fixture exporting a pool of the models trained on the sample texts, the Decision Tree as the primary one,
+    and returning its directory, the pool exported, the models and their features.
+    """
+    vectorizer, features, label_encoder = sample_features
+    pool = export_model_pool(str(tmp_path / 'candidate_models'), trained_models, "Decision Tree", vectorizer,
+                             label_encoder)
+    return tmp_path, pool, trained_models, features
+
+
+def test_model_slug():
+    """
+    Tests that display names become lowercase names without spaces.
+    """
+    assert model_slug("Complement Naive Bayes") == "complement_naive_bayes"
+    assert model_slug("Linear SVM") == "linear_svm"
+
+
+def test_pool_round_trip(exported_pool):
+    """
+    Tests that the exportable models of a pool load back, the primary one falling back to the best exported.
+    """
+    tmp_path, pool, models, features = exported_pool
+    assert list(pool['models']) == ['logistic_regression', 'complement_naive_bayes']  # The tree can't be exported
+    assert "Decision Tree" in pool['skipped']
+    assert pool['primary'] == 'logistic_regression'  # Assert that the best exported model is the primary one
+
+    loaded_pool = load_model_pool(str(tmp_path / 'candidate_models'))
+    # Assert that every model predicts like the exported one
+    for name, artifact in loaded_pool['artifacts'].items():
+        assert np.array_equal(artifact['model'].predict(features), models[loaded_pool['names'][name]].predict(features))
+
+    model_data = load_pool_model(str(tmp_path), mmap=False, primary='complement_naive_bayes')
+    assert model_data['model_name'] == 'complement_naive_bayes'  # Assert that the primary model can be chosen
+    assert set(model_data['pool']) == {'logistic_regression', 'complement_naive_bayes'}
+    assert model_data['version'] == find_model_version(str(tmp_path), pool=True)  # Assert a consistent version
+    with pytest.raises(ValueError):
+        load_pool_model(str(tmp_path), primary='decision_tree')
+
+
+def test_updated_model_replaces_its_artifact_and_becomes_primary(exported_pool, sample_features, sample_labels):
+    """
+    Tests that updating a model of a pool replaces its artifact, makes it the primary model and changes the
+    pool version, while the other models are kept.
+    """
+    tmp_path, pool, models, features = exported_pool
+    vectorizer, _, label_encoder = sample_features
+    pool_path = str(tmp_path / 'candidate_models')
+    updated_model = ComplementNB(alpha=0.1).fit(features, sample_labels)
+
+    updated_pool = update_model_pool(pool_path, "Complement Naive Bayes", updated_model, vectorizer, label_encoder)
+
+    assert updated_pool['primary'] == 'complement_naive_bayes'
+    assert list(updated_pool['models']) == ['complement_naive_bayes', 'logistic_regression']
+    assert updated_pool['version'] != pool['version']  # Assert that the API sees a new version of the pool
+    loaded_pool = load_model_pool(pool_path)
+    assert loaded_pool['primary'] == 'complement_naive_bayes'
+    # Assert that the artifact holds the updated weights
+    assert np.allclose(loaded_pool['artifacts']['complement_naive_bayes']['model'].coef,
+                       updated_model.feature_log_prob_)
+    assert np.array_equal(loaded_pool['artifacts']['logistic_regression']['model'].predict(features),
+                          models["Logistic Regression"].predict(features))
+
+
+def test_pool_rejects_models_with_another_featurizer(exported_pool, sample_texts, sample_labels, sample_features):
+    """
+    Tests that a pool whose models don't share the same vectorizer isn't loaded.
+    """
+    tmp_path, _, _, _ = exported_pool
+    other_vectorizer = TfidfVectorizer(ngram_range=(1, 2))
+    other_model = ComplementNB().fit(other_vectorizer.fit_transform(sample_texts), sample_labels)
+    export_artifact(str(tmp_path / 'candidate_models' / 'other'), other_model, other_vectorizer, sample_features[2])
+    pool_path = tmp_path / 'candidate_models' / 'pool.json'
+    pool = json.loads(pool_path.read_text())
+    pool['models']['other'] = "Other"
+    pool_path.write_text(json.dumps(pool))
+    with pytest.raises(ValueError, match="same vectorizer"):
+        load_model_pool(str(tmp_path / 'candidate_models'))
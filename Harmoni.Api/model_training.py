@@ -0,0 +1,247 @@
+"""
+Training and evaluation of the candidate models of the training script.
+
+The sklearn candidates are fitted concurrently in a pool of worker processes while the neural
+network trains in the current process, with early stopping on a validation split of the training
+data. Every candidate is scored once on the test set; its predictions and class scores are reused
+for the ROC curves, the confusion matrices and the choice of the best model.
+"""
+import copy
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def compute_scores(model, features, classes):
+    """
+    Computes the score of every class of a fitted sklearn model, as used for the ROC curves.
+
+    Args:
+        model: The fitted sklearn model.
+        features (scipy.sparse matrix): The features, one row per sample.
+        classes (np.ndarray): The class numbers.
+
+    Returns:
+        np.ndarray: The (num_samples, num_classes) probabilities or decision scores.
+    """
+    from sklearn.preprocessing import label_binarize
+
+    if hasattr(model, 'predict_proba'):
+        return model.predict_proba(features)
+    if hasattr(model, 'decision_function'):
+        scores = model.decision_function(features)
+        if len(scores.shape) == 1:
+            scores = np.vstack([-scores, scores]).T
+        return scores
+    # Models without scores get a score of 1 for their predicted class
+    return label_binarize(model.predict(features), classes=classes)
+
+
+def fit_candidate(model, train_features, train_labels, test_features, classes):
+    """
+    Fits an sklearn model and scores it on the test set, timing both steps.
+
+    Returns:
+        dict: The fitted 'model', its test 'predictions' and class 'scores', 'fit_seconds' and 'score_seconds'.
+    """
+    fit_start_time = time.perf_counter()
+    model.fit(train_features, train_labels)
+    score_start_time = time.perf_counter()
+    predictions = model.predict(test_features)
+    scores = compute_scores(model, test_features, classes)
+    return {
+        'model': model,
+        'predictions': predictions,
+        'scores': scores,
+        'fit_seconds': score_start_time - fit_start_time,
+        'score_seconds': time.perf_counter() - score_start_time,
+    }
+
+
+def with_single_job(model):
+    """
+    Returns an unfitted copy of an sklearn model running a single job, for fitting it in a worker process
+    of a pool that already has one worker per CPU.
+    """
+    from sklearn.base import clone
+
+    model = clone(model)
+    model.set_params(**{key: 1 for key in model.get_params() if key == 'n_jobs' or key.endswith('__n_jobs')})
+    return model
+
+
+def evaluate_network(model, dataset, device, batch_size=256):
+    """
+    Computes the mean loss and the class probabilities of a network on a SparseFeatureDataset.
+
+    Returns:
+        tuple: The mean cross-entropy loss and the (num_samples, num_classes) probabilities.
+    """
+    import torch
+    from torch.utils.data import DataLoader
+
+    model.eval()
+    total_loss = 0.0
+    all_probabilities = []
+    with torch.no_grad():
+        for batch_inputs, batch_labels in DataLoader(dataset, batch_size=batch_size, collate_fn=dataset.collate):
+            batch_inputs, batch_labels = batch_inputs.to(device), batch_labels.to(device)
+            model_outputs = model(batch_inputs)
+            total_loss += torch.nn.functional.cross_entropy(model_outputs, batch_labels, reduction='sum').item()
+            all_probabilities.append(torch.softmax(model_outputs, dim=1).cpu().numpy())
+    return total_loss / len(dataset), np.concatenate(all_probabilities)
+
+
+def train_network(model, training_dataset, validation_dataset, device, max_epochs=50, patience=3, batch_size=32,
+                  learning_rate=0.001, checkpoint_path=None, report=print):
+    """
+    Trains a network with Adam until its validation loss stops improving, and restores its best weights.
+
+    Args:
+        model (torch.nn.Module): The network, on `device`.
+        training_dataset (SparseFeatureDataset): The training samples.
+        validation_dataset (SparseFeatureDataset): The samples the early stopping is based on.
+        device (torch.device): The device the network runs on.
+        max_epochs (int): The maximum number of epochs.
+        patience (int): The number of epochs without improvement of the validation loss before stopping.
+        batch_size (int): The number of samples per training batch.
+        learning_rate (float): The learning rate of Adam, lower to fine-tune an already trained network.
+        checkpoint_path (str): The file the best weights are saved to after every improvement, or None.
+        report (callable): Function receiving the progress messages.
+
+    Returns:
+        dict: The 'epochs' trained, the 'best_epoch' and its 'best_validation_loss'.
+    """
+    import torch
+    from torch.utils.data import DataLoader
+
+    loss_criterion = torch.nn.CrossEntropyLoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate)
+    training_dataloader = DataLoader(training_dataset, batch_size=batch_size, shuffle=True,
+                                     collate_fn=training_dataset.collate)
+    best_validation_loss = float('inf')
+    best_state = None
+    best_epoch = 0
+    epoch = 0
+    validation_loss = float('inf')
+    for epoch in range(1, max_epochs + 1):
+        model.train()
+        running_loss = 0.0
+        for batch_inputs, batch_labels in training_dataloader:
+            batch_inputs, batch_labels = batch_inputs.to(device), batch_labels.to(device)
+            optimizer.zero_grad()
+            loss = loss_criterion(model(batch_inputs), batch_labels)
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.item()
+
+        validation_loss, _ = evaluate_network(model, validation_dataset, device)
+        report(f'Epoch {epoch}, Loss: {running_loss / len(training_dataloader):.4f}, '
+               f'Validation loss: {validation_loss:.4f}')
+        if validation_loss < best_validation_loss:
+            best_validation_loss = validation_loss
+            best_state = copy.deepcopy(model.state_dict())
+            best_epoch = epoch
+            if checkpoint_path is not None:
+                torch.save({'epoch': epoch, 'model_state_dict': best_state,
+                            'optimizer_state_dict': optimizer.state_dict(),
+                            'validation_loss': validation_loss}, checkpoint_path)
+        elif epoch - best_epoch >= patience:
+            report(f'Early stopping: no improvement since epoch {best_epoch}')
+            break
+
+    if best_state is not None:
+        model.load_state_dict(best_state)
+    else:
+        # No epoch improved on the starting loss (no epochs, or a NaN validation loss): keep the current weights
+        best_epoch, best_validation_loss = epoch, validation_loss
+    model.eval()
+    return {'epochs': epoch, 'best_epoch': best_epoch, 'best_validation_loss': best_validation_loss}
+
+
+def train_candidates(models, train_features, train_labels, test_features, classes, device, workers=None,
+                     validation_size=0.1, network_options=None, report=print):
+    """
+    Trains every candidate model and scores it once on the test set.
+
+    The sklearn models are fitted in a pool of worker processes, with a single job each (n_jobs=1), while
+    the PyTorch networks train in the current process on all but `validation_size` of the training samples.
+
+    Args:
+        models (dict[str, object]): The unfitted sklearn models and PyTorch networks (on `device`), by name.
+        train_features (scipy.sparse matrix): The training features.
+        train_labels (np.ndarray): The training class numbers.
+        test_features (scipy.sparse matrix): The test features.
+        classes (np.ndarray): The class numbers.
+        device (torch.device): The device the networks run on.
+        workers (int): The number of worker processes, 0 to fit the sklearn models in the current process
+            after the networks. Defaults to the CPU count.
+        validation_size (float): The share of the training samples held out for the early stopping.
+        network_options (dict): Other arguments of `train_network`.
+        report (callable): Function receiving the progress messages.
+
+    Returns:
+        dict[str, dict]: The results of every model, in the order of `models`, each with the fitted 'model',
+            its test 'predictions' and class 'scores', and its 'fit_seconds', 'score_seconds' and 'total_seconds'.
+            Networks also have the 'epochs', 'best_epoch' and 'best_validation_loss' of their training.
+    """
+    import torch
+    from sklearn.model_selection import train_test_split
+
+    from SparseFeatureDataset import SparseFeatureDataset
+
+    train_labels = np.asarray(train_labels)
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    networks = {name: model for name, model in models.items() if isinstance(model, torch.nn.Module)}
+    sklearn_models = {name: model for name, model in models.items() if name not in networks}
+    results = {}
+    pool = None
+    futures = {}
+    if workers > 0 and sklearn_models:
+        pool = ProcessPoolExecutor(min(workers, len(sklearn_models)), mp_context=multiprocessing.get_context('spawn'))
+        # The pool already runs a model per CPU, models parallelizing their own fit would oversubscribe them
+        futures = {name: pool.submit(fit_candidate, with_single_job(model), train_features, train_labels,
+                                     test_features, classes)
+                   for name, model in sklearn_models.items()}
+    try:
+        if networks:
+            fit_indices, validation_indices = train_test_split(np.arange(len(train_labels)),
+                                                               test_size=validation_size, random_state=42,
+                                                               stratify=train_labels)
+            training_dataset = SparseFeatureDataset(train_features[fit_indices], train_labels[fit_indices])
+            validation_dataset = SparseFeatureDataset(train_features[validation_indices],
+                                                      train_labels[validation_indices])
+            test_dataset = SparseFeatureDataset(test_features, np.zeros(test_features.shape[0], dtype=np.int64))
+        for name, network in networks.items():
+            report(f"Training {name}...")
+            fit_start_time = time.perf_counter()
+            training_summary = train_network(network, training_dataset, validation_dataset, device, report=report,
+                                             **(network_options or {}))
+            score_start_time = time.perf_counter()
+            _, scores = evaluate_network(network, test_dataset, device)
+            results[name] = {
+                'model': network,
+                'predictions': scores.argmax(axis=1),
+                'scores': scores,
+                'fit_seconds': score_start_time - fit_start_time,
+                'score_seconds': time.perf_counter() - score_start_time,
+                **training_summary,
+            }
+
+        for name, model in sklearn_models.items():
+            if pool is None:
+                report(f"Training {name}...")
+                results[name] = fit_candidate(model, train_features, train_labels, test_features, classes)
+            else:
+                results[name] = futures[name].result()
+                report(f"Trained {name} in a worker process")
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    for result in results.values():
+        result['total_seconds'] = result['fit_seconds'] + result['score_seconds']
+    return {name: results[name] for name in models}
@@ -0,0 +1,125 @@
+import numpy as np  # For building the test inputs
+import torch  # PyTorch library for tensor computations and neural networks
+from scipy import sparse  # For building sparse TF-IDF-like inputs
+from sklearn.linear_model import LogisticRegression  # Candidate with probabilities
+from sklearn.svm import LinearSVC  # Candidate with decision scores only
+
+import model_training  # Module under test
+from EmotionClassifier import EmotionClassifier  # Network candidate
+from SparseFeatureDataset import SparseFeatureDataset  # Training and validation samples of the network
+
+classes = np.arange(3)
+
+
+def make_features(num_samples, seed):
+    """
+    Builds sparse features whose first three columns tell the class apart, and their labels.
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.arange(num_samples) % 3
+    features = rng.random((num_samples, 20)) * (rng.random((num_samples, 20)) < 0.2)
+    features[np.arange(num_samples), labels] += 1.0
+    return sparse.csr_matrix(features), labels
+
+
+def test_candidates_are_trained_and_scored_once(tmp_path):
+    """
+    Tests that every candidate, sklearn model or network, is trained and scored on the test set,
+    that the results keep the order of the candidates, and that the network checkpoints its best weights.
+    """
+    train_features, train_labels = make_features(90, 0)
+    test_features, test_labels = make_features(30, 1)
+    torch.manual_seed(0)
+    models = {
+        "Logistic Regression": LogisticRegression(),
+        "Network": EmotionClassifier(20, 3),
+        "Linear SVM": LinearSVC(dual=False),
+    }
+    checkpoint_path = str(tmp_path / 'checkpoint.pth')
+
+    results = model_training.train_candidates(models, train_features, train_labels, test_features, classes,
+                                              torch.device('cpu'), workers=0,
+                                              network_options={'max_epochs': 30, 'checkpoint_path': checkpoint_path},
+                                              report=lambda message: None)
+
+    assert list(results) == list(models)
+    for result in results.values():
+        assert result['predictions'].shape == (30,)
+        assert result['scores'].shape == (30, 3)
+        assert result['total_seconds'] == result['fit_seconds'] + result['score_seconds']
+        # The classes are easy to tell apart
+        assert (result['predictions'] == test_labels).mean() > 0.9
+    # The network's scores are probabilities, the SVM's are its decision scores
+    assert np.allclose(results["Network"]['scores'].sum(axis=1), 1.0, atol=1e-5)
+    assert np.allclose(results["Linear SVM"]['scores'], results["Linear SVM"]['model'].decision_function(test_features))
+    checkpoint = torch.load(checkpoint_path)
+    assert checkpoint['epoch'] == results["Network"]['best_epoch']
+
+
+def test_network_stops_early_and_restores_its_best_weights():
+    """
+    Tests that the training stops once the validation loss stops improving, and that the network
+    ends up with the weights of its best epoch.
+    """
+    train_features, train_labels = make_features(60, 0)
+    # Validation labels unrelated to the features, so the validation loss soon gets worse
+    validation_features, _ = make_features(30, 1)
+    validation_labels = np.random.default_rng(2).integers(0, 3, 30)
+    torch.manual_seed(0)
+    network = EmotionClassifier(20, 3)
+    datasets = [SparseFeatureDataset(train_features, train_labels),
+                SparseFeatureDataset(validation_features, validation_labels)]
+
+    summary = model_training.train_network(network, *datasets, torch.device('cpu'), max_epochs=100, patience=2,
+                                           report=lambda message: None)
+    validation_loss, _ = model_training.evaluate_network(network, datasets[1], torch.device('cpu'))
+
+    assert summary['epochs'] < 100
+    assert summary['epochs'] - summary['best_epoch'] == 2
+    assert np.isclose(validation_loss, summary['best_validation_loss'])
+
+
+def test_network_without_improvement_keeps_its_weights():
+    """
+    Tests that a training without any epoch keeps the current weights of the network instead of failing.
+    """
+    train_features, train_labels = make_features(30, 0)
+    torch.manual_seed(0)
+    network = EmotionClassifier(20, 3)
+    weights = {name: value.clone() for name, value in network.state_dict().items()}
+    dataset = SparseFeatureDataset(train_features, train_labels)
+
+    summary = model_training.train_network(network, dataset, dataset, torch.device('cpu'), max_epochs=0,
+                                           report=lambda message: None)
+
+    assert summary['epochs'] == summary['best_epoch'] == 0
+    assert all(torch.equal(value, weights[name]) for name, value in network.state_dict().items())
+
+
+def test_sklearn_candidates_are_fitted_in_worker_processes():
+    """
+    Tests that the sklearn models fitted in a process pool give the same predictions as fitted in the current process.
+    """
+    train_features, train_labels = make_features(90, 0)
+    test_features, _ = make_features(30, 1)
+    models = {"Logistic Regression": LogisticRegression()}
+
+    pooled = model_training.train_candidates(models, train_features, train_labels, test_features, classes,
+                                             torch.device('cpu'), workers=1, report=lambda message: None)
+    inline = model_training.fit_candidate(LogisticRegression(), train_features, train_labels, test_features, classes)
+
+    assert np.array_equal(pooled["Logistic Regression"]['predictions'], inline['predictions'])
+    assert np.allclose(pooled["Logistic Regression"]['scores'], inline['scores'])
+
+
+def test_models_fitted_in_the_pool_run_a_single_job():
+    """
+    Tests that the sklearn models get n_jobs=1 in the worker processes, without modifying the models passed.
+    """
+    model = LogisticRegression(n_jobs=-1)
+    single_job_model = model_training.with_single_job(model)
+
+    assert single_job_model.n_jobs == 1  # Assert that the copy doesn't start its own parallel jobs
+    assert model.n_jobs == -1
+    assert single_job_model.get_params()['C'] == model.C  # Assert that the other parameters are kept
+    assert model_training.with_single_job(LinearSVC()).get_params() == LinearSVC().get_params()
@@ -0,0 +1,137 @@
+"""
+Parallel preprocessing of the training dataset, cached on disk.
+
+The texts are preprocessed in chunks by a pool of worker processes, each with its own WordNet
+lemmatizer, and the processed texts and lemma table are saved in a cache directory. The cache key
+is a hash of the dataset file and of the preprocessing configuration (stop words, token pattern,
+lemmatizer and NLTK version), so retraining on unchanged data skips the whole pass, and any change
+to the data or the preprocessing computes it again.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from TextPreprocessor import BackgroundLemmatizer, TextPreprocessor
+
+# Version of the cached content, increased when the preprocessing changes in a way the key doesn't capture
+cache_format_version = 1
+
+# Preprocessor of the current worker process, set by initialize_worker
+worker_state = {}
+
+
+def preprocessing_cache_key(data_path, stop_words):
+    """
+    Computes the cache key of the preprocessing of a dataset file.
+
+    Args:
+        data_path (str): The dataset file.
+        stop_words (iterable[str]): The stop words removed by the preprocessing.
+
+    Returns:
+        str: The hexadecimal key.
+    """
+    import nltk
+
+    key_hash = hashlib.sha256()
+    with open(data_path, 'rb') as data_file:
+        for block in iter(lambda: data_file.read(1 << 20), b''):
+            key_hash.update(block)
+    config = {
+        'format_version': cache_format_version,
+        'stop_words': sorted(stop_words),
+        'non_letter_pattern': TextPreprocessor.non_letter_pattern.pattern,
+        'lemmatizer': 'wordnet',
+        'nltk_version': nltk.__version__,
+    }
+    key_hash.update(json.dumps(config, sort_keys=True).encode())
+    return key_hash.hexdigest()
+
+
+def initialize_worker(stop_words):
+    """
+    Creates the preprocessor of a worker process, with WordNet loaded.
+    """
+    worker_state['text_preprocessor'] = TextPreprocessor(stop_words, BackgroundLemmatizer.create_lemmatizer().lemmatize)
+
+
+def preprocess_chunk(texts):
+    """
+    Preprocesses a chunk of texts with the preprocessor of the current process.
+
+    Returns:
+        tuple: The processed texts and the lemma of every word of the chunk.
+    """
+    text_preprocessor = worker_state['text_preprocessor']
+    # The lemmas are memoized by the preprocessing, so the table costs no extra WordNet lookup
+    return text_preprocessor.preprocess_batch(texts), text_preprocessor.build_lemma_table(texts)
+
+
+def preprocess_parallel(texts, stop_words, workers=None, chunk_size=5000):
+    """
+    Preprocesses texts in chunks across worker processes.
+
+    Args:
+        texts (iterable[str]): The texts to preprocess.
+        stop_words (iterable[str]): The stop words to remove.
+        workers (int): The number of worker processes, 0 to preprocess in the current process.
+            Defaults to the CPU count.
+        chunk_size (int): The number of texts sent to a worker at once.
+
+    Returns:
+        tuple: The processed texts, in the same order, and the lemma table of their words.
+    """
+    texts = list(texts)
+    stop_words = set(stop_words)
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+    if workers == 0:
+        initialize_worker(stop_words)
+        results = map(preprocess_chunk, chunks)
+        processed_texts, lemma_table = _merge_chunks(results)
+    else:
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=initialize_worker, initargs=(stop_words,)) as pool:
+            processed_texts, lemma_table = _merge_chunks(pool.map(preprocess_chunk, chunks))
+    return processed_texts, lemma_table
+
+
+def _merge_chunks(results):
+    processed_texts = []
+    lemma_table = {}
+    for chunk_texts, chunk_lemma_table in results:
+        processed_texts.extend(chunk_texts)
+        lemma_table.update(chunk_lemma_table)
+    return processed_texts, dict(sorted(lemma_table.items()))
+
+
+def load_or_preprocess(data_path, texts, stop_words, cache_directory, workers=None, chunk_size=5000):
+    """
+    Returns the preprocessing of a dataset from the cache, or computes it in parallel and caches it.
+
+    Args:
+        data_path (str): The dataset file the texts were read from, hashed into the cache key.
+        texts (iterable[str]): The texts of the dataset, in order.
+        stop_words (iterable[str]): The stop words to remove.
+        cache_directory (str): The directory holding the cached preprocessings.
+        workers (int): The number of worker processes. Defaults to the CPU count.
+        chunk_size (int): The number of texts sent to a worker at once.
+
+    Returns:
+        dict: The 'processed_text' list, the 'lemma_table' and whether they came from the cache ('cached').
+    """
+    import joblib
+
+    cache_path = os.path.join(cache_directory, f'{preprocessing_cache_key(data_path, stop_words)}.joblib')
+    if os.path.exists(cache_path):
+        cached = joblib.load(cache_path)
+        return {**cached, 'cached': True}
+
+    processed_texts, lemma_table = preprocess_parallel(texts, stop_words, workers, chunk_size)
+    os.makedirs(cache_directory, exist_ok=True)
+    # Write next to the final path and rename, so an interrupted run never leaves a partial cache entry
+    joblib.dump({'processed_text': processed_texts, 'lemma_table': lemma_table}, f'{cache_path}.tmp')
+    os.replace(f'{cache_path}.tmp', cache_path)
+    return {'processed_text': processed_texts, 'lemma_table': lemma_table, 'cached': False}
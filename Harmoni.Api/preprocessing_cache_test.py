@@ -0,0 +1,53 @@
+from unittest.mock import patch  # To check that the cache skips the preprocessing
+
+import pytest  # Testing framework
+
+import preprocessing_cache  # Module under test
+from TextPreprocessor import BackgroundLemmatizer, TextPreprocessor  # Reference preprocessing
+
+texts = ["I am feeling so HAPPY today!!", "The cats were running away", "", "not bad at all, 10/10"] * 3
+stop_words = {'i', 'am', 'so', 'the', 'were', 'at', 'all'}
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    """
+    Pytest fixture writing a dataset file, whose content is hashed into the cache key.
+    """
+    path = tmp_path / 'emotions.csv'
+    path.write_text('text,label\n' + '\n'.join(f'"{text}",0' for text in texts))
+    return str(path)
+
+
+def test_parallel_preprocessing_matches_sequential():
+    """
+    Tests that preprocessing in chunks across worker processes gives the same texts, in order,
+    and the same lemma table as preprocessing sequentially.
+    """
+    text_preprocessor = TextPreprocessor(stop_words, BackgroundLemmatizer.create_lemmatizer().lemmatize)
+    processed_texts, lemma_table = preprocessing_cache.preprocess_parallel(texts, stop_words, workers=2, chunk_size=5)
+
+    assert processed_texts == text_preprocessor.preprocess_batch(texts)
+    assert lemma_table == text_preprocessor.build_lemma_table(texts)
+
+
+def test_unchanged_data_is_loaded_from_cache(tmp_path, data_path):
+    """
+    Tests that a second run on the same data and configuration skips the preprocessing,
+    and that changing the stop words or the data invalidates the cache.
+    """
+    cache_directory = str(tmp_path / 'cache')
+    first = preprocessing_cache.load_or_preprocess(data_path, texts, stop_words, cache_directory, workers=0)
+    # Fail the test if the preprocessing runs again
+    with patch('preprocessing_cache.preprocess_parallel', side_effect=AssertionError("cache miss")):
+        second = preprocessing_cache.load_or_preprocess(data_path, texts, stop_words, cache_directory, workers=0)
+
+    assert (first['cached'], second['cached']) == (False, True)
+    assert second['processed_text'] == first['processed_text']
+    assert second['lemma_table'] == first['lemma_table']
+    # The key depends on the stop words and on the content of the data file
+    key = preprocessing_cache.preprocessing_cache_key(data_path, stop_words)
+    assert preprocessing_cache.preprocessing_cache_key(data_path, stop_words - {'so'}) != key
+    with open(data_path, 'a') as data_file:
+        data_file.write('\n"one more text",1')
+    assert preprocessing_cache.preprocessing_cache_key(data_path, stop_words) != key
@@ -0,0 +1,67 @@
+"""
+Structured, non-blocking logging of the API.
+
+Records are formatted as one JSON object per line, with the fields passed through `extra` next to
+the message. The handler attached to the logger only puts records on a queue; a background thread
+formats and writes them, so a slow stdout never blocks a request.
+
+Usage:
+    listener = configure_logging('harmoni', level='INFO')
+    logging.getLogger('harmoni.predictions').info('prediction', extra={'emotion': 'joy'})
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+# Attributes every LogRecord has, which aren't fields passed through `extra`
+standard_record_attributes = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a single line JSON object.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in standard_record_attributes})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(logger_name, level='INFO', stream=None):
+    """
+    Sends the records of a logger (and its children) as JSON lines to a stream, through a queue
+    emptied by a background thread.
+
+    Args:
+        logger_name (str): The logger to configure.
+        level (str): The minimum level of the records written.
+        stream: The stream written to. Defaults to stderr.
+
+    Returns:
+        logging.handlers.QueueListener: The started listener, to `stop()` to flush the queue on shutdown.
+    """
+    stream_handler = logging.StreamHandler(stream or sys.stderr)
+    stream_handler.setFormatter(JsonFormatter())
+    record_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(record_queue, stream_handler, respect_handler_level=True)
+
+    logger = logging.getLogger(logger_name)
+    logger.setLevel(level)
+    # Replace the queue handler of a previous configuration
+    for handler in list(logger.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(record_queue))
+    logger.propagate = False
+    listener.start()
+    return listener
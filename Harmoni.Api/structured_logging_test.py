@@ -0,0 +1,24 @@
+import io  # In-memory stream the records are written to
+import json  # To parse the written records
+import logging  # To log the records
+
+from structured_logging import configure_logging  # Function under test
+
+
+def test_records_are_written_as_json_lines():
+    """
+    Tests that records are written as one JSON object per line, including the extra fields,
+    once the queue is flushed.
+    """
+    stream = io.StringIO()
+    listener = configure_logging('harmoni_test', level='INFO', stream=stream)
+    logging.getLogger('harmoni_test.predictions').info('prediction', extra={'emotion': 'joy', 'number': 1})
+    logging.getLogger('harmoni_test').debug('not written')  # Below the configured level
+    listener.stop()  # Flush the queue
+
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 1
+    entry = json.loads(lines[0])
+    assert entry['message'] == 'prediction'
+    assert entry['logger'] == 'harmoni_test.predictions'
+    assert (entry['emotion'], entry['number']) == ('joy', 1)